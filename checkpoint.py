@@ -0,0 +1,245 @@
+import json
+import queue
+import threading
+import numpy as np
+
+import electron
+import grid as topologies
+from measurements import MeasurementSeries
+from observables import ObservableRecorder
+from trajectory import atomic_savez
+
+CHECKPOINT_FORMAT = 'ising-checkpoint'
+CHECKPOINT_VERSION = 1
+
+
+def _json_scalar(value):
+    # numpy scalars (e.g. a seed or hole center taken from an array) in the header
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} can't be stored in a checkpoint header")
+
+
+def write_checkpoint(path, header, arrays):
+    """
+    Writes a checkpoint: one compressed .npz file holding the JSON header (format, version, model parameters) and the
+    arrays. The write is atomic (see trajectory.atomic_savez), so a crash during the write leaves the previous
+    checkpoint intact.
+    """
+    header = dict(header, format=CHECKPOINT_FORMAT, version=CHECKPOINT_VERSION)
+    atomic_savez(path, dict(header=np.array(json.dumps(header, default=_json_scalar)), **arrays), compressed=True)
+
+
+def read_checkpoint(path):
+    """
+    Reads a checkpoint written by write_checkpoint.
+
+    Returns
+        header (dict), arrays (dict of np.array)
+    """
+    with np.load(path) as data:
+        arrays = {name: data[name] for name in data.files}
+
+    header = json.loads(str(arrays.pop('header')))
+    if header.get('format') != CHECKPOINT_FORMAT:
+        raise ValueError(f"{path} is not a checkpoint")
+    if header['version'] > CHECKPOINT_VERSION:
+        raise ValueError(f"{path} was written by a newer version (checkpoint version {header['version']})")
+    return header, arrays
+
+
+def grid_checkpoint(grid):
+    """
+    Header entries and arrays that rebuild a grid: its class, size, point class and the topology specific parameters
+    (the hole of a HoleGrid, the seam of a Mobius strip, the adjacency of a GraphGrid), plus the spins and the mask.
+    """
+    header = {
+        'topology': type(grid).__name__,
+        'n_x': grid.n_x,
+        'n_y': grid.n_y,
+        'gridPointObject': grid.gridPointObject.__name__,
+        'random_init': grid.random_init,
+        'random_seed': grid.random_seed,
+        'record_history': grid.record_history,
+    }
+    arrays = {'spins': np.array(grid.grid)}
+    if grid.mask is not None:
+        arrays['mask'] = grid.mask.copy()
+
+    if isinstance(grid, topologies.HoleGrid):
+        header.update(c_x=grid.c_x, c_y=grid.c_y, has_hole_grid=grid.hole_grid is not None)
+        if grid.hole_grid is not None:
+            arrays['hole_grid'] = np.array(grid.hole_grid)
+    elif isinstance(grid, topologies.Mobius):
+        header['seam_sign'] = grid.seam_sign
+    elif isinstance(grid, topologies.GraphGrid):
+        arrays.update(indptr=grid.indptr, indices=grid.indices, couplings=grid.couplings)
+
+    return header, arrays
+
+
+def build_grid(header, arrays, rng):
+    """
+    Rebuilds the grid stored by grid_checkpoint, with the stored spins and the given random stream (assigned after
+    the grid is built, so building it doesn't draw from the stream).
+    """
+    topology = getattr(topologies, header['topology'])
+    point = getattr(electron, header['gridPointObject'])
+    kwargs = {'random_seed': header['random_seed'], 'record_history': header['record_history']}
+
+    if topology is topologies.GraphGrid:
+        grid = topology(arrays['indptr'], arrays['indices'], point, signs=arrays['couplings'], shape=(header['n_x'], header['n_y']),
+                        mask=arrays.get('mask'), **kwargs)
+    elif topology is topologies.HoleGrid:
+        grid = topology(header['n_x'], header['n_y'], point, hole_grid=arrays['hole_grid'] if header['has_hole_grid'] else None,
+                        c_x=header['c_x'], c_y=header['c_y'], **kwargs)
+    elif topology is topologies.Mobius:
+        grid = topology(header['n_x'], header['n_y'], point, seam_sign=header['seam_sign'], **kwargs)
+    else:
+        grid = topology(header['n_x'], header['n_y'], point, **kwargs)
+
+    stored_mask = arrays.get('mask')
+    if (grid.mask is None) != (stored_mask is None) or (stored_mask is not None and not np.array_equal(grid.mask, stored_mask)):
+        raise ValueError("The rebuilt grid's mask does not match the checkpoint")
+
+    grid.random_init = header['random_init']
+    grid.rng = rng
+    grid.grid = arrays['spins']
+    if grid.record_history:
+        grid.grid_history = grid.newHistory()
+    return grid
+
+
+def measurement_checkpoint(measurement, prefix='measurement'):
+    """Header entries and arrays of a MeasurementSeries."""
+    header = {
+        'temperature': measurement.temperature,
+        'n_sites': measurement.n_sites,
+        'magnetic_moment': measurement.magnetic_moment,
+        'Boltzmann': measurement.Boltzmann,
+        'converged': measurement.converged,
+    }
+    arrays = {f'{prefix}_energies': measurement.energies.copy(), f'{prefix}_magnetizations': measurement.magnetizations.copy()}
+    return header, arrays
+
+
+def build_measurement(header, arrays, prefix='measurement'):
+    """Rebuilds the MeasurementSeries stored by measurement_checkpoint."""
+    energies, magnetizations = arrays[f'{prefix}_energies'], arrays[f'{prefix}_magnetizations']
+    measurement = MeasurementSeries(header['temperature'], header['n_sites'], header['magnetic_moment'], header['Boltzmann'],
+                                    capacity=max(1, len(energies)))
+    for energy, magnetization in zip(energies.tolist(), magnetizations.tolist()):
+        measurement.add(energy, magnetization)
+    measurement.converged = header['converged']
+    return measurement
+
+
+def recorder_checkpoint(recorder, prefix):
+    """
+    Header entries and arrays of an ObservableRecorder. Observables given as method names are stored as such, those
+    given as callables only by their name and have to be passed again on restore.
+    """
+    header = {
+        'observables': {name: observable if isinstance(observable, str) else None for name, observable in recorder.observables.items()},
+        'stride': recorder.stride,
+        'calls': recorder.calls,
+    }
+    arrays = {f'{prefix}_times': recorder.times.copy()}
+    for name in recorder.observables:
+        arrays[f'{prefix}_values_{name}'] = recorder[name].copy()
+    return header, arrays
+
+
+def build_recorder(header, arrays, prefix, callables=None):
+    """
+    Rebuilds the ObservableRecorder stored by recorder_checkpoint. callables (name -> callable) supplies the
+    observables that were callables.
+    """
+    observables = {}
+    for name, observable in header['observables'].items():
+        if observable is None:
+            if callables is None or name not in callables:
+                raise ValueError(f"Observable '{name}' was a callable, pass it again through observables to restore it")
+            observable = callables[name]
+        observables[name] = observable
+
+    times = arrays[f'{prefix}_times']
+    recorder = ObservableRecorder(observables, header['stride'], capacity=max(1, len(times)))
+    recorder.calls = header['calls']
+    recorder.n_values = len(times)
+    recorder.time_values[:len(times)] = times
+    if len(times):
+        recorder.values = {name: np.resize(arrays[f'{prefix}_values_{name}'], recorder.capacity) for name in observables}
+    return recorder
+
+
+class Checkpointer:
+    """
+    Writes periodic checkpoints of a model on a background thread. The model calls step after every sweep (or time
+    step); every interval-th call takes a snapshot of the model state (copies of the spins or state vector, the random
+    stream state and the observables, see checkpointData of the models) on the simulation thread, which keeps the
+    snapshot consistent, and hands it to the writer thread, which compresses and writes it. If the writer is still
+    busy with an older snapshot, the older one is replaced by the newer, so the simulation never waits for the disk.
+
+    Parameters
+        model (ClassicIsing or TransverseIsing): model to checkpoint
+        path (str): checkpoint file, overwritten by every checkpoint
+        interval (int): number of sweeps (or steps) between checkpoints
+        snapshot_kwargs (dict): arguments of model.checkpointData
+    """
+
+    def __init__(self, model, path, interval=1000, snapshot_kwargs=None):
+
+        self.model = model
+        self.path = path
+        self.interval = interval
+        self.snapshot_kwargs = {} if snapshot_kwargs is None else snapshot_kwargs
+
+        self.calls = 0
+        self.written = 0
+        self.error = None
+
+        self.pending = queue.Queue(maxsize=1)
+        self.thread = threading.Thread(target=self.work, daemon=True)
+        self.thread.start()
+
+    ### class methods ###
+
+    def step(self):
+        """Called by the model after every sweep or step, takes a snapshot every interval calls."""
+        self.calls += 1
+        if self.calls % self.interval == 0:
+            self.submit(self.model.checkpointData(**self.snapshot_kwargs))
+
+    def submit(self, snapshot):
+        """Queues a snapshot for writing, replacing one that is still waiting."""
+        try:
+            self.pending.get_nowait()
+        except queue.Empty:
+            pass
+        self.pending.put(snapshot)
+
+    def work(self):
+        """Writer thread: writes queued snapshots until close queues None."""
+        while True:
+            snapshot = self.pending.get()
+            if snapshot is None:
+                return
+            try:
+                write_checkpoint(self.path, *snapshot)
+                self.written += 1
+            except Exception as error:
+                self.error = error
+
+    def close(self, final=True):
+        """
+        Stops the writer thread after the queued snapshot is written, with final also writing a last checkpoint
+        of the current state. Raises the error of a failed write, if any.
+        """
+        if final:
+            self.submit(self.model.checkpointData(**self.snapshot_kwargs))
+        self.pending.put(None)
+        self.thread.join()
+
+        if self.error is not None:
+            raise RuntimeError(f"Writing checkpoint {self.path} failed") from self.error
@@ -0,0 +1,200 @@
+import time
+import numpy as np
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+from random_streams import RandomStream
+
+
+def strip_bounds(n_x, n_workers):
+    """
+    Splits the rows 0..n_x-1 into n_workers contiguous strips of (nearly) equal size.
+
+    Returns
+        bounds (np.array): strip k owns the rows bounds[k]:bounds[k + 1]
+    """
+    return np.linspace(0, n_x, n_workers + 1).round().astype(int)
+
+
+def run_strip_worker(job):
+    """
+    Runs the checkerboard sweeps of one strip of a domain decomposed lattice. Module level so worker processes can
+    unpickle it.
+
+    The spins of the whole lattice live in shared memory, so the halo of a strip (the rows of its neighbors) is read
+    in place. What keeps the halo consistent is the schedule: within a color class no two sites are neighbors, so all
+    workers update their part of a class at once and then wait on phase_barrier before anyone starts the next class.
+
+    Parameters
+        job (dict): spins_name, n_spins, totals_name, n_workers, worker, classes (list of (sites, neighbors,
+            neighbor_signs) per color class, restricted to the strip), acceptance, max_degree, n_steps, rng
+            (RandomStream of the worker), phase_barrier, sweep_done and sweep_resume (semaphores, None unless the
+            main process records every sweep), timeout
+    """
+    spins_memory = shared_memory.SharedMemory(name=job['spins_name'])
+    totals_memory = shared_memory.SharedMemory(name=job['totals_name'])
+    try:
+        spins = np.ndarray((job['n_spins'],), dtype=np.int8, buffer=spins_memory.buf)
+        # (n_workers, 2) changes of total_spin and bond_sum made by each worker
+        totals = np.ndarray((job['n_workers'], 2), dtype=np.int64, buffer=totals_memory.buf)
+
+        rng = job['rng']
+        acceptance = job['acceptance']
+        max_degree = job['max_degree']
+
+        for step in range(job['n_steps']):
+            for sites, neighbors, neighbor_signs in job['classes']:
+                if len(sites):
+                    current = spins[sites]
+                    neighbor_sums = np.einsum('ij,ij->i', spins[neighbors], neighbor_signs, dtype=np.int64)
+                    prob = acceptance[current + 1, neighbor_sums + max_degree]
+
+                    flip = rng.random(len(sites)) < prob
+                    flipped = np.where(flip, current, 0)
+
+                    totals[job['worker'], 0] -= 2 * int(np.sum(flipped, dtype=np.int64))
+                    totals[job['worker'], 1] -= 2 * int(np.dot(flipped, neighbor_sums))
+                    spins[sites[flip]] = -current[flip]
+
+                job['phase_barrier'].wait()
+
+            if job['sweep_done'] is not None:
+                # the main process reads the lattice before it lets the workers continue
+                job['sweep_done'].release()
+                if not job['sweep_resume'].acquire(timeout=job['timeout']):
+                    raise TimeoutError("The main process didn't resume the sweeps")
+    except BaseException:
+        job['phase_barrier'].abort()
+        raise
+    finally:
+        spins_memory.close()
+        totals_memory.close()
+
+
+def wait_for_workers(semaphore, workers, timeout):
+    """
+    Takes one release of semaphore per worker. Polls instead of blocking, so a worker that died (or didn't report
+    for timeout seconds) raises a RuntimeError instead of leaving the main process waiting forever.
+    """
+    deadline = time.monotonic() + timeout
+    for _ in workers:
+        while not semaphore.acquire(timeout=.1):
+            if any(process.exitcode not in (None, 0) for process in workers) or time.monotonic() > deadline:
+                raise RuntimeError("A domain decomposition worker failed")
+
+
+def run_decomposed(model, n_steps, n_workers=None, root_seed=None, barrier_timeout=600):
+    """
+    Runs n_steps checkerboard Metropolis sweeps of a ClassicIsing model with the lattice split into strips of rows,
+    one per worker process. The spins are copied into shared memory once, every worker updates its strip color class
+    by color class, and barriers between the color phases keep the strips consistent, so every sweep is the same
+    Markov chain step as ClassicIsing.checkerboard. The spins and running totals are copied back at the end.
+
+    Works with every topology, including the wrapped ones (Torus, Cylinder, Mobius) whose links cross strip
+    boundaries. If the model records a grid history, a trajectory or checks its observables, the workers pause after
+    every sweep so the main process can do that bookkeeping.
+
+    No process is left waiting when another one fails. A failing worker aborts phase_barrier, and every barrier
+    wait gives up after barrier_timeout seconds. The main process never blocks on a barrier (whose lock a killed
+    worker may still hold), it polls the workers' exit codes and terminates the remaining workers when a worker
+    died or it raised itself (e.g. in recordSweep).
+
+    Parameters
+        model (ClassicIsing): The model to advance
+        n_steps (int): Number of sweeps
+        n_workers (int): Number of worker processes (strips), the number of cores by default
+        root_seed (int or None): Seed the workers' random streams are spawned from. None spawns them from the model's
+            stream (model.rng). For a given seed (or seeded model) and n_workers the run is reproducible.
+        barrier_timeout (float): Seconds a process waits for the others before the run is given up
+    """
+    grid = model.grid
+    if n_steps <= 0:
+        return
+    if n_workers is None:
+        n_workers = mp.cpu_count()
+    n_workers = max(1, min(n_workers, grid.n_x))
+
+    sync = grid.record_history or model.trajectory is not None or model.check_observables or model.checkpointer is not None
+    n_spins = grid.n_sites + 1
+
+    spins_memory = shared_memory.SharedMemory(create=True, size=n_spins)
+    totals_memory = shared_memory.SharedMemory(create=True, size=n_workers * 2 * 8)
+    try:
+        spins = np.ndarray((n_spins,), dtype=np.int8, buffer=spins_memory.buf)
+        spins[:] = grid.flat_spins
+        totals = np.ndarray((n_workers, 2), dtype=np.int64, buffer=totals_memory.buf)
+        totals[:] = 0
+
+        phase_barrier = mp.Barrier(n_workers, timeout=barrier_timeout)
+        sweep_done = mp.Semaphore(0) if sync else None
+        sweep_resume = mp.Semaphore(0) if sync else None
+
+        bounds = strip_bounds(grid.n_x, n_workers) * grid.n_y
+        streams = (model.rng if root_seed is None else RandomStream(root_seed)).spawn(n_workers)
+
+        workers = []
+        for worker in range(n_workers):
+            classes = []
+            for sites in grid.color_classes:
+                owned = sites[(bounds[worker] <= sites) & (sites < bounds[worker + 1])]
+                classes.append((owned, grid.neighbors[owned], grid.neighbor_signs[owned]))
+
+            job = {
+                'spins_name': spins_memory.name,
+                'n_spins': n_spins,
+                'totals_name': totals_memory.name,
+                'n_workers': n_workers,
+                'worker': worker,
+                'classes': classes,
+                'acceptance': model.acceptance,
+                'max_degree': model.max_degree,
+                'n_steps': n_steps,
+                'rng': streams[worker],
+                'phase_barrier': phase_barrier,
+                'sweep_done': sweep_done,
+                'sweep_resume': sweep_resume,
+                'timeout': barrier_timeout,
+            }
+            workers.append(mp.Process(target=run_strip_worker, args=(job,), daemon=True))
+
+        total_spin, bond_sum = grid.total_spin, grid.bond_sum
+        for process in workers:
+            process.start()
+
+        try:
+            if sync:
+                for step in range(n_steps):
+                    wait_for_workers(sweep_done, workers, barrier_timeout)
+                    grid.flat_spins[:] = spins
+                    grid.total_spin = total_spin + int(totals[:, 0].sum())
+                    grid.bond_sum = bond_sum + int(totals[:, 1].sum())
+                    model.recordSweep()
+                    for process in workers:
+                        sweep_resume.release()
+
+            while any(process.is_alive() for process in workers):
+                if any(process.exitcode not in (None, 0) for process in workers):
+                    raise RuntimeError("A domain decomposition worker failed")
+                next(process for process in workers if process.is_alive()).join(.1)
+        except BaseException:
+            # the other workers may wait for a process that is gone, or on a lock a killed worker still holds
+            for process in workers:
+                process.terminate()
+            raise
+        finally:
+            for process in workers:
+                process.join()
+
+        if any(process.exitcode != 0 for process in workers):
+            raise RuntimeError("A domain decomposition worker failed")
+
+        grid.flat_spins[:] = spins
+        grid.total_spin = total_spin + int(totals[:, 0].sum())
+        grid.bond_sum = bond_sum + int(totals[:, 1].sum())
+        if not sync:
+            model.sweeps += n_steps
+    finally:
+        spins_memory.close()
+        spins_memory.unlink()
+        totals_memory.close()
+        totals_memory.unlink()
@@ -1,19 +1,21 @@
 
 class ClassicElectron:
-    def __init__(self, x, y, spin):
 
-        self.FermionSpin = 1/2
+    # constants shared by every electron, computed once
+    FermionSpin = 1/2
+    G_factor = 2
+    Bohr_Magneton = 9.274*(10**-24)  # J/T, for electrons
+    magnetic_moment = FermionSpin * G_factor * Bohr_Magneton
+
+    def __init__(self, x, y, spin, lattice=None):
         
         self.x = x
         self.y = y
 
+        # if a lattice (2D spin array) is given, the spin is stored in lattice[x, y] instead of on the object
+        self.lattice = lattice
         self.spin = spin
 
-        self.G_factor = 2
-
-        # For electrons 
-        self.Bohr_Magneton = 9.274*(10**-24)  # J/T
-
     ### overloaded methods ###
 
     def __str__(self):
@@ -49,6 +51,21 @@ class ClassicElectron:
         self.spin += other.spin
         return self
 
+    ### properties ###
+
+    @property
+    def spin(self):
+        if self.lattice is not None:
+            return int(self.lattice[self.x, self.y])
+        return self._spin
+
+    @spin.setter
+    def spin(self, value):
+        if self.lattice is not None:
+            self.lattice[self.x, self.y] = value
+        else:
+            self._spin = value
+
     ### class methods ###
 
     def getSpin(self):
@@ -58,9 +75,8 @@ class ClassicElectron:
         self.spin = newSpin
 
     def calculateEnergy(self, effectiveMagneticField):
-        return self.spin*self.FermionSpin*self.G_factor*self.Bohr_Magneton*effectiveMagneticField
+        return self.spin*self.magnetic_moment*effectiveMagneticField
         
     def changeInEnergy(self, effectiveMagneticField):
-        mu_eff = self.FermionSpin * self.G_factor * self.Bohr_Magneton
-        deltaE = 2 * self.spin * mu_eff * effectiveMagneticField
+        deltaE = 2 * self.spin * self.magnetic_moment * effectiveMagneticField
         return deltaE
\ No newline at end of file
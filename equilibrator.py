@@ -1,6 +1,24 @@
 import copy
 import numpy as np
 
+def replica_of(model):
+    """
+    Deep copy of a model that doesn't record a grid history. The history is detached from the grid while copying,
+    so a long recorded history isn't copied only to be dropped (the trajectory writer is never copied, see
+    ClassicIsing.__getstate__).
+    """
+    grid = model.grid
+    history = grid.__dict__.pop('grid_history', None)
+    try:
+        replica = copy.deepcopy(model)
+    finally:
+        if history is not None:
+            grid.grid_history = history
+
+    replica.grid.record_history = False
+    return replica
+
+
 def equilibrate_grid(model, equil_tolerance=.9, mag_hist = False):
     """
     Run the simulation until the grid equilibrates. That is, until the average magnetization of temps 
@@ -27,11 +45,13 @@ def equilibrate_grid(model, equil_tolerance=.9, mag_hist = False):
     max_steps = grid.n_x * grid.n_y * 5  # arbitrary large number of steps to prevent infinite loops
     temps = np.linspace(1, 1.2, 15)  # low temperature range for equilibration
     ensemble = []
+    streams = model.rng.spawn(len(temps))
 
     # create a new model for each temperature
-    for T in temps:
+    for T, stream in zip(temps, streams):
         modelCopy = copy.deepcopy(model)
         modelCopy.grid = grid  # share the same grid
+        modelCopy.rng = stream  # but draw independent random numbers
         new_model = modelCopy.changeTemp(T)
         ensemble.append(new_model)
 
@@ -64,9 +84,117 @@ def equilibrate_grid(model, equil_tolerance=.9, mag_hist = False):
     # not equilibrated within max steps       
     return total_hist if mag_hist else is_equilibrated
 
-def proper_equilibration(model, equil_tolerance=.9, max_attempts=10):
+def parallel_tempering(model, temps, n_sweeps, swap_interval=1, update_rule='checkerboard', equil_tolerance=None):
+    """
+    Runs a replica exchange (parallel tempering) simulation. Every temperature of the ladder gets its own replica
+    (an independent copy of the model and its grid). After every swap_interval sweeps, neighboring temperatures
+    try to exchange configurations with the Metropolis swap criterion
+
+        P(swap i <-> j) = min(1, exp((beta_i - beta_j) * (E_i - E_j))),   beta = 1 / kT
+
+    alternating between the even and the odd pairs of the ladder.
+
+    Parameters:
+    -----------
+    model : the ising model object
+        The Ising model whose grid, coupling and field the replicas start from. It is not modified.
+    temps : array-like
+        Temperature ladder, sorted internally from cold to hot.
+    n_sweeps : int
+        Maximum number of sweeps per replica.
+    swap_interval : int
+        Sweeps between swap attempts.
+    update_rule : str or method name
+        Update rule each replica uses for its sweeps.
+    equil_tolerance : float or None
+        If given, stop as soon as the ladder average of |M|, averaged over the last 5 sweeps, exceeds it
+        (the criterion of equilibrate_grid).
+
+    Returns:
+    --------
+    ensemble : list
+        One ClassicIsing per temperature, from cold to hot, each holding the configuration currently at its temperature.
+    stats : dict
+        'temps': the sorted ladder,
+        'swap_acceptance': acceptance rate of each neighboring pair (len(temps) - 1),
+        'round_trips': sweeps each completed cold -> hot -> cold round trip of a configuration took,
+        'mean_round_trip': their mean (nan if none completed),
+        'sweeps': sweeps actually run,
+        'equilibrated': whether equil_tolerance was reached (None if not given).
+    """
+    temps = np.sort(np.asarray(temps, dtype=float))
+    n_temps = len(temps)
+
+    # one independent stream per replica plus one for the swaps, all spawned from the model's stream
+    streams = model.rng.spawn(n_temps + 1)
+    swap_rng = streams[-1]
+
+    ensemble = []
+    for T, stream in zip(temps, streams):
+        replica = replica_of(model)
+        replica.rng = stream
+        ensemble.append(replica.changeTemp(T))
+
+    betas = 1 / (model.Boltzmann * temps)
+    swap_tries = np.zeros(n_temps - 1)
+    swap_accepts = np.zeros(n_temps - 1)
+
+    # walkers[i] is the configuration currently at temperature i. A round trip starts when a walker leaves the cold
+    # end, and ends when it gets back there after having reached the hot end.
+    walkers = np.arange(n_temps)
+    left_cold_at = np.full(n_temps, -1)
+    reached_hot = np.zeros(n_temps, dtype=bool)
+    round_trips = []
+
+    avg_mags_hist = []
+    equilibrated = None if equil_tolerance is None else False
+    sweep = 0
+    for sweep in range(1, n_sweeps + 1):
+        for replica in ensemble:
+            replica.update(update_rule)
+
+        if equil_tolerance is not None:
+            avg_mags_hist.append(np.mean([replica.magnetization() for replica in ensemble]))
+            if sweep > 5 and np.mean(avg_mags_hist[-5:]) > equil_tolerance:
+                equilibrated = True
+                break
+
+        if sweep % swap_interval:
+            continue
+
+        for i in range((sweep // swap_interval) % 2, n_temps - 1, 2):
+            swap_tries[i] += 1
+            delta = (betas[i] - betas[i + 1]) * (ensemble[i].energy - ensemble[i + 1].energy)
+            if delta >= 0 or swap_rng.uniform() < np.exp(delta):
+                swap_accepts[i] += 1
+                ensemble[i].grid, ensemble[i + 1].grid = ensemble[i + 1].grid, ensemble[i].grid
+                walkers[i], walkers[i + 1] = walkers[i + 1], walkers[i]
+
+        cold, hot = walkers[0], walkers[-1]
+        reached_hot[hot] = True
+        if reached_hot[cold] and left_cold_at[cold] >= 0:
+            round_trips.append(sweep - left_cold_at[cold])
+        if reached_hot[cold] or left_cold_at[cold] < 0:
+            left_cold_at[cold] = sweep
+            reached_hot[cold] = False
+
+    stats = {
+        'temps': temps,
+        'swap_acceptance': np.divide(swap_accepts, swap_tries, out=np.zeros(n_temps - 1), where=swap_tries > 0),
+        'round_trips': round_trips,
+        'mean_round_trip': np.mean(round_trips) if round_trips else np.nan,
+        'sweeps': sweep,
+        'equilibrated': equilibrated,
+    }
+
+    return ensemble, stats
+
+def proper_equilibration(model, equil_tolerance=.9, max_attempts=10, temps=None, update_rule='checkerboard'):
     """
-    Calls equilibrate_grid, if still not equilibrated, resets/resamples the grid and tries again, up to a maximum number of attempts.
+    Equilibrates the grid over a whole temperature ladder in one parallel tempering pass (see parallel_tempering),
+    instead of resetting and retrying equilibrate_grid. The run stops as soon as the ladder average of |M| exceeds the
+    tolerance (the criterion of equilibrate_grid), and the configuration of the coldest replica is loaded into the
+    model's grid.
 
     Parameters:
     -----------
@@ -74,25 +202,26 @@ def proper_equilibration(model, equil_tolerance=.9, max_attempts=10):
         The Ising model to equilibrate.
     equil_tolerance : float
         The tolerance for equilibration.
-    J : float
-        The coupling constant for the Ising model.
     max_attempts : int
-        The maximum number of attempts to equilibrate the grid.
+        Bounds the run to max_attempts * 5 * N^2 sweeps, the budget of max_attempts equilibrate_grid attempts.
+    temps : array-like
+        Temperature ladder, the range 1 to 1.2 of equilibrate_grid by default.
+    update_rule : str
+        Update rule the replicas use.
 
     Returns:
     --------
     bool
         Returns True if the grid is equilibrated, False otherwise.
     """
-    # equilibrate the grid first
-    equilibrated = equilibrate_grid(model, equil_tolerance=equil_tolerance)
-    attempt = 0
-    # if not equilibrated, reset and try again
-    while not equilibrated:
-        model.resetSimulation()
-        equilibrated = equilibrate_grid(model, equil_tolerance=equil_tolerance)
-        attempt += 1
-        if attempt >= max_attempts:
-            print("Maximum attempts for proper equilibration reached. Equilibration is not ensured.")
-            return equilibrated
-    return equilibrated
\ No newline at end of file
+    if temps is None:
+        temps = np.linspace(1, 1.2, 15)  # low temperature range for equilibration
+
+    max_sweeps = model.grid.n_x * model.grid.n_y * 5 * max_attempts
+    ensemble, stats = parallel_tempering(model, temps, max_sweeps, update_rule=update_rule, equil_tolerance=equil_tolerance)
+
+    model.grid.grid = ensemble[0].grid.grid
+
+    if not stats['equilibrated']:
+        print("Maximum attempts for proper equilibration reached. Equilibration is not ensured.")
+    return stats['equilibrated']
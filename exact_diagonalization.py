@@ -0,0 +1,273 @@
+import numpy as np
+from functools import lru_cache
+from scipy import sparse
+from scipy.sparse.linalg import eigsh
+
+# one row per field value in the result of scan_field
+SCAN_DTYPE = np.dtype([
+    ('h', float),
+    ('energy', float),
+    ('gap', float),
+    ('magnetization_x', float),
+    ('magnetization_z2', float),
+])
+
+
+def _popcount(states):
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(states).astype(np.int64)
+    counts = np.zeros(states.shape, dtype=np.int64)
+    for bit in range(64):
+        counts += ((states >> np.uint64(bit)) & np.uint64(1)).astype(np.int64)
+    return counts
+
+
+def rotate(states, n, r):
+    """Translates the periodic chain of n qubits by r sites: bit i of the result is bit (i - r) % n of states."""
+    r %= n
+    if r == 0:
+        return states.copy()
+    mask = np.uint64(2**n - 1)
+    return ((states << np.uint64(r)) | (states >> np.uint64(n - r))) & mask
+
+
+def representative(states, n):
+    """
+    Returns the representative of every basis state under translations and the global spin flip (the smallest state
+    of its orbit), and the group element (r, f) mapping the state onto it: representative = rotate(state, r) ^ f * mask.
+    """
+    mask = np.uint64(2**n - 1)
+    best = states.copy()
+    best_r = np.zeros(states.shape, dtype=np.int64)
+    best_f = np.zeros(states.shape, dtype=np.int64)
+
+    for r in range(n):
+        rotated = rotate(states, n, r)
+        for f, candidate in ((0, rotated), (1, rotated ^ mask)):
+            smaller = candidate < best
+            best[smaller] = candidate[smaller]
+            best_r[smaller] = r
+            best_f[smaller] = f
+
+    return best, best_r, best_f
+
+
+class SymmetrySector:
+    """
+    Basis of one symmetry sector of the periodic transverse-field chain H = -J * sum_i Z_i Z_(i+1) - h * sum_i X_i:
+    momentum 2 pi * momentum / n under translations and parity +-1 under the global spin flip prod_i X_i. Both commute
+    with H, so H is block diagonal and each block is about 2n times smaller than the 2^n dimensional space.
+
+    Basis states are the symmetrized orbits Pr|s> / sqrt(nu_s) of representatives s, with the projector
+    Pr = 1 / 2n * sum_g chi(g)* g and nu_s = <s|Pr|s>. The sector Hamiltonian is stored as J * zz - h * x (zz the
+    diagonal of -sum_i Z_i Z_(i+1), x the sparse matrix of sum_i X_i), so scans over J and h reuse the same sector.
+
+    Parameters
+        n (int): Number of qubits
+        momentum (int): Momentum quantum number 0..n-1
+        parity (int): +1 or -1
+        chunk (int): Number of basis states searched for representatives at once, bounds the memory of the build
+    """
+
+    def __init__(self, n, momentum=0, parity=1, chunk=2**22):
+
+        if parity not in (1, -1):
+            raise ValueError(f"Parity has to be +1 or -1, got {parity}")
+
+        self.n = n
+        self.momentum = momentum % n
+        self.parity = parity
+        self.group_size = 2 * n
+
+        # representatives: the states that are the smallest of their orbit
+        reps = []
+        for start in range(0, 2**n, chunk):
+            states = np.arange(start, min(start + chunk, 2**n), dtype=np.uint64)
+            smallest, _, _ = representative(states, n)
+            reps.append(states[smallest == states])
+        reps = np.concatenate(reps)
+
+        # only orbits whose stabilizer is compatible with the sector survive the projection
+        nu = np.zeros(len(reps), dtype=complex)
+        mask = np.uint64(2**n - 1)
+        for r in range(n):
+            rotated = rotate(reps, n, r)
+            for f, image in ((0, rotated), (1, rotated ^ mask)):
+                nu += np.where(image == reps, np.conj(self.character(r, f)), 0)
+        nu = nu.real / self.group_size
+
+        keep = nu > 1e-10
+        self.reps = reps[keep]
+        self.nu = nu[keep]
+        self.dim = len(self.reps)
+
+        # sum_i Z_i Z_(i+1) is n - 2 * (number of anti-aligned neighbors), the same on every state of an orbit
+        self.zz = -(n - 2 * _popcount(self.reps ^ rotate(self.reps, n, 1))).astype(float)
+        self.z_sum = (n - 2 * _popcount(self.reps)).astype(float)
+
+        self.x = self.buildX()
+
+    ### class methods ###
+
+    def character(self, r, f):
+        """Character chi(g) of the group element g = (translation by r, f global flips) in this sector."""
+        return np.exp(-2j * np.pi * self.momentum * np.asarray(r) / self.n) * self.parity**np.asarray(f)
+
+    def isReal(self):
+        """Whether every character is real (momentum 0 or pi), which makes the sector Hamiltonian real."""
+        return self.momentum == 0 or 2 * self.momentum == self.n
+
+    def buildX(self):
+        """
+        Sparse matrix of sum_i X_i in the sector basis. X_i maps the representative s onto t = s ^ (1 << i), whose
+        representative u = g t contributes chi(g)* * sqrt(nu_u / nu_s) to the element (u, s).
+        """
+        rows, cols, values = [], [], []
+        columns = np.arange(self.dim)
+
+        for i_qubit in range(self.n):
+            flipped = self.reps ^ np.uint64(1 << i_qubit)
+            u, r, f = representative(flipped, self.n)
+
+            index = np.minimum(np.searchsorted(self.reps, u), self.dim - 1)
+            found = self.reps[index] == u
+
+            rows.append(index[found])
+            cols.append(columns[found])
+            values.append(np.conj(self.character(r[found], f[found])) * np.sqrt(self.nu[index[found]] / self.nu[found]))
+
+        values = np.concatenate(values)
+        if self.isReal():
+            values = values.real
+
+        return sparse.csr_matrix((values, (np.concatenate(rows), np.concatenate(cols))), shape=(self.dim, self.dim))
+
+    def hamiltonian(self, J, h):
+        """Sparse sector Hamiltonian J * zz - h * x."""
+        return sparse.diags(J * self.zz) - h * self.x
+
+    def lowest(self, J, h, k=1, v0=None, tol=0):
+        """
+        Lowest k eigenvalues (ascending) and eigenvectors of the sector Hamiltonian, by Lanczos (eigsh) unless the
+        sector is so small that a dense diagonalization is cheaper.
+
+        Parameters
+            J, h (float): coupling and transverse field
+            k (int): number of levels
+            v0 (np.array): starting vector, e.g. the ground state of a nearby h (warm start)
+            tol (float): eigsh tolerance, 0 is machine precision
+        """
+        H = self.hamiltonian(J, h)
+        if self.dim <= max(64, 2 * k + 1):
+            energies, vectors = np.linalg.eigh(H.toarray())
+            return energies[:k], vectors[:, :k]
+
+        energies, vectors = eigsh(H, k=k, which='SA', v0=v0, tol=tol)
+        order = np.argsort(energies)
+        return energies[order], vectors[:, order]
+
+    def expand(self, vector):
+        """
+        Returns the full 2^n dimensional state vector of a vector in the sector basis. Needs the full 2^n amplitudes.
+        """
+        psi = np.zeros(2**self.n, dtype=complex)
+        mask = np.uint64(2**self.n - 1)
+        weights = vector / (self.group_size * np.sqrt(self.nu))
+
+        for r in range(self.n):
+            rotated = rotate(self.reps, self.n, r)
+            for f, image in ((0, rotated), (1, rotated ^ mask)):
+                np.add.at(psi, image.astype(np.intp), np.conj(self.character(r, f)) * weights)
+
+        return psi / np.linalg.norm(psi)
+
+    def observables(self, vector):
+        """
+        Returns the mean X magnetization <sum_i X_i> / n and the squared Z magnetization <(sum_i Z_i / n)^2> of a
+        normalized vector in the sector basis.
+        """
+        magnetization_x = np.vdot(vector, self.x @ vector).real / self.n
+        magnetization_z2 = np.dot(np.abs(vector)**2, self.z_sum**2) / self.n**2
+        return magnetization_x, magnetization_z2
+
+
+@lru_cache(maxsize=8)
+def symmetry_sector(n, momentum=0, parity=1):
+    """Cached SymmetrySector, built once per (n, momentum, parity)."""
+    return SymmetrySector(n, momentum, parity)
+
+
+def low_spectrum(n, J, h, momenta=(0,), parities=(1, -1), levels=2, v0=None):
+    """
+    Lowest levels of every requested sector.
+
+    Parameters
+        n (int): Number of qubits
+        J, h (float): coupling and transverse field
+        momenta (iterable): momentum sectors to search, range(n) searches all of them
+        parities (iterable): parity sectors to search
+        levels (int): levels per sector
+        v0 (dict): (momentum, parity) -> starting vector, for warm starts
+
+    Returns
+        spectrum (dict): (momentum, parity) -> (energies, vectors)
+    """
+    spectrum = {}
+    for momentum in momenta:
+        for parity in parities:
+            sector = symmetry_sector(n, momentum % n, parity)
+            if sector.dim == 0:
+                continue
+            start = None if v0 is None else v0.get((momentum % n, parity))
+            spectrum[(momentum % n, parity)] = sector.lowest(J, h, k=min(levels, sector.dim), v0=start)
+    return spectrum
+
+
+def ground_state(n, J, h, momenta=(0,), parities=(1, -1), v0=None):
+    """
+    Ground state energy, gap to the first excited level and magnetizations of the periodic chain, searched in the
+    given sectors. For J, h > 0 the ground state lies at momentum 0 and parity +1 and the lowest excitation at
+    momentum 0 too (parity -1 in the ordered phase), so the default sectors suffice there. Pass momenta=range(n) for
+    other couplings.
+
+    Returns
+        result (dict): energy, gap, magnetization_x, magnetization_z2, sector (momentum, parity) and vector (in the
+            sector basis) of the ground state, and spectrum (see low_spectrum) for warm starts
+    """
+    spectrum = low_spectrum(n, J, h, momenta, parities, levels=2, v0=v0)
+
+    levels = sorted((energy, key, index) for key, (energies, _) in spectrum.items() for index, energy in enumerate(energies))
+    energy, key, index = levels[0]
+    gap = levels[1][0] - energy if len(levels) > 1 else np.nan
+
+    vector = spectrum[key][1][:, index]
+    magnetization_x, magnetization_z2 = symmetry_sector(n, *key).observables(vector)
+
+    return {
+        'energy': energy,
+        'gap': gap,
+        'magnetization_x': magnetization_x,
+        'magnetization_z2': magnetization_z2,
+        'sector': key,
+        'vector': vector,
+        'spectrum': spectrum,
+    }
+
+
+def scan_field(n, J, h_values, momenta=(0,), parities=(1, -1)):
+    """
+    Ground state energy, gap and magnetizations over a range of transverse fields. The sectors are built once and
+    every Lanczos run starts from the lowest vectors of the previous field value.
+
+    Returns
+        np.ndarray: structured array (SCAN_DTYPE) with one row per field value
+    """
+    results = np.zeros(len(h_values), dtype=SCAN_DTYPE)
+    v0 = None
+
+    for i, h in enumerate(h_values):
+        result = ground_state(n, J, h, momenta, parities, v0=v0)
+        v0 = {key: vectors[:, 0] for key, (_, vectors) in result['spectrum'].items()}
+        results[i] = (h, result['energy'], result['gap'], result['magnetization_x'], result['magnetization_z2'])
+
+    return results
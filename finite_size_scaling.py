@@ -0,0 +1,349 @@
+import hashlib
+import json
+import os
+import zlib
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from scipy.optimize import brentq, curve_fit
+
+import electron
+from random_streams import RandomStream
+from ising_model import ClassicIsing
+from measurements import MeasurementSeries
+from reweighting import Reweighting
+
+# one row per lattice size in FiniteSizeScaling.analyze
+PEAK_DTYPE = np.dtype([
+    ('L', int),
+    ('susceptibility_peak_temperature', float),
+    ('susceptibility_peak', float),
+    ('specific_heat_peak_temperature', float),
+    ('specific_heat_peak', float),
+])
+
+# one row per pair of consecutive lattice sizes
+CROSSING_DTYPE = np.dtype([
+    ('L_small', int),
+    ('L_large', int),
+    ('temperature', float),
+    ('binder', float),
+])
+
+
+def _settings_part(value):
+    # arrays in the topology kwargs (e.g. a hole grid) are hashed by dtype, shape and bytes
+    if isinstance(value, np.ndarray):
+        return [value.dtype.str, value.shape, hashlib.sha256(np.ascontiguousarray(value).tobytes()).hexdigest()]
+    if isinstance(value, np.generic):
+        return value.item()
+    return repr(value)
+
+
+def run_fss_job(job):
+    """
+    Runs one (topology, L, temperature) point of a finite size scaling study and writes its measurement series to
+    job['path']. Module level so worker processes can unpickle it.
+
+    Parameters
+        job (dict): topology, L, topology_kwargs, temperature, J, mf_external, seed (np.random.SeedSequence),
+            n_equilibration, n_steps, update_rule, target_error, max_steps, settings, path
+
+    Returns
+        path (str): the file written
+    """
+    grid = job['topology'](job['L'], job['L'], electron.ClassicElectron, record_history=False, rng=RandomStream(job['seed']), **job['topology_kwargs'])
+    model = ClassicIsing(grid, job['temperature'], job['J'], job['mf_external'])
+
+    model.runSimulation(job['n_equilibration'], job['update_rule'])
+    measurement = model.measure(job['n_steps'], job['update_rule'], target_error=job['target_error'], max_steps=job['max_steps'])
+
+    measurement.save(job['path'], J=job['J'], mf_external=job['mf_external'], L=job['L'], settings=job['settings'])
+    return job['path']
+
+
+def _power_law_shift(L, Tc, a, inv_nu):
+    return Tc + a * L**(-inv_nu)
+
+
+class FiniteSizeScaling:
+    """
+    Batch finite size scaling study over a matrix of topologies, lattice sizes L (L x L lattices) and temperatures.
+
+    Every (topology, L, temperature) point is an independent job: equilibration, then a ClassicIsing.measure run
+    whose energy and magnetization series is written to its own .npz file in cache_dir. run schedules the points
+    that have no file yet on a process pool, largest lattices first so the longest jobs don't end up last, and every
+    finished point is on disk immediately, so an interrupted study picks up where it stopped. Every file records a
+    hash of the settings it was run with (see settingsKey), a file from a study with other settings is run again.
+    Each point's random stream is derived from root_seed and the point itself, so a point's result doesn't depend on
+    which other points were cached.
+
+    analyze combines the temperatures of every (topology, L) by multi histogram reweighting and extracts
+    - the susceptibility and specific heat peaks of every L,
+    - the Binder cumulant crossings of consecutive sizes,
+    - Tc(L -> infinity) and 1/nu from the shift of the susceptibility peaks, T_peak(L) = Tc + a * L^(-1/nu),
+    - gamma/nu from the growth of the peaks, chi_max ~ L^(gamma/nu),
+    - 1/nu from the Binder slopes at the crossing, dU/dT ~ L^(1/nu).
+
+    Parameters
+        topologies (dict or list): name -> Grid class, or name -> (Grid class, topology_kwargs), topology_kwargs a dict
+            or a callable L -> dict (e.g. a hole growing with L). A list of classes is keyed by the class names
+        sizes (iterable): Lattice sizes L
+        temperatures (array, dict or callable): Temperatures of every point: one array for all, a dict keyed by
+            (name, L) or name, or a callable (name, L) -> array
+        cache_dir (str): Directory of the per point files
+        J, mf_external (float): Coupling constant and external field
+        n_steps (int): Measured sweeps per point (per chunk with a target_error, see ClassicIsing.measure)
+        n_equilibration (int): Sweeps discarded before measuring
+        update_rule (str): Name of the ClassicIsing update rule
+        target_error (float or None): Relative precision of <|m|> every point runs to
+        max_steps (int): Upper bound of the measured sweeps with a target_error
+        root_seed (int or None): Root seed of the points' random streams
+    """
+
+    def __init__(self, topologies, sizes, temperatures, cache_dir='fss_cache', J=1, mf_external=0, n_steps=20000,
+                 n_equilibration=2000, update_rule='checkerboard', target_error=None, max_steps=200000, root_seed=None):
+
+        if not isinstance(topologies, dict):
+            topologies = {topology.__name__: topology for topology in topologies}
+        self.topologies = {name: spec if isinstance(spec, tuple) else (spec, {}) for name, spec in topologies.items()}
+
+        self.sizes = sorted(int(L) for L in sizes)
+        self.temperatures = temperatures
+        self.cache_dir = cache_dir
+
+        self.J = J
+        self.mf_external = mf_external
+        self.n_steps = n_steps
+        self.n_equilibration = n_equilibration
+        self.update_rule = update_rule
+        self.target_error = target_error
+        self.max_steps = max_steps
+
+        # fixed entropy for every point of the study, drawn once when no root seed is given
+        self.root_seed = np.random.SeedSequence(root_seed).entropy
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+    ### class methods ###
+
+    def temperaturesOf(self, name, L):
+        """Temperatures of the (name, L) points."""
+        temperatures = self.temperatures
+        if callable(temperatures):
+            temperatures = temperatures(name, L)
+        elif isinstance(temperatures, dict):
+            temperatures = temperatures[(name, L)] if (name, L) in temperatures else temperatures[name]
+        return np.asarray(temperatures, dtype=float)
+
+    def path(self, name, L, temperature):
+        """File of one point."""
+        return os.path.join(self.cache_dir, f'{name}_L{L}_T{temperature:.6f}.npz')
+
+    def topologyKwargs(self, name, L):
+        """Keyword arguments of the (name, L) grids."""
+        topology_kwargs = self.topologies[name][1]
+        return topology_kwargs(L) if callable(topology_kwargs) else topology_kwargs
+
+    def settingsKey(self, name, L):
+        """
+        Hash of everything besides the temperature that determines a (name, L) point: the topology and its kwargs,
+        the coupling and field, the sweep counts, the update rule, the target error and the root seed.
+        """
+        settings = {
+            'topology': self.topologies[name][0].__name__,
+            'topology_kwargs': self.topologyKwargs(name, L),
+            'J': self.J,
+            'mf_external': self.mf_external,
+            'n_steps': self.n_steps,
+            'n_equilibration': self.n_equilibration,
+            'update_rule': getattr(self.update_rule, '__name__', self.update_rule),
+            'target_error': self.target_error,
+            'max_steps': self.max_steps,
+            'root_seed': self.root_seed,
+        }
+        return hashlib.sha256(json.dumps(settings, sort_keys=True, default=_settings_part).encode()).hexdigest()
+
+    def isDone(self, path, settings):
+        """Whether a point file exists and was run with the settings hashed by settingsKey."""
+        if not os.path.exists(path):
+            return False
+        with np.load(path) as data:
+            return 'settings' in data.files and str(data['settings']) == settings
+
+    def jobs(self, include_done=False):
+        """
+        Returns the job dicts (see run_fss_job) of every point, or of the points without a finished file, largest
+        lattices first.
+        """
+        jobs = []
+        for name, (topology, _) in self.topologies.items():
+            for L in self.sizes:
+                kwargs = self.topologyKwargs(name, L)
+                settings = self.settingsKey(name, L)
+                for temperature in self.temperaturesOf(name, L):
+                    path = self.path(name, L, temperature)
+                    if not include_done and self.isDone(path, settings):
+                        continue
+
+                    key = (zlib.crc32(name.encode()), L, int(round(temperature * 10**6)))
+                    jobs.append({
+                        'topology': topology,
+                        'L': L,
+                        'topology_kwargs': kwargs,
+                        'temperature': temperature,
+                        'J': self.J,
+                        'mf_external': self.mf_external,
+                        'seed': np.random.SeedSequence(self.root_seed, spawn_key=key),
+                        'n_equilibration': self.n_equilibration,
+                        'n_steps': self.n_steps,
+                        'update_rule': self.update_rule,
+                        'target_error': self.target_error,
+                        'max_steps': self.max_steps,
+                        'settings': settings,
+                        'path': path,
+                    })
+
+        # the work of a point grows like L^2 (and faster near Tc), start the big ones first
+        jobs.sort(key=lambda job: -job['L'])
+        return jobs
+
+    def run(self, max_workers=None):
+        """
+        Runs every point that is not on disk yet. max_workers=1 runs them in this process.
+
+        Returns
+            n_run (int): number of points run
+        """
+        jobs = self.jobs()
+        if max_workers == 1:
+            for job in jobs:
+                run_fss_job(job)
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                for future in as_completed([executor.submit(run_fss_job, job) for job in jobs]):
+                    future.result()
+        return len(jobs)
+
+    def load(self, name, L):
+        """Measurement series of every finished temperature of (name, L)."""
+        settings = self.settingsKey(name, L)
+        paths = [self.path(name, L, temperature) for temperature in self.temperaturesOf(name, L)]
+        return [MeasurementSeries.load(path) for path in paths if self.isDone(path, settings)]
+
+    def reweighting(self, name, L):
+        """Reweighting of every finished temperature of (name, L)."""
+        return Reweighting(self.load(name, L))
+
+    def binderCrossing(self, small, large, n_grid=200):
+        """
+        Temperature and value where the Binder cumulants of two reweighted sizes cross, searched inside the
+        temperature range both cover. The crossing closest to where the curves are steepest is taken if there are
+        several. Returns (nan, nan) without a crossing.
+        """
+        low = max(small.temperatures.min(), large.temperatures.min())
+        high = min(small.temperatures.max(), large.temperatures.max())
+        if low >= high:
+            return np.nan, np.nan
+
+        difference = lambda temperature: small.observables(temperature)['binder'] - large.observables(temperature)['binder']
+
+        grid = np.linspace(low, high, n_grid)
+        values = np.array([difference(temperature) for temperature in grid])
+        changes = np.flatnonzero(np.sign(values[:-1]) * np.sign(values[1:]) < 0)
+        if not changes.size:
+            return np.nan, np.nan
+
+        i = changes[np.argmax(np.abs(values[changes + 1] - values[changes]))]
+        temperature = brentq(difference, grid[i], grid[i + 1])
+        return temperature, large.observables(temperature)['binder']
+
+    def analyze(self, n_grid=200):
+        """
+        Finite size scaling analysis of every topology from the finished points.
+
+        Returns
+            results (dict): name -> dict with
+                curves: L -> reweighted curves (reweighting.CURVE_DTYPE) on n_grid temperatures
+                peaks: structured array (PEAK_DTYPE), one row per L, nan where the peak lies outside the
+                    simulated temperatures
+                crossings: structured array (CROSSING_DTYPE), one row per pair of consecutive sizes
+                Tc_binder: Binder crossing of the two largest sizes
+                Tc, inv_nu: fit of the susceptibility peak positions (1/nu fixed to the 2D Ising value 1 with
+                    fewer than 3 sizes)
+                gamma_over_nu: exponent of the susceptibility peak heights
+                inv_nu_binder: exponent of the Binder slopes at Tc_binder
+        """
+        results = {}
+        for name in self.topologies:
+            reweightings = {}
+            for L in self.sizes:
+                measurements = self.load(name, L)
+                if measurements:
+                    reweightings[L] = Reweighting(measurements)
+            sizes = sorted(reweightings)
+
+            curves = {}
+            peaks = np.zeros(len(sizes), dtype=PEAK_DTYPE)
+            for i, L in enumerate(sizes):
+                reweighting = reweightings[L]
+                curves[L] = reweighting.curves(np.linspace(reweighting.temperatures.min(), reweighting.temperatures.max(), n_grid))
+                peaks[i] = (L, *self.interiorPeak(reweighting, 'susceptibility'), *self.interiorPeak(reweighting, 'specific_heat'))
+
+            crossings = np.zeros(max(len(sizes) - 1, 0), dtype=CROSSING_DTYPE)
+            for i, (small, large) in enumerate(zip(sizes[:-1], sizes[1:])):
+                crossings[i] = (small, large, *self.binderCrossing(reweightings[small], reweightings[large]))
+
+            result = {'curves': curves, 'peaks': peaks, 'crossings': crossings,
+                      'Tc_binder': crossings['temperature'][-1] if len(crossings) else np.nan}
+            result.update(self.fitPeaks(peaks))
+            result['inv_nu_binder'] = self.fitBinderSlopes(reweightings, result['Tc_binder'])
+            results[name] = result
+
+        return results
+
+    def interiorPeak(self, reweighting, quantity):
+        """
+        Peak of a reweighted quantity, (nan, nan) if it lies on the edge of the simulated temperatures, i.e. the
+        maximum is outside the range and the temperatures of that point have to be extended.
+        """
+        temperature, value = reweighting.peak(quantity)
+        low, high = reweighting.temperatures.min(), reweighting.temperatures.max()
+        if min(temperature - low, high - temperature) < 1e-3 * (high - low):
+            return np.nan, np.nan
+        return temperature, value
+
+    def fitPeaks(self, peaks):
+        """
+        Fits T_peak(L) = Tc + a * L^(-1/nu) and chi_max(L) ~ L^(gamma/nu) to the susceptibility peaks found inside
+        the simulated ranges.
+        """
+        peaks = peaks[np.isfinite(peaks['susceptibility_peak'])]
+        L = peaks['L'].astype(float)
+        T_peak = peaks['susceptibility_peak_temperature']
+        fit = {'Tc': np.nan, 'inv_nu': np.nan, 'gamma_over_nu': np.nan}
+
+        if len(L) >= 3:
+            try:
+                (fit['Tc'], _, fit['inv_nu']), _ = curve_fit(_power_law_shift, L, T_peak, p0=(T_peak[-1], 0.0, 1.0), maxfev=10000)
+            except RuntimeError:
+                pass
+        if len(L) == 2 or (len(L) >= 3 and np.isnan(fit['Tc'])):
+            # linear in 1 / L with the exact 2D Ising exponent
+            slope, fit['Tc'] = np.polyfit(1 / L, T_peak, 1)
+            fit['inv_nu'] = 1.0
+
+        if len(L) >= 2:
+            fit['gamma_over_nu'] = np.polyfit(np.log(L), np.log(peaks['susceptibility_peak']), 1)[0]
+        return fit
+
+    def fitBinderSlopes(self, reweightings, temperature, dT=1e-3):
+        """
+        Exponent of dU/dT ~ L^(1/nu), the Binder slopes taken by central differences at the given temperature.
+        """
+        if np.isnan(temperature) or len(reweightings) < 2:
+            return np.nan
+
+        sizes = sorted(reweightings)
+        slopes = [abs(reweightings[L].observables(temperature + dT)['binder'] - reweightings[L].observables(temperature - dT)['binder']) / (2 * dT)
+                  for L in sizes]
+        return np.polyfit(np.log(sizes), np.log(slopes), 1)[0]
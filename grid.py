@@ -1,5 +1,7 @@
 import numpy as np
-import copy 
+from history import GridHistory
+from random_streams import make_stream
+
 class Grid:
     """
     Represents a 2D grid of points for the Ising model.
@@ -11,32 +13,58 @@ class Grid:
         random_init (bool): Whether to initialize the grid randomly
         random_seed (int): Seed for random number generation
         loadGrid (Grid): An existing Grid object to load from
-        record_history (bool): Whether to record the history of grid states over time
+        record_history (bool or GridHistory): Whether to record the history of grid states over time. Passing a
+            GridHistory records with its settings (stride, capacity, packing, delta encoding)
+        rng (RandomStream, np.random.Generator or SeedSequence): Random stream of the grid, used instead of
+            random_seed. By default a new stream seeded with random_seed. The global np.random state is never touched
+
+    Spins are stored in a contiguous int8 array (self.grid) of shape (n_x, n_y). Sites that do not take part in the
+    simulation (e.g. the hole of a HoleGrid) hold spin 0 and are marked False in the optional boolean self.mask.
+
+    The grid keeps two running totals, updated by flip/flipCluster in time proportional to the number of flipped
+    sites: total_spin (sum of all spins) and bond_sum (sum of sign * s_i * s_j over every link, counted once).
+    Together with J and h they give the energy -magnetic_moment * (J * bond_sum + h * total_spin).
+    Spins changed by other means (e.g. through the points returned by getPoint) need a recount().
     """
 
-    def __init__(self, n_x, n_y, gridPointObject, random_init=True, random_seed=None, loadGrid=None, record_history=True):
+    def __init__(self, n_x, n_y, gridPointObject, random_init=True, random_seed=None, loadGrid=None, record_history=True, rng=None):
 
         
         self.gridPointObject = gridPointObject
-        self.record_history = record_history
+        self.record_history = record_history is not None and record_history is not False
+        self.history_settings = record_history if isinstance(record_history, GridHistory) else None
         self.loadGrid = loadGrid
 
         self.n_x = n_x
         self.n_y = n_y
+        self.n_sites = n_x * n_y
 
         self.random_init = random_init
         self.random_seed = random_seed
 
-        if self.random_seed is not None:
-            np.random.seed(self.random_seed)
+        # flat spin storage with one extra, always zero, entry at index n_sites. Missing neighbors point there
+        # (self.sentinel) so neighbor sums can be gathered without any bounds checks. self.grid is a 2D view of it.
+        self.sentinel = self.n_sites
+        self.flat_spins = np.zeros(self.n_sites + 1, dtype=np.int8)
+        self._grid = self.flat_spins[:self.n_sites].reshape(n_x, n_y)
+
+        # boolean array of active sites, None means every site is active
+        self.mask = self.siteMask()
+        self.active_sites = np.arange(self.n_sites) if self.mask is None else np.flatnonzero(self.mask)
+
+        self.neighbors, self.neighbor_signs = self.buildNeighbors()
+        # largest |neighbor sum| any site can have, which sizes the Metropolis acceptance table
+        self.max_degree = int(max(self.neighbors.shape[1], np.abs(self.neighbor_signs).sum(axis=1, dtype=np.int64).max(initial=0)))
+        self.color_classes = self.buildColoring()
+
+        self.rng = make_stream(random_seed if rng is None else rng)
 
         if random_init:
-            the_grid = self.initialize_grid()
-            self.grid = the_grid
+            self.grid = self.initialize_grid()
             if self.record_history:
-                self.grid_history = [copy.deepcopy(the_grid)]
+                self.grid_history = self.newHistory()
         else:
-            self.grid = self.loadGrid
+            self.grid = self.loadGrid.grid
             if self.record_history:
                 self.grid_history = self.loadGrid.grid_history
 
@@ -49,16 +77,202 @@ class Grid:
         """String representation of the Grid object."""
         return str(self.output(self.grid))
 
+    def __getstate__(self):
+        # self._grid is a view of self.flat_spins; copies and pickles rebuild it instead of storing a detached array
+        state = self.__dict__.copy()
+        del state['_grid']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._grid = self.flat_spins[:self.n_sites].reshape(self.n_x, self.n_y)
+
+    ### properties ###
+
+    @property
+    def grid(self):
+        return self._grid
+
+    @grid.setter
+    def grid(self, values):
+        """Copies values into the spin storage, zeroing any masked sites."""
+        self._grid[...] = self.output(values)
+        if self.mask is not None:
+            self._grid[~self.mask] = 0
+        self.recount()
+
     ### class methods ###
 
+    def recount(self):
+        """
+        Recomputes total_spin and bond_sum from scratch.
+        """
+        spins = self.flat_spins[:self.n_sites]
+        self.total_spin = int(np.sum(spins, dtype=np.int64))
+        # every link shows up once from each of its ends
+        self.bond_sum = int(np.dot(spins.astype(np.int64), self.neighborSums(slice(None)))) // 2
+
+    def verifyTotals(self):
+        """
+        Debugging check that the running totals agree with a full recount. Raises a RuntimeError if they don't.
+        """
+        running = (self.total_spin, self.bond_sum)
+        self.recount()
+        if running != (self.total_spin, self.bond_sum):
+            raise RuntimeError(f"Running totals (total_spin, bond_sum) = {running} drifted from the recount "
+                               f"{(self.total_spin, self.bond_sum)}")
+
+    def flip(self, sites, neighbor_sums=None):
+        """
+        Flips the given flat site indices and updates the running totals. No two of the sites may be neighbors
+        (a single site, or part of a color class), which makes the bond change just -2 * s_i * neighbor_sum_i.
+
+        Parameters
+            sites (int or np.array): flat indices of the sites to flip
+            neighbor_sums (int or np.array): their neighbor sums, if they are already known
+        """
+        spins = self.flat_spins[sites]
+        if neighbor_sums is None:
+            neighbor_sums = self.neighborSums(np.atleast_1d(sites))
+
+        self.total_spin -= 2 * int(np.sum(spins, dtype=np.int64))
+        self.bond_sum -= 2 * int(np.dot(spins, neighbor_sums))
+        self.flat_spins[sites] = -spins
+
+    def flipCluster(self, sites):
+        """
+        Flips an arbitrary set of distinct flat site indices and updates the running totals. Links inside the set
+        keep their value, only the links leaving it change sign.
+        """
+        in_cluster = np.zeros(self.n_sites + 1, dtype=bool)
+        in_cluster[sites] = True
+
+        spins = self.flat_spins[sites]
+        neighbors = self.neighbors[sites]
+        leaving = np.einsum('ij,ij->i', self.flat_spins[neighbors] * ~in_cluster[neighbors], self.neighbor_signs[sites], dtype=np.int64)
+
+        self.total_spin -= 2 * int(np.sum(spins, dtype=np.int64))
+        self.bond_sum -= 2 * int(np.dot(spins, leaving))
+        self.flat_spins[sites] = -spins
+
     def initialize_grid(self):
-        spins = np.random.choice([-1, 1], size=(self.n_x, self.n_y))
+        spins = self.rng.choice(np.array([-1, 1], dtype=np.int8), size=(self.n_x, self.n_y))
 
-        grid = np.empty((self.n_x, self.n_y), dtype=object)
-        for i, j in np.ndindex(self.n_x, self.n_y):
-            grid[i, j] = self.gridPointObject(i, j, spins[i, j])
+        if self.mask is not None:
+            spins[~self.mask] = 0
 
-        return grid
+        return spins
+
+    def newHistory(self):
+        """
+        Returns a new GridHistory (with the grid's history settings) whose first frame is the current grid.
+        """
+        history = GridHistory() if self.history_settings is None else GridHistory.like(self.history_settings)
+        history.reset(self.grid)
+        return history
+
+    def siteMask(self):
+        """
+        Returns the boolean (n_x, n_y) array of active sites, or None if every site is active.
+        Topologies with missing sites override this.
+        """
+        return None
+
+    def wrap(self, x_pos, y_pos):
+        """
+        Vectorized counterpart of getPoint used to build the neighbor table. Maps arrays of (possibly out of range)
+        coordinates onto the grid.
+
+        Returns
+            x_wrapped, y_wrapped (np.array): coordinates of the sites that are actually reached
+            sign (np.array): coupling sign of each link, 0 where there is no neighbor
+        """
+        inside = (0 <= x_pos) & (x_pos < self.n_x) & (0 <= y_pos) & (y_pos < self.n_y)
+        return np.clip(x_pos, 0, self.n_x - 1), np.clip(y_pos, 0, self.n_y - 1), inside.astype(np.int8)
+
+    def buildNeighbors(self):
+        """
+        Builds the neighbor table of the grid once. Neighbors are listed in the order up, down, left, right, i.e.
+        (i, j+1), (i, j-1), (i-1, j), (i+1, j), with flat site index i*n_y + j.
+
+        Returns
+            neighbors (np.array): (n_sites, 4) flat indices of the neighbors, self.sentinel where there is none
+            neighbor_signs (np.array): (n_sites, 4) int8 coupling signs of the links, 0 where there is no neighbor
+        """
+        x, y = np.divmod(np.arange(self.n_sites), self.n_y)
+
+        neighbors = np.empty((self.n_sites, 4), dtype=np.intp)
+        neighbor_signs = np.empty((self.n_sites, 4), dtype=np.int8)
+
+        for k, (dx, dy) in enumerate([(0, 1), (0, -1), (-1, 0), (1, 0)]):
+            x_wrapped, y_wrapped, sign = self.wrap(x + dx, y + dy)
+            neighbors[:, k] = x_wrapped * self.n_y + y_wrapped
+            neighbor_signs[:, k] = sign
+
+        if self.mask is not None:
+            active = self.mask.ravel()
+            neighbor_signs[~active[neighbors]] = 0
+            neighbor_signs[~active] = 0
+
+        neighbors[neighbor_signs == 0] = self.sentinel
+
+        return neighbors, neighbor_signs
+
+    def buildColoring(self):
+        """
+        Splits the active sites into classes of which no two sites are neighbors, so that a whole class can be updated
+        at once. The checkerboard (x + y) % 2 split is used wherever it is valid. Where a wrapped edge joins two sites
+        of the same color (odd periodic sizes, the Möbius seam) those sites are greedily recolored with the smallest
+        color none of their neighbors use, which adds at most a few extra, small classes.
+
+        Returns
+            color_classes (list of np.array): flat site indices of each color class
+        """
+        x, y = np.divmod(np.arange(self.n_sites), self.n_y)
+        colors = np.append((x + y) % 2, -1)
+
+        linked = self.neighbor_signs != 0
+        conflicts = np.flatnonzero(np.any(linked & (colors[self.neighbors] == colors[:-1, None]), axis=1))
+
+        for site in conflicts:
+            used = set(colors[self.neighbors[site]])
+            colors[site] = next(color for color in range(self.neighbors.shape[1] + 1) if color not in used)
+
+        colors = colors[self.active_sites]
+        return [self.active_sites[colors == color] for color in np.unique(colors)]
+
+    def adjacency(self):
+        """
+        Returns the links of the neighbor table in CSR form, the format GraphGrid is built from.
+
+        Returns
+            indptr (np.array): the links of site i are entries indptr[i]:indptr[i + 1]
+            indices (np.array): flat index of the neighbor of every link
+            signs (np.array): int8 coupling of every link
+        """
+        linked = self.neighbor_signs != 0
+        indptr = np.concatenate([[0], np.cumsum(linked.sum(axis=1))])
+        return indptr, self.neighbors[linked], self.neighbor_signs[linked]
+
+    def neighborSums(self, sites):
+        """
+        Returns the coupling weighted neighbor spin sums of the given flat site indices, gathered through the
+        neighbor table.
+        """
+        return np.einsum('ij,ij->i', self.flat_spins[self.neighbors[sites]], self.neighbor_signs[sites], dtype=np.int64)
+
+    def neighborSum(self):
+        """
+        Returns the (n_x, n_y) array of coupling weighted neighbor spin sums of every site.
+        """
+        return self.neighborSums(slice(None)).reshape(self.n_x, self.n_y)
+
+    def point(self, x_pos, y_pos):
+        """
+        Wraps the site (x_pos, y_pos) in a gridPointObject whose spin reads and writes straight through to self.grid.
+        The coordinates are assumed to already be inside the grid.
+        """
+        return self.gridPointObject(x_pos, y_pos, self.grid[x_pos, y_pos], lattice=self.grid)
 
     def getPoint(self, x_pos, y_pos):
 
@@ -72,25 +286,30 @@ class Grid:
         """
 
         if 0 <= x_pos < self.n_x and 0 <= y_pos < self.n_y:
-            return self.grid[x_pos, y_pos]
+            return self.point(x_pos, y_pos)
         else:
             return None
 
-    def output(self, grid):
+    def output(self, grid=None):
         
         """
-        Outputs the current grid as a 2D array of spins. 
+        Outputs a grid as a 2D array of spins. Spin arrays are returned as is (no copy), older object arrays of
+        grid points are converted.
+
+        Parameters
+            grid (2D np.array): grid state to output, defaults to the current grid
 
         Returns
-            grid_spins (2D np.array): 2D array of spins representing the current grid state
+            grid_spins (2D np.array): 2D array of spins representing the grid state
         """
 
-        grid_spins = np.zeros(grid.shape)
+        if grid is None:
+            grid = self.grid
+
+        if grid.dtype == object:
+            return np.frompyfunc(lambda point: point.spin, 1, 1)(grid).astype(np.int8)
 
-        for i in range(grid_spins.shape[0]):
-            for j in range(grid_spins.shape[1]):
-                grid_spins[i, j] = grid[i, j].spin
-        return grid_spins
+        return grid
     
     def resetGrid(self, grid=None):
         """
@@ -99,17 +318,55 @@ class Grid:
         if self.random_init:
             self.grid = self.initialize_grid()
             if self.record_history:
-                self.grid_history = [copy.deepcopy(self.grid)]
+                self.grid_history = self.newHistory()
         elif grid is not None:
+            if isinstance(grid, Grid):
+                grid = grid.grid
             self.grid = grid
             if self.record_history:
-                self.grid_history = [copy.deepcopy(grid)]
+                self.grid_history = self.newHistory()
         else:
             self.grid = self.loadGrid.grid
             if self.record_history:
                 self.grid_history = self.loadGrid.grid_history
         
 
+def hole_mask(n_x, n_y, hole_grid=None, c_x=None, c_y=None):
+    """
+    Returns a boolean (n_x, n_y) array that is True on the sites belonging to the hole of a HoleGrid. Without a
+    hole_grid pattern the hole is a 3x3 block in the middle, otherwise the pattern is centered on (c_x, c_y).
+    """
+    hole = np.zeros((n_x, n_y), dtype=bool)
+
+    # --- Default hole ---
+    if hole_grid is None:
+        cx, cy = n_x // 2, n_y // 2
+        size = 3 if n_x >= 3 and n_y >= 3 else 1
+        half = size // 2
+
+        x_slice = slice(max(0, cx - half), min(n_x, cx + half + 1))
+        y_slice = slice(max(0, cy - half), min(n_y, cy + half + 1))
+        hole[x_slice, y_slice] = True
+
+    # --- Custom hole pattern ---
+    else:
+        hole_h, hole_w = hole_grid.shape
+        cx = n_x // 2 if c_x is None else c_x
+        cy = n_y // 2 if c_y is None else c_y
+
+        hx0 = max(0, cx - hole_h // 2)
+        hy0 = max(0, cy - hole_w // 2)
+        hx1 = min(n_x, hx0 + hole_h)
+        hy1 = min(n_y, hy0 + hole_w)
+
+        hole_slice_x = slice(0, hx1 - hx0)
+        hole_slice_y = slice(0, hy1 - hy0)
+
+        hole[hx0:hx1, hy0:hy1] = hole_grid[hole_slice_x, hole_slice_y] != 0
+
+    return hole
+
+
 #We will have a Hole, Möbius, Cylinder, and Torus
 class HoleGrid(Grid):
 
@@ -122,6 +379,7 @@ class HoleGrid(Grid):
         gridPointObject (Class): The class object representing a grid point
         random_init (bool): Whether to initialize the grid randomly
         random_seed (int): Seed for random number generation
+        rng (RandomStream): Random stream used instead of random_seed, see Grid
         loadGrid (Grid): An existing Grid object to load from
         hole_grid (2D np.array): Optional custom hole grid configuration
         c_x (int): x-coordinate of the center of the hole (optional)
@@ -129,42 +387,24 @@ class HoleGrid(Grid):
     
     """
 
-    def __init__(self, n_x, n_y, gridPointObject, random_init=True, random_seed=None, loadGrid=None, hole_grid=None, c_x = None, c_y = None, record_history=True):
-        super().__init__(n_x, n_y, gridPointObject, random_init, random_seed, loadGrid, record_history=record_history)
+    def __init__(self, n_x, n_y, gridPointObject, random_init=True, random_seed=None, loadGrid=None, hole_grid=None, c_x = None, c_y = None, record_history=True, rng=None):
 
+        # the hole has to be known before the grid builds its mask and neighbor table
         self.hole_grid = hole_grid
         self.c_x = c_x
         self.c_y = c_y
 
-        self.hole_point = gridPointObject(x=c_x,y=c_y,spin=0)
-
-        # --- Default hole ---
-        if hole_grid is None:
-            cx, cy = self.n_x // 2, self.n_y // 2
-            size = 3 if self.n_x >= 3 and self.n_y >= 3 else 1
-            half = size // 2
+        super().__init__(n_x, n_y, gridPointObject, random_init, random_seed, loadGrid, record_history=record_history, rng=rng)
 
-            x_slice = slice(max(0, cx - half), min(self.n_x, cx + half + 1))
-            y_slice = slice(max(0, cy - half), min(self.n_y, cy + half + 1))
-            self.grid[x_slice, y_slice] = self.hole_point
-
-        # --- Custom hole pattern ---
-        else:
-            hole_h, hole_w = hole_grid.shape
-            cx = self.n_x // 2 if c_x is None else c_x
-            cy = self.n_y // 2 if c_y is None else c_y
-
-            hx0 = max(0, cx - hole_h // 2)
-            hy0 = max(0, cy - hole_w // 2)
-            hx1 = min(self.n_x, hx0 + hole_h)
-            hy1 = min(self.n_y, hy0 + hole_w)
-
-            hole_slice_x = slice(0, hx1 - hx0)
-            hole_slice_y = slice(0, hy1 - hy0)
-
-            mask = hole_grid[hole_slice_x, hole_slice_y] != 0
-            self.grid[hx0:hx1, hy0:hy1][mask] = self.hole_point
+    def siteMask(self):
+        """Every site outside the hole is active."""
+        return ~self.holeMask()
 
+    def holeMask(self):
+        """
+        Returns a boolean (n_x, n_y) array that is True on the sites belonging to the hole.
+        """
+        return hole_mask(self.n_x, self.n_y, self.hole_grid, self.c_x, self.c_y)
 
     def getPoint(self, x_pos, y_pos):
             """
@@ -174,48 +414,7 @@ class HoleGrid(Grid):
             if not (0 <= x_pos < self.n_x and 0 <= y_pos < self.n_y):
                 return None
 
-            value = self.grid[x_pos, y_pos]
-
-            return None if value.spin == 0 else value
-    
-    def resetGrid(self):
-        """Overridden resetGrid method to account for the hole."""
-        if self.random_init:
-            new_grid = self.initialize_grid()
-
-            if self.hole_grid is None:
-                cx, cy = self.n_x // 2, self.n_y // 2
-                size = 3 if self.n_x >= 3 and self.n_y >= 3 else 1
-                half = size // 2
-
-                x_slice = slice(max(0, cx - half), min(self.n_x, cx + half + 1))
-                y_slice = slice(max(0, cy - half), min(self.n_y, cy + half + 1))
-                new_grid[x_slice, y_slice] = self.hole_point
-
-            else:
-                hole_h, hole_w = self.hole_grid.shape
-                cx = self.n_x // 2 if self.c_x is None else self.c_x
-                cy = self.n_y // 2 if self.c_y is None else self.c_y
-
-                hx0 = max(0, cx - hole_h // 2)
-                hy0 = max(0, cy - hole_w // 2)
-                hx1 = min(self.n_x, hx0 + hole_h)
-                hy1 = min(self.n_y, hy0 + hole_w)
-
-                hole_slice_x = slice(0, hx1 - hx0)
-                hole_slice_y = slice(0, hy1 - hy0)
-
-                mask = self.hole_grid[hole_slice_x, hole_slice_y] != 0
-                new_grid[hx0:hx1, hy0:hy1][mask] = self.hole_point
-
-            self.grid = new_grid
-
-            if self.record_history:
-                self.grid_history = [copy.deepcopy(new_grid)]
-        else:
-            self.grid = self.loadGrid.grid
-            if self.record_history:
-                self.grid_history = self.loadGrid.grid_history
+            return self.point(x_pos, y_pos) if self.mask[x_pos, y_pos] else None
 
 
 class Torus(Grid):
@@ -227,11 +426,12 @@ class Torus(Grid):
         gridPointObject (Class): The class object representing a grid point
         random_init (bool): Whether to initialize the grid randomly
         random_seed (int): Seed for random number generation
+        rng (RandomStream): Random stream used instead of random_seed, see Grid
         loadGrid (Grid): An existing Grid object to load from
     """
 
-    def __init__(self, n_x, n_y, gridPointObject, random_init=True, random_seed=None, loadGrid=None, record_history=True):
-        super().__init__(n_x, n_y, gridPointObject, random_init, random_seed, loadGrid, record_history=record_history)
+    def __init__(self, n_x, n_y, gridPointObject, random_init=True, random_seed=None, loadGrid=None, record_history=True, rng=None):
+        super().__init__(n_x, n_y, gridPointObject, random_init, random_seed, loadGrid, record_history=record_history, rng=rng)
 
     def getPoint(self, x_pos, y_pos):
         """
@@ -242,11 +442,15 @@ class Torus(Grid):
         x_wrapped = x_pos % self.n_x
         y_wrapped = y_pos % self.n_y
 
-        return self.grid[x_wrapped, y_wrapped]
+        return self.point(x_wrapped, y_wrapped)
+
+    def wrap(self, x_pos, y_pos):
+        """Vectorized wrapping around both edges."""
+        return x_pos % self.n_x, y_pos % self.n_y, np.ones(np.shape(x_pos), dtype=np.int8)
     
 class Cylinder(Grid):
-    def __init__(self, n_x, n_y, gridPointObject, random_init=True, random_seed=None, loadGrid=None, record_history=True):
-        super().__init__(n_x, n_y, gridPointObject, random_init, random_seed, loadGrid, record_history=record_history)
+    def __init__(self, n_x, n_y, gridPointObject, random_init=True, random_seed=None, loadGrid=None, record_history=True, rng=None):
+        super().__init__(n_x, n_y, gridPointObject, random_init, random_seed, loadGrid, record_history=record_history, rng=rng)
 
     
 
@@ -258,9 +462,14 @@ class Cylinder(Grid):
 
         if 0 <= x_pos < self.n_x:
             y_wrapped = y_pos % self.n_y
-            return self.grid[x_pos, y_wrapped]
+            return self.point(x_pos, y_wrapped)
         else:
             return None
+
+    def wrap(self, x_pos, y_pos):
+        """Vectorized wrapping around the y edges, bounded in x."""
+        inside = (0 <= x_pos) & (x_pos < self.n_x)
+        return np.clip(x_pos, 0, self.n_x - 1), y_pos % self.n_y, inside.astype(np.int8)
         
 
 class Mobius(Grid):
@@ -272,11 +481,15 @@ class Mobius(Grid):
         gridPointObject (Class): The class object representing a grid point
         random_init (bool): Whether to initialize the grid randomly
         random_seed (int): Seed for random number generation
+        rng (RandomStream): Random stream used instead of random_seed, see Grid
         loadGrid (Grid): An existing Grid object to load from
+        seam_sign (int): Coupling sign of the links crossing the twisted seam. +1 treats spins as scalars, -1 treats
+            them as oriented along the local surface normal, which flips going around the strip.
     """
 
-    def __init__(self, n_x, n_y, gridPointObject, random_init=True, random_seed=None, loadGrid=None, record_history=True):
-        super().__init__(n_x, n_y, gridPointObject, random_init, random_seed, loadGrid, record_history=record_history)
+    def __init__(self, n_x, n_y, gridPointObject, random_init=True, random_seed=None, loadGrid=None, record_history=True, seam_sign=1, rng=None):
+        self.seam_sign = seam_sign
+        super().__init__(n_x, n_y, gridPointObject, random_init, random_seed, loadGrid, record_history=record_history, rng=rng)
 
     def getPoint(self, x_pos, y_pos):
         """
@@ -303,7 +516,224 @@ class Mobius(Grid):
                 y_wrapped = y_pos
                 x_wrapped = x_pos
 
-            return self.grid[x_wrapped, y_wrapped]
+            return self.point(x_wrapped, y_wrapped)
         else:
             return None
 
+    def wrap(self, x_pos, y_pos):
+        """Vectorized Möbius wrapping: links crossing the y seam are mirrored in x and carry seam_sign."""
+        inside = (0 <= x_pos) & (x_pos < self.n_x)
+        crossed = (y_pos < 0) | (y_pos >= self.n_y)
+
+        x_wrapped = np.where(crossed, (self.n_x - 1) - x_pos, x_pos)
+        sign = np.where(crossed, self.seam_sign, 1) * inside
+
+        return np.clip(x_wrapped, 0, self.n_x - 1), y_pos % self.n_y, sign.astype(np.int8)
+
+
+class GraphGrid(Grid):
+    """
+    Represents an Ising model on an arbitrary graph, given as a sparse adjacency in CSR form: the neighbors of site i
+    are indices[indptr[i]:indptr[i + 1]]. Every link has an integer coupling sign * weight. Sites are still laid out
+    on an (n_x, n_y) array (shape), so the grid history, trajectories and plots work as for the other topologies.
+
+    The CSR rows are padded into the neighbor table once (missing slots point at the always zero ghost site), so every
+    update rule and observable of ClassicIsing runs on the graph unchanged. See the factory functions below
+    (grid_graph, hole_graph, torus_graph, cylinder_graph, mobius_graph, klein_graph, triangular_graph) for examples.
+
+    Parameters
+        indptr (np.array): CSR row pointers, of length n_sites + 1
+        indices (np.array): CSR column indices, the flat index of the neighbor of every link
+        gridPointObject (Class): The class object representing a grid point
+        signs (np.array): Coupling sign of every link, +1 by default
+        weights (np.array): Integer coupling weight of every link, 1 by default
+        shape (tuple): (n_x, n_y) layout of the sites, (n_sites, 1) by default
+        mask (2D np.array): Optional boolean array of active sites, inactive sites hold spin 0 and lose their links
+        random_init (bool): Whether to initialize the grid randomly
+        random_seed (int): Seed for random number generation
+        rng (RandomStream): Random stream used instead of random_seed, see Grid
+        loadGrid (Grid): An existing Grid object to load from
+        record_history (bool or GridHistory): Whether to record the history of grid states over time
+
+    The adjacency has to be symmetric: if j is a neighbor of i with coupling c, i is a neighbor of j with coupling c.
+    Couplings have to be integers (the Metropolis acceptance table is indexed by the integer neighbor sum) that fit
+    in an int8.
+    """
+
+    def __init__(self, indptr, indices, gridPointObject, signs=None, weights=None, shape=None, mask=None, random_init=True, random_seed=None, loadGrid=None, record_history=True, rng=None):
+
+        indptr = np.asarray(indptr, dtype=np.intp)
+        indices = np.asarray(indices, dtype=np.intp)
+        n_sites = len(indptr) - 1
+
+        couplings = np.ones(len(indices), dtype=np.int64)
+        if signs is not None:
+            couplings *= np.asarray(signs, dtype=np.int64)
+        if weights is not None:
+            weights = np.asarray(weights)
+            if not np.array_equal(weights, np.round(weights)):
+                raise ValueError("GraphGrid coupling weights have to be integers")
+            couplings *= weights.astype(np.int64)
+        if np.any(np.abs(couplings) > np.iinfo(np.int8).max):
+            raise ValueError("GraphGrid couplings have to fit in an int8")
+
+        if shape is None:
+            shape = (n_sites, 1)
+        if shape[0] * shape[1] != n_sites:
+            raise ValueError(f"GraphGrid shape {shape} does not match the {n_sites} sites of the adjacency")
+        if np.any((indices < 0) | (indices >= n_sites)):
+            raise ValueError("GraphGrid adjacency refers to sites outside of the graph")
+
+        # the graph has to be known before the grid builds its mask and neighbor table
+        self.indptr = indptr
+        self.indices = indices
+        self.couplings = couplings.astype(np.int8)
+        self.site_mask = None if mask is None else np.asarray(mask, dtype=bool).reshape(shape)
+
+        self.checkSymmetric()
+
+        super().__init__(shape[0], shape[1], gridPointObject, random_init, random_seed, loadGrid, record_history=record_history, rng=rng)
+
+    def checkSymmetric(self):
+        """
+        Raises a ValueError unless every link i -> j with coupling c has a matching link j -> i with coupling c.
+        """
+        rows = np.repeat(np.arange(len(self.indptr) - 1), np.diff(self.indptr))
+
+        forward = np.lexsort((self.couplings, self.indices, rows))
+        backward = np.lexsort((self.couplings, rows, self.indices))
+
+        if not (np.array_equal(rows[forward], self.indices[backward])
+                and np.array_equal(self.indices[forward], rows[backward])
+                and np.array_equal(self.couplings[forward], self.couplings[backward])):
+            raise ValueError("GraphGrid adjacency has to be symmetric, with equal couplings in both directions")
+
+    def siteMask(self):
+        return self.site_mask
+
+    def buildNeighbors(self):
+        """
+        Pads the CSR rows into the (n_sites, max_degree) neighbor table. Links with coupling 0 are dropped.
+
+        Returns
+            neighbors (np.array): (n_sites, max_degree) flat indices of the neighbors, self.sentinel where there is none
+            neighbor_signs (np.array): (n_sites, max_degree) int8 couplings of the links, 0 where there is no neighbor
+        """
+        degree = np.diff(self.indptr)
+        rows = np.repeat(np.arange(self.n_sites), degree)
+        slots = np.arange(len(self.indices)) - self.indptr[rows]
+
+        neighbors = np.full((self.n_sites, degree.max(initial=0)), self.sentinel, dtype=np.intp)
+        neighbor_signs = np.zeros((self.n_sites, degree.max(initial=0)), dtype=np.int8)
+        neighbors[rows, slots] = self.indices
+        neighbor_signs[rows, slots] = self.couplings
+
+        if self.mask is not None:
+            active = np.append(self.mask.ravel(), False)
+            neighbor_signs[~active[neighbors]] = 0
+            neighbor_signs[~active[:-1]] = 0
+
+        neighbors[neighbor_signs == 0] = self.sentinel
+
+        return neighbors, neighbor_signs
+
+    def getPoint(self, x_pos, y_pos):
+        """
+        Returns the point at (x_pos, y_pos) of the site layout, None outside of it or on an inactive site. Which
+        sites are neighbors is up to the adjacency, not to the layout.
+        """
+        if not (0 <= x_pos < self.n_x and 0 <= y_pos < self.n_y):
+            return None
+        if self.mask is not None and not self.mask[x_pos, y_pos]:
+            return None
+
+        return self.point(x_pos, y_pos)
+
+
+def lattice_adjacency(n_x, n_y, periodic_x=False, periodic_y=False, twisted=False, seam_sign=1, diagonal=False):
+    """
+    Builds the CSR adjacency of a square lattice with flat site index i*n_y + j. Each site links to (i, j+1), (i, j-1),
+    (i-1, j), (i+1, j) in that order (the order of Grid.buildNeighbors), plus (i+1, j+1) and (i-1, j-1) with
+    diagonal, which turns it into a triangular lattice.
+
+    Parameters
+        n_x, n_y (int): Lattice size
+        periodic_x, periodic_y (bool): Whether the lattice wraps around the x and the y edges
+        twisted (bool): Links crossing the y edges are mirrored in x (Möbius strip, or Klein bottle if periodic_x)
+        seam_sign (int): Coupling sign of the twisted links
+        diagonal (bool): Whether to add the (+1, +1) diagonal
+
+    Returns
+        indptr, indices, signs (np.array): the adjacency, see GraphGrid
+    """
+    x, y = np.divmod(np.arange(n_x * n_y), n_y)
+
+    steps = [(0, 1), (0, -1), (-1, 0), (1, 0)]
+    if diagonal:
+        steps += [(1, 1), (-1, -1)]
+
+    indices = np.empty((n_x * n_y, len(steps)), dtype=np.intp)
+    signs = np.empty((n_x * n_y, len(steps)), dtype=np.int8)
+
+    for k, (dx, dy) in enumerate(steps):
+        x_pos, y_pos = x + dx, y + dy
+        sign = np.ones(n_x * n_y, dtype=np.int8)
+
+        crossed = (y_pos < 0) | (y_pos >= n_y)
+        if twisted:
+            x_pos = np.where(crossed, (n_x - 1) - x_pos, x_pos)
+            sign[crossed] = seam_sign
+        if not periodic_y:
+            sign[crossed] = 0
+        if not periodic_x:
+            sign[(x_pos < 0) | (x_pos >= n_x)] = 0
+
+        indices[:, k] = (x_pos % n_x) * n_y + y_pos % n_y
+        signs[:, k] = sign
+
+    linked = signs != 0
+    indptr = np.concatenate([[0], np.cumsum(linked.sum(axis=1))])
+    return indptr, indices[linked], signs[linked]
+
+
+def grid_graph(n_x, n_y, gridPointObject, **kwargs):
+    """GraphGrid with the open boundaries of Grid."""
+    indptr, indices, signs = lattice_adjacency(n_x, n_y)
+    return GraphGrid(indptr, indices, gridPointObject, signs=signs, shape=(n_x, n_y), **kwargs)
+
+
+def hole_graph(n_x, n_y, gridPointObject, hole_grid=None, c_x=None, c_y=None, **kwargs):
+    """GraphGrid with the open boundaries and the hole of HoleGrid."""
+    mask = ~hole_mask(n_x, n_y, hole_grid, c_x, c_y)
+    indptr, indices, signs = lattice_adjacency(n_x, n_y)
+    return GraphGrid(indptr, indices, gridPointObject, signs=signs, shape=(n_x, n_y), mask=mask, **kwargs)
+
+
+def torus_graph(n_x, n_y, gridPointObject, **kwargs):
+    """GraphGrid wrapping around both edges, like Torus."""
+    indptr, indices, signs = lattice_adjacency(n_x, n_y, periodic_x=True, periodic_y=True)
+    return GraphGrid(indptr, indices, gridPointObject, signs=signs, shape=(n_x, n_y), **kwargs)
+
+
+def cylinder_graph(n_x, n_y, gridPointObject, **kwargs):
+    """GraphGrid wrapping around the y edges, like Cylinder."""
+    indptr, indices, signs = lattice_adjacency(n_x, n_y, periodic_y=True)
+    return GraphGrid(indptr, indices, gridPointObject, signs=signs, shape=(n_x, n_y), **kwargs)
+
+
+def mobius_graph(n_x, n_y, gridPointObject, seam_sign=1, **kwargs):
+    """GraphGrid wrapping around the y edges with a twist, like Mobius."""
+    indptr, indices, signs = lattice_adjacency(n_x, n_y, periodic_y=True, twisted=True, seam_sign=seam_sign)
+    return GraphGrid(indptr, indices, gridPointObject, signs=signs, shape=(n_x, n_y), **kwargs)
+
+
+def klein_graph(n_x, n_y, gridPointObject, seam_sign=1, **kwargs):
+    """GraphGrid of a Klein bottle: wraps around the x edges, and around the y edges with a twist."""
+    indptr, indices, signs = lattice_adjacency(n_x, n_y, periodic_x=True, periodic_y=True, twisted=True, seam_sign=seam_sign)
+    return GraphGrid(indptr, indices, gridPointObject, signs=signs, shape=(n_x, n_y), **kwargs)
+
+
+def triangular_graph(n_x, n_y, gridPointObject, periodic=True, **kwargs):
+    """GraphGrid of a triangular lattice (6 neighbors per site), periodic in both directions by default."""
+    indptr, indices, signs = lattice_adjacency(n_x, n_y, periodic_x=periodic, periodic_y=periodic, diagonal=True)
+    return GraphGrid(indptr, indices, gridPointObject, signs=signs, shape=(n_x, n_y), **kwargs)
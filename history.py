@@ -0,0 +1,148 @@
+import numpy as np
+from collections import deque
+
+
+class GridHistory:
+    """
+    Compact, bounded record of grid states. Frames go in as int8 spin arrays and come back out as int8 spin arrays,
+    so a GridHistory can be used wherever a list of grids was used before (indexing, len, iteration).
+
+    Parameters
+        stride (int): Only every stride-th sweep passed to record is kept
+        capacity (int): Maximum number of frames kept, the oldest frames are dropped first. None keeps every frame
+        packing (str): 'int8' keeps frames as int8 arrays, 'bits' packs the spin signs 8 sites per byte
+        delta (bool): Whether to store only the indices of the flipped sites between consecutive frames
+        keyframe_interval (int): With delta encoding a full frame is still stored every keyframe_interval frames,
+            which bounds the work of decoding a single frame
+    """
+
+    def __init__(self, stride=1, capacity=None, packing='int8', delta=False, keyframe_interval=50):
+
+        if packing not in ('int8', 'bits'):
+            raise ValueError(f"Unknown packing '{packing}', expected 'int8' or 'bits'")
+
+        self.stride = stride
+        self.capacity = capacity
+        self.packing = packing
+        self.delta = delta
+        self.keyframe_interval = keyframe_interval
+
+        self.reset()
+
+    ### overloaded methods ###
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('GridHistory index out of range')
+
+        # walk back to the closest full frame and replay the flips from there
+        start = index
+        while self.frames[start][0] == 'delta':
+            start -= 1
+
+        frame = self.unpack(self.frames[start][1])
+        for i in range(start + 1, index + 1):
+            frame.ravel()[self.frames[i][1]] *= -1
+
+        return frame
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    ### class methods ###
+
+    @classmethod
+    def like(cls, template):
+        """Returns a new, empty GridHistory with the same settings as template."""
+        return cls(template.stride, template.capacity, template.packing, template.delta, template.keyframe_interval)
+
+    def reset(self, frame=None):
+        """
+        Clears all frames and the sweep counter. If a frame is given it becomes the first frame.
+        """
+        self.frames = deque()
+        self.sweeps = 0
+        self.shape = None
+        self.zero_sites = None
+        self.last = None
+        self.since_keyframe = 0
+
+        if frame is not None:
+            self.append(frame)
+
+    def record(self, frame):
+        """
+        Called once per sweep, stores the frame if the sweep falls on the stride.
+        """
+        self.sweeps += 1
+        if self.sweeps % self.stride == 0:
+            self.append(frame)
+
+    def append(self, frame):
+        """
+        Stores a frame, regardless of the stride.
+        """
+        frame = np.asarray(frame, dtype=np.int8)
+
+        if self.shape is None:
+            self.shape = frame.shape
+            # masked sites (spin 0) never change, the bit packing only needs to remember where they are once
+            zero_sites = np.flatnonzero(frame == 0)
+            self.zero_sites = zero_sites if zero_sites.size else None
+
+        if self.capacity is not None and len(self.frames) >= self.capacity:
+            self.dropOldest()
+
+        if self.delta and self.last is not None and self.since_keyframe < self.keyframe_interval:
+            flipped = np.flatnonzero(frame.ravel() != self.last.ravel()).astype(np.int32)
+            self.frames.append(('delta', flipped))
+            self.since_keyframe += 1
+        else:
+            self.frames.append(('key', self.pack(frame)))
+            self.since_keyframe = 0
+
+        if self.delta:
+            self.last = frame.copy()
+
+    def dropOldest(self):
+        """Drops the oldest frame, turning the next frame into a full frame if it was stored as flips."""
+        if len(self.frames) > 1 and self.frames[1][0] == 'delta':
+            self.frames[1] = ('key', self.pack(self[1]))
+        self.frames.popleft()
+
+    def pack(self, frame):
+        if self.packing == 'bits':
+            return np.packbits(frame.ravel() > 0)
+        return frame.copy()
+
+    def unpack(self, packed):
+        if self.packing == 'int8':
+            return packed.copy()
+
+        n_sites = int(np.prod(self.shape))
+        frame = 2 * np.unpackbits(packed, count=n_sites).astype(np.int8) - 1
+        if self.zero_sites is not None:
+            frame[self.zero_sites] = 0
+        return frame.reshape(self.shape)
+
+    def stack(self, start=0, stop=None, step=1):
+        """
+        Returns the frames start:stop:step as one (n_frames, n_x, n_y) int8 array.
+        """
+        frames = self[start:stop:step]
+        if not frames:
+            return np.empty((0,) + (self.shape or (0, 0)), dtype=np.int8)
+        return np.stack(frames)
+
+    def nbytes(self):
+        """Memory used by the stored frames, in bytes."""
+        return sum(data.nbytes for _, data in self.frames)
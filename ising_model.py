@@ -1,5 +1,71 @@
 import numpy as np
-import copy
+from functools import lru_cache
+from trajectory import TrajectoryWriter
+from multispin import MultiSpinLattice
+from domain_decomposition import run_decomposed
+from observables import ObservableRecorder
+from random_streams import make_stream, stream_arrays, stream_from_arrays, stream_state
+from measurements import MeasurementSeries
+from checkpoint import (Checkpointer, write_checkpoint, read_checkpoint, grid_checkpoint, build_grid,
+                        measurement_checkpoint, build_measurement, recorder_checkpoint, build_recorder)
+
+
+def sweep_rule(method):
+    """
+    Marks an update rule that advances the whole grid by one sweep on its own, instead of acting on a single point.
+    ClassicIsing.update calls such rules once per update rather than once per randomly chosen point.
+    """
+    method.is_sweep = True
+    return method
+
+
+def acceptance_table(magnetic_moment, beta, J, h, max_degree):
+    """
+    Tabulates Metropolis acceptance probabilities. With nearest neighbor coupling the neighbor sum of a site only
+    takes the integer values -max_degree..max_degree, so together with the spin and the (uniform) external field it
+    fixes the energy change of a flip:
+
+        table[..., spin + 1, neighbor_sum + max_degree] = min(1, exp(-beta * dE))
+        dE = 2 * spin * magnetic_moment * (J * neighbor_sum + h)
+
+    The row of spin 0 (masked sites) is never used. beta and h may be arrays (e.g. one value per replica), their
+    broadcast shape is prepended to the (3, 2 * max_degree + 1) table.
+    """
+    beta = np.asarray(beta, dtype=float)[..., None, None]
+    h = np.asarray(h, dtype=float)[..., None, None]
+
+    spins = np.array([-1, 0, 1])[:, None]
+    neighbor_sums = np.arange(-max_degree, max_degree + 1)[None, :]
+
+    deltaE = 2 * spins * magnetic_moment * (J * neighbor_sums + h)
+    return np.exp(-np.maximum(deltaE, 0) * beta)
+
+
+def _connected_components(n_nodes, u, v):
+    """
+    Labels the connected components of the graph on n_nodes nodes with edges (u[k], v[k]). Works as a vectorized
+    union-find: every round hooks the larger root of each edge onto the smaller one and then compresses all paths by
+    pointer jumping, so each node's label ends up as the smallest node index in its component.
+    """
+    labels = np.arange(n_nodes)
+
+    while True:
+        label_u, label_v = labels[u], labels[v]
+        differ = label_u != label_v
+        if not differ.any():
+            return labels
+
+        # edges whose ends already share a root stay inside one tree from now on
+        u, v = u[differ], v[differ]
+        label_u, label_v = label_u[differ], label_v[differ]
+        np.minimum.at(labels, np.maximum(label_u, label_v), np.minimum(label_u, label_v))
+
+        while True:
+            parents = labels[labels]
+            if np.array_equal(parents, labels):
+                break
+            labels = parents
+
 
 class ClassicIsing: 
 
@@ -11,47 +77,202 @@ class ClassicIsing:
         temperature (float): The temperature of the system
         ferromagnetivity (float): Coupling strength of magnetic moments.
         Mf_External (float): External magnetic field applied to the system
+        check_observables (bool): Debugging option, compares the running magnetization and energy totals with a
+            full recount after every update
+        rng (RandomStream, np.random.Generator, SeedSequence or int): Random stream of the updates, the grid's
+            stream (grid.rng) by default
     """
 
-    def __init__(self, grid, temperature, ferromagnetivity, Mf_External):
+    def __init__(self, grid, temperature, ferromagnetivity, Mf_External, check_observables=False, rng=None):
 
         self.grid = grid
+        self.rng = grid.rng if rng is None else make_stream(rng)
 
-        self.temperature = temperature
-        self.ferromagnetivity = ferromagnetivity
+        # set the raw values first, the acceptance table is built once all of them are known
+        self._temperature = temperature
+        self._ferromagnetivity = ferromagnetivity
         self.Boltzmann = 1.380649*10**-23 # J/K
         
-        self.ExternalMagneticField = Mf_External
+        self._ExternalMagneticField = Mf_External
+
+        # flipping a spin costs 2 * spin * magnetic_moment * effective_field
+        self.magnetic_moment = grid.gridPointObject.magnetic_moment
+
+        # on-disk trajectory (TrajectoryWriter) the sweeps are appended to, see recordTrajectory
+        self.trajectory = None
+
+        self.check_observables = check_observables
+
+        # sweeps run so far, the series of the last measure call and the periodic checkpoint writer (see checkpointEvery)
+        self.sweeps = 0
+        self.measurement = None
+        self.checkpointer = None
+
+        self.buildAcceptanceTable()
 
     ### overloaded methods ###
 
     def __str__(self):
         """String representation of the ClassicIsing object."""
         return print(self.grid)
+
+    def __getstate__(self):
+        # copies of a model (e.g. the equilibrator's ensembles) must not append to the same trajectory file
+        state = self.__dict__.copy()
+        state['trajectory'] = None
+        state['checkpointer'] = None
+        return state
+
+    ### properties ###
+    # changing any of these invalidates the acceptance table, so their setters rebuild it
+
+    @property
+    def temperature(self):
+        return self._temperature
+
+    @temperature.setter
+    def temperature(self, value):
+        self._temperature = value
+        self.buildAcceptanceTable()
+
+    @property
+    def ferromagnetivity(self):
+        return self._ferromagnetivity
+
+    @ferromagnetivity.setter
+    def ferromagnetivity(self, value):
+        self._ferromagnetivity = value
+        self.buildAcceptanceTable()
+
+    @property
+    def ExternalMagneticField(self):
+        return self._ExternalMagneticField
+
+    @ExternalMagneticField.setter
+    def ExternalMagneticField(self, value):
+        self._ExternalMagneticField = value
+        self.buildAcceptanceTable()
+
+    @property
+    def total_spin(self):
+        """Signed sum of all spins, kept up to date by the grid on every flip."""
+        return self.grid.total_spin
+
+    @property
+    def energy(self):
+        """
+        Total energy -magnetic_moment * (J * sum over links of sign * s_i * s_j + h * sum of spins), from the grid's
+        running totals.
+        """
+        return -self.magnetic_moment * (self.ferromagnetivity * self.grid.bond_sum + self.ExternalMagneticField * self.grid.total_spin)
     
     ### class methods ###
 
+    def buildAcceptanceTable(self):
+        """
+        Tabulates the Metropolis acceptance probabilities (see acceptance_table), indexed as
+        acceptance[spin + 1, neighbor_sum + max_degree], and the Fortuin-Kasteleyn bond probabilities of the cluster
+        updates, indexed by the magnitude of a link's (integer) coupling sign, see bondProbabilities. Called
+        automatically whenever the temperature, coupling or external field changes.
+        """
+        self.max_degree = self.grid.max_degree
+        beta = 1 / (self.Boltzmann * self.temperature)
+
+        self.acceptance = acceptance_table(self.magnetic_moment, beta, self.ferromagnetivity, self.ExternalMagneticField, self.max_degree)
+
+        # neighbor_signs are int8, so every coupling magnitude is below 128
+        magnitudes = np.arange(128)
+        self.bond_probability = -np.expm1(-2 * beta * self.magnetic_moment * abs(self.ferromagnetivity) * magnitudes)
+
     def update(self, update_rule):
 
         """
         Updates grid based on an update_rule.
 
         Parameters
-            update_rule (method): Takes in an update rule to change grid between time steps
+            update_rule (method or str): Takes in an update rule to change grid between time steps. Either a method
+                acting on a single point (e.g. self.metropolis), a sweep rule (e.g. self.checkerboard) or the name of
+                one of them.
         """
 
-        # select NxN random points with a probability of 1/N^2 to apply the update rule to.
-        N = self.grid.n_x * self.grid.n_y
-        for _ in range(N):
-            rand_x = np.random.randint(0, self.grid.n_x)
-            rand_y = np.random.randint(0, self.grid.n_y)
-            point = self.grid.getPoint(rand_x, rand_y)
-            if point is not None:
-                update_rule(point)
-                
+        if isinstance(update_rule, str):
+            update_rule = getattr(self, update_rule)
+
+        if getattr(update_rule, 'is_sweep', False):
+            update_rule()
+        else:
+            # select NxN random points with a probability of 1/N^2 to apply the update rule to, drawn in bulk.
+            N = self.grid.n_x * self.grid.n_y
+            rand_xs = self.rng.integers(self.grid.n_x, size=N).tolist()
+            rand_ys = self.rng.integers(self.grid.n_y, size=N).tolist()
+            for rand_x, rand_y in zip(rand_xs, rand_ys):
+                point = self.grid.getPoint(rand_x, rand_y)
+                if point is not None:
+                    update_rule(point)
+
+        self.recordSweep()
+
+    def recordSweep(self):
+        """
+        Bookkeeping after every sweep: the sweep counter, the optional consistency check, the grid history, the
+        trajectory and the periodic checkpoints.
+        """
+        self.sweeps += 1
+
+        if self.check_observables:
+            self.grid.verifyTotals()
+
         if self.grid.record_history:
-            self.grid.grid_history.append(copy.deepcopy(self.grid.grid))
+            self.grid.grid_history.record(self.grid.grid)
+
+        if self.trajectory is not None:
+            self.trajectory.record(self.grid.grid)
+
+        if self.checkpointer is not None:
+            self.checkpointer.step()
             
+    def recordTrajectory(self, path, stride=1, capacity=1024):
+        """
+        Starts appending the grid to a memory mapped trajectory on disk every stride sweeps, starting with the current
+        grid. The header records the topology, lattice size, temperature, coupling, field and the random stream states
+        at the first frame, so the run can be reproduced from the first frame and the metadata alone. Read it back
+        with trajectory.TrajectoryReader.
+
+        Parameters
+            path (str): Path of the trajectory, without extension
+            stride (int): Record every stride-th sweep
+            capacity (int): Number of frames preallocated on disk, the file grows when they run out
+
+        Returns
+            trajectory (TrajectoryWriter): the writer, also stored as self.trajectory
+        """
+        self.stopTrajectory()
+
+        metadata = {
+            'topology': type(self.grid).__name__,
+            'n_x': self.grid.n_x,
+            'n_y': self.grid.n_y,
+            'temperature': self.temperature,
+            'ferromagnetivity': self.ferromagnetivity,
+            'Mf_External': self.ExternalMagneticField,
+            'random_seed': self.grid.random_seed,
+            # the streams at the first frame, rebuilt with random_streams.stream_from_state
+            'rng': stream_state(self.rng),
+            'grid_rng': None if self.grid.rng is self.rng else stream_state(self.grid.rng),
+        }
+
+        self.trajectory = TrajectoryWriter(path, self.grid.grid.shape, metadata=metadata, stride=stride, capacity=capacity)
+        self.trajectory.append(self.grid.grid)
+        return self.trajectory
+
+    def stopTrajectory(self):
+        """
+        Closes the trajectory started by recordTrajectory, if any.
+        """
+        if self.trajectory is not None:
+            self.trajectory.close()
+            self.trajectory = None
+
     def outputSpins(self):
                 
         """
@@ -61,12 +282,7 @@ class ClassicIsing:
             grid_spins (2D np.array): 2D array of spins representing the current grid state
         """
 
-        grid_spins = np.zeros(self.grid.grid.shape)
-
-        for i in range(grid_spins.shape[0]):
-            for j in range(grid_spins.shape[1]):
-                grid_spins[i, j] = self.grid.grid[i, j].spin
-        return grid_spins
+        return self.grid.output()
     
         
 
@@ -81,15 +297,148 @@ class ClassicIsing:
         Parameters
             point (Classic Point Object): as a classical Ising model point with a spin
         """
-        effective_field = self.effective_field(point.x, point.y, self.ferromagnetivity, self.ExternalMagneticField)
+        site = point.x * self.grid.n_y + point.y
+        neighbor_sum = int(np.dot(self.grid.flat_spins[self.grid.neighbors[site]], self.grid.neighbor_signs[site]))
+        prob = self.acceptance[point.spin + 1, neighbor_sum + self.max_degree]
+
         # jason note: changed to <= from < to allow for zero energy changes to always flip
-        if point.changeInEnergy(effective_field) <= 0:
-            point.changeSpin(point.spin * -1)
+        # (those have probability 1 in the table and flip without drawing a random number)
+        if prob >= 1:
+            self.grid.flip(site, neighbor_sum)
         else:
-            prob = np.exp(-point.changeInEnergy(effective_field) / (self.Boltzmann * self.temperature))
-            rand = np.random.rand()
+            rand = self.rng.uniform()
             if rand < prob:
-                point.changeSpin(point.spin * -1)
+                self.grid.flip(site, neighbor_sum)
+
+    @sweep_rule
+    def checkerboard(self):
+        """
+        Vectorized Metropolis sweep. The grid's color classes contain no neighboring sites, so every site of a class
+        sees fixed neighbors and the whole class can be proposed, tested and flipped in one go. One sweep visits
+        every active site once, class by class.
+        """
+        grid = self.grid
+
+        for sites in grid.color_classes:
+            neighbor_sums = grid.neighborSums(sites)
+            prob = self.acceptance[grid.flat_spins[sites] + 1, neighbor_sums + self.max_degree]
+
+            # flips that lower (or keep) the energy have probability 1 and always pass
+            flip = self.rng.random(len(sites)) < prob
+            grid.flip(sites[flip], neighbor_sums[flip])
+
+    @sweep_rule
+    def multispin(self):
+        """
+        One checkerboard Metropolis sweep on a multi spin coded copy of the grid (see multispin.MultiSpinLattice),
+        which is packed and unpacked around the sweep. runSimulation keeps the packed lattice across sweeps instead.
+        """
+        lattice = MultiSpinLattice(self.grid, rng=self.rng)
+        lattice.sweep(self.acceptance)
+        self.grid.grid = lattice.unpack()
+
+    def runMultiSpin(self, n_steps):
+        """
+        Runs n_steps multi spin coded sweeps, packing the grid once. The grid is only unpacked after every sweep if the
+        history, a trajectory, the consistency check or the checkpoints need it, otherwise once at the end.
+        """
+        lattice = MultiSpinLattice(self.grid, rng=self.rng)
+        needs_grid = self.grid.record_history or self.trajectory is not None or self.check_observables or self.checkpointer is not None
+
+        for step in range(n_steps):
+            lattice.sweep(self.acceptance)
+            if needs_grid:
+                self.grid.grid = lattice.unpack()
+                self.recordSweep()
+
+        if not needs_grid:
+            self.grid.grid = lattice.unpack()
+            self.sweeps += n_steps
+
+    def runDecomposed(self, n_steps, n_workers=None, root_seed=None, barrier_timeout=600):
+        """
+        Runs n_steps checkerboard sweeps with the lattice split into strips updated by n_workers processes that share
+        the spins through shared memory (see domain_decomposition.run_decomposed). Meant for single, very large
+        lattices, every sweep is the same Markov chain step as the checkerboard rule.
+
+        Parameters
+            n_steps (int): Number of sweeps
+            n_workers (int): Number of worker processes, the number of cores by default
+            root_seed (int or None): Seed of the workers' random streams, spawned from self.rng by default
+            barrier_timeout (float): Seconds a process waits for the others before the run is given up
+        """
+        run_decomposed(self, n_steps, n_workers, root_seed, barrier_timeout)
+
+    def bondProbabilities(self, sites):
+        """
+        Returns the Fortuin-Kasteleyn bond probabilities of the links of the given sites, shaped like
+        self.grid.neighbors[sites]. A link is only bonded if it is satisfied, i.e. coupling * s_i * s_j > 0, and then
+        with probability 1 - exp(-2 * |coupling| * magnetic_moment / kT). Links to missing neighbors get 0.
+        """
+        grid = self.grid
+        spins = grid.flat_spins
+
+        signs = grid.neighbor_signs[sites]
+        satisfied = self.ferromagnetivity * signs * spins[sites, None] * spins[grid.neighbors[sites]] > 0
+
+        return np.where(satisfied, self.bond_probability[np.abs(signs)], 0)
+
+    @sweep_rule
+    def wolff(self):
+        """
+        Wolff single cluster update. A cluster is grown from a random active site by bonding satisfied links with
+        the Fortuin-Kasteleyn probability, one breadth first layer at a time, and then flipped. With an external
+        field the flip is accepted with probability exp(-dE_field / kT), dE_field being the field energy change of
+        the cluster. One call flips (at most) one cluster.
+        """
+        grid = self.grid
+        spins = grid.flat_spins
+
+        seed = grid.active_sites[self.rng.integer(len(grid.active_sites))]
+
+        # the ghost entry counts as part of the cluster so links to missing neighbors are never followed
+        in_cluster = np.zeros(grid.n_sites + 1, dtype=bool)
+        in_cluster[[seed, grid.sentinel]] = True
+
+        frontier = np.array([seed])
+        cluster = [frontier]
+        while frontier.size:
+            neighbors = grid.neighbors[frontier]
+            bonded = self.rng.random(neighbors.shape) < self.bondProbabilities(frontier)
+
+            frontier = np.unique(neighbors[bonded & ~in_cluster[neighbors]])
+            in_cluster[frontier] = True
+            cluster.append(frontier)
+
+        cluster = np.concatenate(cluster)
+
+        deltaE_field = 2 * self.magnetic_moment * self.ExternalMagneticField * np.sum(spins[cluster], dtype=np.int64)
+        if deltaE_field <= 0 or self.rng.uniform() < np.exp(-deltaE_field / (self.Boltzmann * self.temperature)):
+            grid.flipCluster(cluster)
+
+    @sweep_rule
+    def swendsen_wang(self):
+        """
+        Swendsen-Wang multi cluster update. Every satisfied link of the grid is bonded with the Fortuin-Kasteleyn
+        probability, the clusters are labelled with a vectorized union-find, and every cluster is flipped
+        independently. With an external field each cluster picks its orientation by heat bath, flipping with
+        probability 1 / (1 + exp(dE_field / kT)), which is 1/2 without a field.
+        """
+        grid = self.grid
+        spins = grid.flat_spins
+        sites = np.arange(grid.n_sites)
+
+        # every link appears once from each end, keep it from its lower end only
+        bonded = (self.rng.random(grid.neighbors.shape) < self.bondProbabilities(sites)) & (grid.neighbors > sites[:, None])
+        u, k = np.nonzero(bonded)
+        labels = _connected_components(grid.n_sites, u, grid.neighbors[u, k])
+
+        cluster_spin = np.bincount(labels, weights=spins[:grid.n_sites], minlength=grid.n_sites)
+        deltaE_field = 2 * self.magnetic_moment * self.ExternalMagneticField * cluster_spin
+        flip_prob = 0.5 * (1 - np.tanh(deltaE_field / (2 * self.Boltzmann * self.temperature)))
+
+        flip = self.rng.random(grid.n_sites) < flip_prob
+        grid.flipCluster(np.flatnonzero(flip[labels]))
 
     
     def magnetization(self):
@@ -97,7 +446,7 @@ class ClassicIsing:
         Calculates the total magnetization of the grid.
         """
         
-        total_magnetization = np.abs(np.sum(self.grid()) / (self.grid.n_x * self.grid.n_y))
+        total_magnetization = np.abs(self.grid.total_spin / (self.grid.n_x * self.grid.n_y))
 
         return total_magnetization
     
@@ -119,32 +468,156 @@ class ClassicIsing:
             J=1.0 (float): Coupling constant
             h=0.0 (float): External magnetic field
         """
-        up = self.grid.getPoint(i, j+1)
-        down = self.grid.getPoint(i, j-1)
-        left = self.grid.getPoint(i-1, j)
-        right = self.grid.getPoint(i+1, j)
-
-        neighbors = [up, down, left, right]
+        # gather the four neighbors from the precomputed table, missing ones point at a zero spin
+        site = i * self.grid.n_y + j
+        neighbors = self.grid.flat_spins[self.grid.neighbors[site]]
 
-        B_eff = np.sum([neighbor for neighbor in neighbors if neighbor is not None])
+        B_eff = int(np.dot(neighbors, self.grid.neighbor_signs[site]))
 
         B_eff *= J
         B_eff += h
         
         return B_eff
 
-    def runSimulation(self, n_steps):
+    def runSimulation(self, n_steps, update_rule='metropolis'):
 
         """
         Runs the Ising model simulation for a given number of steps.
 
         Parameters:
             n_steps (int): Number of simulation steps to run
+            update_rule (method or str): update rule passed on to update, metropolis by default
         """
         if n_steps <= 0:
             return
+        if update_rule == 'multispin' or update_rule == self.multispin:
+            self.runMultiSpin(n_steps)
+            return
         for step in range(n_steps):
-            self.update(self.metropolis)
+            self.update(update_rule)
+
+    def measure(self, n_steps=1000, update_rule='checkerboard', target_error=None, quantity='abs_magnetization', max_steps=100000, measurement=None):
+        """
+        Runs sweeps and streams the energy and magnetization of every sweep into a MeasurementSeries, from which the
+        specific heat, susceptibility and Binder cumulant follow with autocorrelation-aware error bars. The grid
+        should already be equilibrated.
+
+        Without target_error exactly n_steps sweeps are measured. With target_error the run continues in chunks of
+        n_steps sweeps until the relative error of every requested quantity is below target_error, and the run is at
+        least 50 integrated autocorrelation times long (shorter runs underestimate tau_int and with it the errors),
+        or until max_steps sweeps were measured. measurement.converged tells which of the two stopped it.
+
+        Parameters
+            n_steps (int): Number of sweeps, or sweeps per chunk with a target_error
+            update_rule (method or str): update rule passed on to update, checkerboard by default
+            target_error (float or None): Relative precision to run to
+            quantity (str or list of str): Quantities target_error applies to, see measurements.QUANTITIES
+            max_steps (int): Upper bound of the number of sweeps with a target_error
+            measurement (MeasurementSeries): Series to continue, a new one by default
+
+        Returns
+            measurement (MeasurementSeries)
+        """
+        if measurement is None:
+            measurement = MeasurementSeries.fromModel(self, capacity=n_steps)
+        self.measurement = measurement
+        quantities = [quantity] if isinstance(quantity, str) else list(quantity)
+        n_sites = self.grid.n_sites
+
+        while True:
+            for step in range(n_steps):
+                self.update(update_rule)
+                measurement.add(self.energy / n_sites, self.total_spin / n_sites)
+
+            if target_error is None:
+                return measurement
+
+            tau = max(measurement.autocorrelationTime('energy'), measurement.autocorrelationTime('abs_magnetization'))
+            measurement.converged = (len(measurement) >= 50 * tau
+                                     and all(measurement.relativeError(q) <= target_error for q in quantities))
+            if measurement.converged or len(measurement) >= max_steps:
+                return measurement
+
+    def checkpointData(self):
+        """
+        Snapshot of the complete simulation state for a checkpoint: the grid (spins and topology, see
+        checkpoint.grid_checkpoint), temperature, coupling, field, the random stream states, the sweep counter and the
+        series of the last measure call. All arrays are copies, so the run can continue while the snapshot is written.
+
+        Returns
+            header (dict), arrays (dict of np.array)
+        """
+        grid_header, arrays = grid_checkpoint(self.grid)
+        header = {
+            'model': 'ClassicIsing',
+            'grid': grid_header,
+            'temperature': self.temperature,
+            'ferromagnetivity': self.ferromagnetivity,
+            'Mf_External': self.ExternalMagneticField,
+            'check_observables': self.check_observables,
+            'sweeps': self.sweeps,
+            'shared_rng': self.rng is self.grid.rng,
+            'measurement': None,
+        }
+
+        arrays.update(stream_arrays(self.rng, 'rng'))
+        if self.rng is not self.grid.rng:
+            arrays.update(stream_arrays(self.grid.rng, 'grid_rng'))
+
+        if self.measurement is not None:
+            header['measurement'], measurement_arrays = measurement_checkpoint(self.measurement)
+            arrays.update(measurement_arrays)
+
+        return header, arrays
+
+    def saveCheckpoint(self, path):
+        """
+        Writes a checkpoint of the complete simulation state to path (a compressed .npz file, see
+        checkpoint.write_checkpoint). ClassicIsing.loadCheckpoint(path) continues the run exactly where it was. The
+        grid history and trajectory are not part of the checkpoint.
+        """
+        write_checkpoint(path, *self.checkpointData())
+
+    @classmethod
+    def loadCheckpoint(cls, path):
+        """
+        Restores a model from a checkpoint written by saveCheckpoint or checkpointEvery. The restored model draws the
+        same random numbers as the original would have, so the continued run is identical to an uninterrupted one.
+        A grid that recorded a history starts a new one from the restored spins, and the series of the last measure
+        call is available as model.measurement (continue it with model.measure(..., measurement=model.measurement)).
+        """
+        header, arrays = read_checkpoint(path)
+        if header['model'] != 'ClassicIsing':
+            raise ValueError(f"{path} is a {header['model']} checkpoint")
+
+        rng = stream_from_arrays(arrays, 'rng')
+        grid = build_grid(header['grid'], arrays, rng if header['shared_rng'] else stream_from_arrays(arrays, 'grid_rng'))
+
+        model = cls(grid, header['temperature'], header['ferromagnetivity'], header['Mf_External'], header['check_observables'], rng=rng)
+        model.sweeps = header['sweeps']
+        if header['measurement'] is not None:
+            model.measurement = build_measurement(header['measurement'], arrays)
+        return model
+
+    def checkpointEvery(self, path, n_sweeps=1000):
+        """
+        Starts writing a checkpoint to path every n_sweeps sweeps, on a background thread (see checkpoint.Checkpointer)
+        so the sweeps don't wait for the disk. Stop it with stopCheckpoints.
+
+        Returns
+            checkpointer (Checkpointer): the writer, also stored as self.checkpointer
+        """
+        self.stopCheckpoints(final=False)
+        self.checkpointer = Checkpointer(self, path, n_sweeps)
+        return self.checkpointer
+
+    def stopCheckpoints(self, final=True):
+        """
+        Stops the periodic checkpoints started by checkpointEvery, with final writing a last one of the current state.
+        """
+        if self.checkpointer is not None:
+            checkpointer, self.checkpointer = self.checkpointer, None
+            checkpointer.close(final)
 
     def resetSimulation(self, grid=None):
         """
@@ -156,6 +629,168 @@ class ClassicIsing:
             self.grid.resetGrid()
 
 
+class BatchedIsing:
+
+    """
+    Runs R independent replicas of a classic Ising model on the same topology at once. The spins of all replicas
+    live in one stacked (R, n_x, n_y) array and a single call to sweep advances every replica by one checkerboard
+    Metropolis sweep, so the Python overhead is shared by all of them.
+
+    Parameters
+        grid (Grid Object): The Grid object with topology. Its neighbor table and color classes are shared by all
+            replicas, its current spins are the starting configuration unless random_init is True
+        temperatures (array-like): Temperature of each replica, its length sets the number of replicas R
+        ferromagnetivity (float): Coupling strength of magnetic moments
+        Mf_External (float or array-like): External magnetic field, one value for all replicas or one per replica
+        random_init (bool): Whether every replica starts from its own random configuration
+        rng (RandomStream, np.random.Generator, SeedSequence or int): Random stream of the updates, the grid's
+            stream by default
+    """
+
+    def __init__(self, grid, temperatures, ferromagnetivity, Mf_External, random_init=False, rng=None):
+
+        self.grid = grid
+        self.rng = grid.rng if rng is None else make_stream(rng)
+        self.n_replicas = len(temperatures)
+
+        self.ferromagnetivity = ferromagnetivity
+        self.Boltzmann = 1.380649*10**-23 # J/K
+        self.magnetic_moment = grid.gridPointObject.magnetic_moment
+        self.max_degree = grid.max_degree
+
+        # one flat row of spins per replica, with the grid's always zero ghost entry at the end of each row
+        self.flat_spins = np.repeat(grid.flat_spins[None, :], self.n_replicas, axis=0)
+        if random_init:
+            self.flat_spins[:, grid.active_sites] = self.rng.choice(np.array([-1, 1], dtype=np.int8), size=(self.n_replicas, len(grid.active_sites)))
+
+        self.recount()
+        self.changeTemp(temperatures, Mf_External)
+
+    ### properties ###
+
+    @property
+    def spins(self):
+        """(R, n_x, n_y) view of the spins of every replica."""
+        return self.flat_spins[:, :self.grid.n_sites].reshape(self.n_replicas, self.grid.n_x, self.grid.n_y)
+
+    @property
+    def energy(self):
+        """Total energy of every replica, from the running totals."""
+        return -self.magnetic_moment * (self.ferromagnetivity * self.bond_sum + self.ExternalMagneticField * self.total_spin)
+
+    ### class methods ###
+
+    def changeTemp(self, temperatures, Mf_External=None):
+        """
+        Sets the temperature (and optionally the external field) of every replica and rebuilds the acceptance tables.
+        """
+        self.temperatures = np.broadcast_to(np.asarray(temperatures, dtype=float), (self.n_replicas,)).copy()
+        if Mf_External is not None:
+            self.ExternalMagneticField = np.broadcast_to(np.asarray(Mf_External, dtype=float), (self.n_replicas,)).copy()
+
+        betas = 1 / (self.Boltzmann * self.temperatures)
+        # (R, 3, 2 * max_degree + 1), indexed [replica, spin + 1, neighbor_sum + max_degree]
+        self.acceptance = acceptance_table(self.magnetic_moment, betas, self.ferromagnetivity, self.ExternalMagneticField, self.max_degree)
+        return self
+
+    def recount(self):
+        """
+        Recomputes the running totals of every replica from scratch.
+        """
+        spins = self.flat_spins[:, :self.grid.n_sites].astype(np.int64)
+        neighbor_sums = np.einsum('rkd,kd->rk', self.flat_spins[:, self.grid.neighbors], self.grid.neighbor_signs, dtype=np.int64)
+
+        self.total_spin = spins.sum(axis=1)
+        self.bond_sum = np.einsum('rk,rk->r', spins, neighbor_sums) // 2
+
+    def sweep(self):
+        """
+        Advances every replica by one checkerboard Metropolis sweep.
+
+        Returns
+            magnetization (np.array): |M| per site of every replica
+            energy (np.array): total energy of every replica
+        """
+        grid = self.grid
+        replicas = np.arange(self.n_replicas)[:, None]
+
+        for sites in grid.color_classes:
+            spins = self.flat_spins[:, sites]
+            neighbor_sums = np.einsum('rkd,kd->rk', self.flat_spins[:, grid.neighbors[sites]], grid.neighbor_signs[sites], dtype=np.int64)
+            prob = self.acceptance[replicas, spins + 1, neighbor_sums + self.max_degree]
+
+            flip = self.rng.random(spins.shape) < prob
+            flipped = np.where(flip, spins, 0)
+
+            self.total_spin -= 2 * flipped.sum(axis=1, dtype=np.int64)
+            self.bond_sum -= 2 * np.einsum('rk,rk->r', flipped, neighbor_sums)
+            self.flat_spins[:, sites] = np.where(flip, -spins, spins)
+
+        return self.magnetization(), self.energy
+
+    def magnetization(self):
+        """
+        |M| per site of every replica.
+        """
+        return np.abs(self.total_spin / (self.grid.n_x * self.grid.n_y))
+
+    def runSimulation(self, n_steps):
+        """
+        Runs n_steps sweeps of every replica.
+
+        Returns
+            magnetizations, energies (np.array): (n_steps, R) series of |M| per site and total energy
+        """
+        magnetizations = np.zeros((n_steps, self.n_replicas))
+        energies = np.zeros((n_steps, self.n_replicas))
+        for step in range(n_steps):
+            magnetizations[step], energies[step] = self.sweep()
+        return magnetizations, energies
+
+
+def qubit_z(n, i_qubit):
+    """
+    Pauli Z eigenvalue of qubit i_qubit in every basis state of n qubits, as an int8 vector: bit i_qubit of the basis
+    state index being 0 gives +1, being 1 gives -1.
+    """
+    return (1 - 2 * ((np.arange(2**n) >> i_qubit) & 1)).astype(np.int8)
+
+
+@lru_cache(maxsize=4)
+def zz_diagonal(n, J):
+    """
+    Diagonal of the coupling term -J * sum_i Z_i Z_(i+1) of the periodic chain, one energy per basis state. Cached
+    per (n, J) and read only.
+    """
+    diagonal = np.zeros(2**n)
+    z_first = z_next = qubit_z(n, 0)
+    for i_qubit in range(n):
+        z_i, z_next = z_next, (qubit_z(n, i_qubit + 1) if i_qubit + 1 < n else z_first)
+        diagonal -= J * (z_i * z_next)
+    diagonal.flags.writeable = False
+    return diagonal
+
+
+@lru_cache(maxsize=4)
+def z_sums(n):
+    """
+    Sum of the Pauli Z eigenvalues of all qubits in every basis state. Cached per n and read only.
+    """
+    sums = np.zeros(2**n, dtype=np.int8)
+    for i_qubit in range(n):
+        sums += qubit_z(n, i_qubit)
+    sums.flags.writeable = False
+    return sums
+
+
+def apply_x(psi, n, i_qubit):
+    """
+    Applies Pauli X on qubit i_qubit to the state vector psi (returned as a view): flipping bit i_qubit of the basis
+    state index is reversing the middle axis of psi reshaped to (2**(n - 1 - i_qubit), 2, 2**i_qubit).
+    """
+    return psi.reshape(2**(n - 1 - i_qubit), 2, 2**i_qubit)[:, ::-1, :].reshape(psi.shape)
+
+
 class TransverseIsing:
 
     """
@@ -172,11 +807,16 @@ class TransverseIsing:
             n (integer) - n number of qubits
             rand_int (boolean) - assigns random values or not to state vector
             load_history (array) - loads in a history of the state vector
+            store_states (boolean) - whether to keep copies of the state vector in state_history. At 2^n amplitudes per
+                copy this is the memory bottleneck of long runs, observables can be recorded with observe instead
+            state_stride (integer) - only every state_stride-th step is stored in state_history
+            rng (RandomStream, np.random.Generator, SeedSequence or int) - random stream of the random initial state
     """
 
-    def __init__(self, n, coupling_strength, term_strength, rand_init=False, load_history=None, load_state=None):
+    def __init__(self, n, coupling_strength, term_strength, rand_init=False, load_history=None, load_state=None, store_states=True, state_stride=1, rng=None):
         
         self.n = n
+        self.rng = make_stream(rng)
         self.J = coupling_strength
         self.h = term_strength
         
@@ -186,97 +826,458 @@ class TransverseIsing:
             self.state_vector = load_state
         else:
             if rand_init:
-                rand_amps = np.random.rand(2**n) + 1j * np.random.rand(2**n)
+                rand_amps = self.rng.random(2**n) + 1j * self.rng.random(2**n)
                 norm = np.linalg.norm(rand_amps)
                 self.state_vector = rand_amps / norm
             else:
                 self.state_vector = np.zeros(2**n, dtype=complex)
                 self.state_vector[0] = 1.0 + 0.0j 
 
+        self.store_states = store_states
+        self.state_stride = state_stride
+
         if load_history is not None:
             self.state_history = load_history
         else:
-            self.state_history = [self.state_vector.copy()]
+            self.state_history = [self.state_vector.copy()] if store_states else []
+
+        # evolution time and number of steps so far, the state the evolution started from (see fidelity)
+        self.time = 0.0
+        self.steps = 0
+        self.initial_state = self.state_vector.copy()
+
+        # ObservableRecorders (see observe), the on-disk trajectory (see recordTrajectory) and the periodic checkpoint
+        # writer (see checkpointEvery) fed after every step
+        self.observers = []
+        self.trajectory = None
+        self.checkpointer = None
+
+        # last accepted substep of every adaptive integrator, see adaptiveSteps
+        self.substeps = {}
+
+    def apply_hamiltonian(self, psi):
+        """
+        Applies the Hamiltonian H = -J * sum_i Z_i Z_(i+1) - h * sum_i X_i to a state vector without ever building
+        the 2^n x 2^n matrix: the coupling term is the cached diagonal zz_diagonal(n, J), every X term a reshaped axis
+        flip of psi.
+
+        Parameters
+            psi (np.array): state vector of 2^n complex amplitudes
+
+        Returns
+            H_psi (np.array): H applied to psi
+        """
+        H_psi = zz_diagonal(self.n, self.J) * psi
+        scaled = -self.h * psi
+        for i_qubit in range(self.n):
+            # the X term in place: the bit 0 half of the amplitudes picks up the bit 1 half and vice versa
+            shape = (2**(self.n - 1 - i_qubit), 2, 2**i_qubit)
+            H_view, scaled_view = H_psi.reshape(shape), scaled.reshape(shape)
+            H_view[:, 0, :] += scaled_view[:, 1, :]
+            H_view[:, 1, :] += scaled_view[:, 0, :]
+        return H_psi
+
+    def linearOperator(self):
+        """
+        Returns the Hamiltonian as a scipy.sparse.linalg.LinearOperator backed by apply_hamiltonian, for use with
+        scipy's iterative solvers (eigsh, expm_multiply, ...). Requires scipy.
+        """
+        from scipy.sparse.linalg import LinearOperator
+
+        dim = 2**self.n
+        return LinearOperator((dim, dim), matvec=lambda psi: self.apply_hamiltonian(np.ravel(psi)), dtype=complex)
 
     def calculateStep(self):
+        """
+        Returns H applied to the current state vector, see apply_hamiltonian.
+        """
+        return self.apply_hamiltonian(self.state_vector)
+    
+    def eularUpdate(self, dt):
 
-        newState = np.zeros_like(self.state_vector, dtype=complex)
+        #Eular Update (Schrödinger equation d psi / dt = -i H psi, renormalized after every step)
 
+        self.state_vector += self.calculateStep()*dt*-1j 
 
-        #Coupling Terms
+        self.state_vector /= np.linalg.norm(self.state_vector)
 
-        z = [1, -1]  # maps bit 0 -> +1, bit 1 -> -1
+        self.recordStep(dt)
 
-        for idx, amp in enumerate(self.state_vector):
-            total = 0
-            #Applying Pauli Z to state vector 
-            for i_qubit in range(self.n):
+    def recordStep(self, dt):
+        """
+        Bookkeeping after every step: advances the time and feeds the state history, the observers, the trajectory and
+        the periodic checkpoints.
+        """
+        self.time += dt
+        self.steps += 1
 
-                j_qubit = (i_qubit + 1) % self.n
+        if self.store_states and self.steps % self.state_stride == 0:
+            self.state_history.append(self.state_vector.copy())
 
-                bi = (idx >> i_qubit) & 1
-                bj = (idx >> j_qubit) & 1
-                total += -self.J * z[bi] * z[bj]
-                
-            newState[idx] += total * amp
+        for observer in self.observers:
+            observer.record(self, self.state_vector, self.time)
 
-        #Non-coupling Terms (Tranverse Effect)
+        if self.trajectory is not None:
+            self.trajectory.record(self.state_vector)
 
-        for idx, amp in enumerate(self.state_vector):
+        if self.checkpointer is not None:
+            self.checkpointer.step()
 
-            #Applying Pauli X to state vector
-            for i_qubit in range(self.n):
-            
-                flipped_bit = idx ^ (1 << i_qubit)
+    def observe(self, observables, stride=1):
+        """
+        Starts recording observables every stride steps, beginning with the current state. See
+        observables.ObservableRecorder, e.g.
 
-                newState[flipped_bit] += -self.h * amp
+            recorder = model.observe(['magnetization', 'magnetizationX', 'energy', 'zzCorrelator', 'fidelity'], stride=10)
+            model.runSimulation(1000, dt=.01, method='krylov')
+            recorder['energy'], recorder.times
 
-        return newState
-    
-    def eularUpdate(self, dt):
+        Parameters
+            observables (dict or list): name -> callable(model, state) or method name, or a list of method names
+            stride (int): Record every stride-th step
 
-        #Eular Update
+        Returns
+            recorder (ObservableRecorder): the recorder, also kept in self.observers
+        """
+        recorder = ObservableRecorder(observables, stride=stride)
+        recorder.append(self, self.state_vector, self.time)
+        self.observers.append(recorder)
+        return recorder
 
-        self.state_vector += self.calculateStep()*dt*1j 
+    def recordTrajectory(self, path, stride=1, capacity=64):
+        """
+        Starts streaming the state vector to a memory mapped trajectory on disk every stride steps, starting with the
+        current state. Read it back with trajectory.TrajectoryReader.
 
-        self.state_vector /= np.linalg.norm(self.state_vector)
+        Parameters
+            path (str): Path of the trajectory, without extension
+            stride (int): Record every stride-th step
+            capacity (int): Number of states preallocated on disk, the file grows when they run out
+
+        Returns
+            trajectory (TrajectoryWriter): the writer, also stored as self.trajectory
+        """
+        self.stopTrajectory()
+
+        metadata = {'n': self.n, 'J': self.J, 'h': self.h, 'time': self.time}
 
-        self.state_history.append(self.state_vector.copy())
+        self.trajectory = TrajectoryWriter(path, self.state_vector.shape, metadata=metadata, dtype=complex, stride=stride, capacity=capacity)
+        self.trajectory.append(self.state_vector)
+        return self.trajectory
 
+    def stopTrajectory(self):
+        """
+        Closes the trajectory started by recordTrajectory, if any.
+        """
+        if self.trajectory is not None:
+            self.trajectory.close()
+            self.trajectory = None
 
-    def runSimulation(self, n_steps=1000, dt=.001):
+    def krylovStep(self, psi, dt, tol=1e-8, max_dim=30):
+        """
+        Returns exp(-i H dt) psi from a Lanczos (Krylov subspace) approximation: H is projected onto the space spanned
+        by psi, H psi, ..., H^(m-1) psi, where it is a small tridiagonal matrix that is exponentiated exactly. The
+        dimension m grows until the a posteriori error estimate beta_m * |last coefficient| drops below tol. If
+        max_dim isn't enough, dt is split in halves.
+
+        Parameters
+            psi (np.array): state vector
+            dt (float): time step
+            tol (float): error tolerance (2-norm) of the step
+            max_dim (int): largest Krylov dimension, every dimension costs one Hamiltonian application and one stored
+                state vector
+        """
+        norm = np.linalg.norm(psi)
+        if norm == 0:
+            return psi.copy()
+
+        basis = [psi / norm]
+        alphas, betas = [], []
+
+        for j in range(max_dim):
+            w = self.apply_hamiltonian(basis[j])
+            alphas.append(np.vdot(basis[j], w).real)
+            w -= alphas[j] * basis[j]
+            if j > 0:
+                w -= betas[j - 1] * basis[j - 1]
+            beta = np.linalg.norm(w)
+
+            # exponential of the projected, tridiagonal H applied to the first basis vector
+            T = np.diag(alphas) + np.diag(betas, 1) + np.diag(betas, -1)
+            energies, vectors = np.linalg.eigh(T)
+            coefficients = vectors @ (np.exp(-1j * dt * energies) * vectors[0].conj())
+
+            # beta ~ 0 means the subspace is invariant and the result exact
+            if beta * abs(coefficients[-1]) < tol or beta < 1e-12 * norm:
+                result = np.zeros_like(basis[0], dtype=complex)
+                for coefficient, vector in zip(coefficients, basis):
+                    result += coefficient * vector
+                return norm * result
+
+            betas.append(beta)
+            basis.append(w / beta)
+
+        half = self.krylovStep(psi, dt / 2, tol / 2, max_dim)
+        return self.krylovStep(half, dt / 2, tol / 2, max_dim)
+
+    def trotterStep(self, psi, dt, order=2):
+        """
+        Returns a Trotter-Suzuki approximation of exp(-i H dt) psi. The diagonal coupling term is applied as a phase
+        and every X term as the single qubit rotation exp(i h dt X_i) = cos(h dt) + i sin(h dt) X_i, so no Hamiltonian
+        application is needed. order 2 is the symmetric splitting exp(-i D dt/2) exp(-i H_x dt) exp(-i D dt/2), order 4
+        Suzuki's composition of five order 2 steps. The error per step is O(dt^(order + 1)).
+        """
+        if order == 4:
+            p = 1 / (4 - 4**(1 / 3))
+            for fraction in (p, p, 1 - 4 * p, p, p):
+                psi = self.trotterStep(psi, fraction * dt, order=2)
+            return psi
+        if order != 2:
+            raise ValueError(f"Trotter order has to be 2 or 4, got {order}")
+
+        half_phase = np.exp(-0.5j * dt * zz_diagonal(self.n, self.J))
+        psi = half_phase * psi
+
+        cos, sin = np.cos(self.h * dt), np.sin(self.h * dt)
+        for i_qubit in range(self.n):
+            psi = cos * psi + 1j * sin * apply_x(psi, self.n, i_qubit)
+
+        return half_phase * psi
+
+    def rk4Step(self, psi, dt):
+        """
+        Returns one classical Runge-Kutta step of d psi / dt = -i H psi, four Hamiltonian applications.
+        """
+        k1 = -1j * self.apply_hamiltonian(psi)
+        k2 = -1j * self.apply_hamiltonian(psi + 0.5 * dt * k1)
+        k3 = -1j * self.apply_hamiltonian(psi + 0.5 * dt * k2)
+        k4 = -1j * self.apply_hamiltonian(psi + dt * k3)
+        return psi + dt / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+
+    def adaptiveSteps(self, psi, dt, method, tol):
+        """
+        Advances psi by dt with one of the fixed order steppers ('trotter2', 'trotter4' or 'rk4'), choosing the substep
+        size by step doubling: a substep is compared with two half substeps, whose difference / (2^order - 1)
+        estimates the error. Substeps with an error above tol are retried smaller, the substep that worked last is
+        remembered (per method) for the next call.
+        """
+        step, order = {
+            'trotter2': (lambda psi, dt: self.trotterStep(psi, dt, order=2), 2),
+            'trotter4': (lambda psi, dt: self.trotterStep(psi, dt, order=4), 4),
+            'rk4': (self.rk4Step, 4),
+        }[method]
+
+        elapsed = 0.0
+        substep = min(dt, self.substeps.get(method, dt))
+
+        while elapsed < dt:
+            substep = min(substep, dt - elapsed)
+            full = step(psi, substep)
+            halves = step(step(psi, substep / 2), substep / 2)
+            error = np.linalg.norm(halves - full) / (2**order - 1)
+
+            if error <= tol or substep < 1e-12 * dt:
+                psi = halves
+                elapsed += substep
+                if dt - elapsed <= 1e-12 * dt:
+                    elapsed = dt
+                self.substeps[method] = substep
+            # grow or shrink towards the substep that just meets the tolerance
+            substep *= min(2.0, max(0.2, 0.9 * (tol / max(error, 1e-300))**(1 / (order + 1))))
+
+        return psi
+
+    def evolve(self, psi, dt, method='krylov', tol=1e-8):
+        """
+        Returns psi evolved by exp(-i H dt) with one of the integrators.
+
+        Parameters
+            psi (np.array): state vector
+            dt (float): evolution time
+            method (str): 'krylov' (Lanczos exponentiation), 'trotter2', 'trotter4' (Trotter-Suzuki splitting) or
+                'rk4' (Runge-Kutta). The last three control their error by step doubling
+            tol (float): error tolerance of the step
+        """
+        if method == 'krylov':
+            return self.krylovStep(psi, dt, tol)
+        if method in ('trotter2', 'trotter4', 'rk4'):
+            return self.adaptiveSteps(psi, dt, method, tol)
+        raise ValueError(f"Unknown time integrator '{method}', expected 'euler', 'krylov', 'trotter2', 'trotter4' or 'rk4'")
+
+    def runSimulation(self, n_steps=1000, dt=.001, method='euler', tol=1e-8):
 
         """
         Runs the Tranverse Field Ising model simulation for a given number of steps.
 
         Parameters:
             n_steps (int): Number of simulation steps to run
+            dt (float): Time step, the state history, observers and trajectory are fed after every step
+            method (str): 'euler' (forward Euler, renormalized), or one of the integrators of evolve: 'krylov',
+                'trotter2', 'trotter4', 'rk4'. These are accurate to tol for any dt, so a few large steps replace many
+                small Euler steps
+            tol (float): Error tolerance per step of the integrators other than euler
         """
         if n_steps <= 0:
             return
         for step in range(n_steps):
-            self.eularUpdate(dt)
+            if method == 'euler':
+                self.eularUpdate(dt)
+            else:
+                self.state_vector = self.evolve(self.state_vector, dt, method, tol)
+                self.recordStep(dt)
 
-    def magnetization(self):
-        
-        z = np.array([1, -1])  # 0 -> +1, 1 -> -1
-        Mz_total = 0
+    def checkpointData(self, include_history=True):
+        """
+        Snapshot of the complete simulation state for a checkpoint: n, J, h, the state vector and the initial state,
+        time and step counters, the adaptive integrators' substeps, the random stream state, the observers' recorded
+        values and, with include_history, the stored state history.
 
-        for idx, amp in enumerate(self.state_vector):
-            prob = np.abs(amp)**2  # probability of being in this basis state
-            for i_qubit in range(self.n):
-                bi = (idx >> i_qubit) & 1
-                Mz_total += z[bi] * prob
+        Returns
+            header (dict), arrays (dict of np.array)
+        """
+        header = {
+            'model': 'TransverseIsing',
+            'n': self.n,
+            'J': self.J,
+            'h': self.h,
+            'time': self.time,
+            'steps': self.steps,
+            'store_states': self.store_states,
+            'state_stride': self.state_stride,
+            'substeps': self.substeps,
+            'include_history': include_history,
+            'observers': [],
+        }
+        arrays = {'state_vector': self.state_vector.copy(), 'initial_state': self.initial_state.copy()}
+        arrays.update(stream_arrays(self.rng, 'rng'))
+
+        if include_history:
+            # the stored states are never modified, a shallow copy of the list is a consistent snapshot
+            arrays['state_history'] = list(self.state_history) if self.state_history else np.zeros((0, 2**self.n), dtype=complex)
+
+        for i, observer in enumerate(self.observers):
+            observer_header, observer_arrays = recorder_checkpoint(observer, f'observer{i}')
+            header['observers'].append(observer_header)
+            arrays.update(observer_arrays)
+
+        return header, arrays
+
+    def saveCheckpoint(self, path, include_history=True):
+        """
+        Writes a checkpoint of the complete simulation state to path (a compressed .npz file, see
+        checkpoint.write_checkpoint), TransverseIsing.loadCheckpoint(path) continues the evolution exactly where it
+        was. The trajectory is not part of the checkpoint.
+        """
+        write_checkpoint(path, *self.checkpointData(include_history))
 
-        Mz = Mz_total / self.n
+    @classmethod
+    def loadCheckpoint(cls, path, observables=None):
+        """
+        Restores a model from a checkpoint written by saveCheckpoint or checkpointEvery, including its observers.
 
-        return Mz
+        Parameters
+            path (str): checkpoint file
+            observables (dict): name -> callable, for observers whose observables were callables rather than names
+        """
+        header, arrays = read_checkpoint(path)
+        if header['model'] != 'TransverseIsing':
+            raise ValueError(f"{path} is a {header['model']} checkpoint")
+
+        history = list(arrays['state_history']) if header['include_history'] else []
+        model = cls(header['n'], header['J'], header['h'], load_history=history, load_state=arrays['state_vector'],
+                    store_states=header['store_states'], state_stride=header['state_stride'], rng=stream_from_arrays(arrays, 'rng'))
+
+        model.time = header['time']
+        model.steps = header['steps']
+        model.initial_state = arrays['initial_state']
+        model.substeps = header['substeps']
+        model.observers = [build_recorder(observer, arrays, f'observer{i}', observables) for i, observer in enumerate(header['observers'])]
+        return model
+
+    def checkpointEvery(self, path, n_steps=1000, include_history=False):
+        """
+        Starts writing a checkpoint to path every n_steps steps, on a background thread (see checkpoint.Checkpointer).
+        The state history is left out by default, it can be far larger than everything else. Stop it with
+        stopCheckpoints.
 
+        Returns
+            checkpointer (Checkpointer): the writer, also stored as self.checkpointer
+        """
+        self.stopCheckpoints(final=False)
+        self.checkpointer = Checkpointer(self, path, n_steps, {'include_history': include_history})
+        return self.checkpointer
 
+    def stopCheckpoints(self, final=True):
+        """
+        Stops the periodic checkpoints started by checkpointEvery, with final writing a last one of the current state.
+        """
+        if self.checkpointer is not None:
+            checkpointer, self.checkpointer = self.checkpointer, None
+            checkpointer.close(final)
 
+    def groundState(self, momenta=(0,), parities=(1, -1), load_state=False):
+        """
+        Ground state energy, gap and magnetizations of the chain by sparse Lanczos in the translation momentum and
+        spin flip parity sectors, see exact_diagonalization.ground_state. Requires scipy.
 
-        
+        Parameters
+            momenta (iterable): momentum sectors to search, the default (0,) is enough for J, h > 0
+            parities (iterable): parity sectors to search
+            load_state (bool): whether to make the ground state the current state vector (needs the full 2^n
+                amplitudes)
 
+        Returns
+            result (dict): energy, gap, magnetization_x, magnetization_z2, sector, vector (in the sector basis)
+        """
+        from exact_diagonalization import ground_state, symmetry_sector
 
+        result = ground_state(self.n, self.J, self.h, momenta, parities)
+        if load_state:
+            self.state_vector = symmetry_sector(self.n, *result['sector']).expand(result['vector'])
+            self.initial_state = self.state_vector.copy()
+        return result
 
-    
+    def magnetization(self, psi=None):
+        """
+        Expectation value of the mean Pauli Z, sum over basis states of |amplitude|^2 * (sum of Z) / n.
+
+        Parameters
+            psi (np.array): state vector, the current state by default
+        """
+        psi = self.state_vector if psi is None else psi
+        probs = np.abs(psi)**2
+        return np.dot(probs, z_sums(self.n)) / self.n
+
+    def magnetizationX(self, psi=None):
+        """
+        Expectation value of the mean Pauli X, sum over qubits of <psi|X_i|psi> / n.
+        """
+        psi = self.state_vector if psi is None else psi
+        return sum(np.vdot(psi, apply_x(psi, self.n, i_qubit)).real for i_qubit in range(self.n)) / self.n
+
+    def energy(self, psi=None):
+        """
+        Expectation value <psi|H|psi> of the Hamiltonian.
+        """
+        psi = self.state_vector if psi is None else psi
+        return np.vdot(psi, self.apply_hamiltonian(psi)).real
+
+    def zzCorrelator(self, psi=None, distance=1):
+        """
+        ZZ correlation at the given distance, averaged over the periodic chain: sum over i of <Z_i Z_(i+distance)> / n.
+        """
+        psi = self.state_vector if psi is None else psi
+        probs = np.abs(psi)**2
+
+        correlation = 0.0
+        for i_qubit in range(self.n):
+            correlation += np.dot(probs, qubit_z(self.n, i_qubit) * qubit_z(self.n, (i_qubit + distance) % self.n))
+        return correlation / self.n
+
+    def fidelity(self, psi=None, reference=None):
+        """
+        Fidelity |<reference|psi>|^2 to a reference state, the initial state of the evolution by default.
+        """
+        psi = self.state_vector if psi is None else psi
+        reference = self.initial_state if reference is None else reference
+        return abs(np.vdot(reference, psi))**2
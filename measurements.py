@@ -0,0 +1,265 @@
+import numpy as np
+
+from trajectory import atomic_savez
+
+# quantities MeasurementSeries.estimate knows, the first five are plain means of a time series
+QUANTITIES = ('energy', 'abs_magnetization', 'magnetization2', 'magnetization4', 'energy2',
+              'specific_heat', 'susceptibility', 'binder')
+
+
+def autocorrelation(series):
+    """
+    Normalized autocorrelation function rho(t) of a time series for t = 0..len(series)-1, computed with an FFT.
+    """
+    series = np.asarray(series, dtype=float)
+    n = len(series)
+    centered = series - series.mean()
+
+    spectrum = np.fft.rfft(centered, n=2 * n)
+    correlation = np.fft.irfft(spectrum * np.conj(spectrum))[:n] / np.arange(n, 0, -1)
+
+    if correlation[0] == 0:
+        return np.ones(n)
+    return correlation / correlation[0]
+
+
+def integrated_autocorrelation_time(series, window_factor=6):
+    """
+    Integrated autocorrelation time tau_int = 1/2 + sum_t rho(t), summed up to the first window W with
+    W >= window_factor * tau_int(W) (Sokal's automatic windowing). The error of the mean of n correlated samples is
+    sqrt(2 * tau_int / n) times the naive one.
+    """
+    n = len(series)
+    if n < 2:
+        return 0.5
+
+    rho = autocorrelation(series)
+    tau = 0.5 + np.cumsum(rho[1:])
+    windows = np.arange(1, n)
+
+    cut = np.flatnonzero(windows >= window_factor * tau)
+    return max(0.5, tau[cut[0]] if cut.size else tau[-1])
+
+
+def binning_errors(series, min_bins=16):
+    """
+    Error of the mean of a correlated time series for bin sizes 1, 2, 4, ...: the series is cut into bins, and the
+    error is the standard error of the bin means. The error grows with the bin size until the bins are longer than
+    the correlations, the plateau is the true error.
+
+    Returns
+        bin_sizes, errors (np.array)
+    """
+    series = np.asarray(series, dtype=float)
+
+    bin_sizes, errors = [], []
+    bin_size = 1
+    while len(series) // bin_size >= min_bins:
+        n_bins = len(series) // bin_size
+        means = series[:n_bins * bin_size].reshape(n_bins, bin_size).mean(axis=1)
+        bin_sizes.append(bin_size)
+        errors.append(means.std(ddof=1) / np.sqrt(n_bins))
+        bin_size *= 2
+
+    return np.array(bin_sizes), np.array(errors)
+
+
+def jackknife(function, columns, n_blocks=20):
+    """
+    Jackknife estimate and error of function(*means) of several time series, e.g. a variance or a ratio of moments.
+    The series are cut into n_blocks blocks (which should be much longer than the autocorrelation time), and the
+    function is evaluated on the means with one block left out at a time.
+
+    Parameters
+        function (callable): takes the means of the columns
+        columns (list of np.array): equally long time series
+        n_blocks (int): number of jackknife blocks
+
+    Returns
+        value, error (float)
+    """
+    n = len(columns[0])
+    n_blocks = min(n_blocks, n)
+    size = n // n_blocks
+
+    block_sums = np.array([[column[i * size:(i + 1) * size].sum() for i in range(n_blocks)] for column in columns])
+    totals = block_sums.sum(axis=1)
+
+    value = function(*(totals / (n_blocks * size)))
+    leave_one_out = np.array([function(*((totals - block_sums[:, i]) / ((n_blocks - 1) * size))) for i in range(n_blocks)])
+
+    error = np.sqrt((n_blocks - 1) / n_blocks * np.sum((leave_one_out - leave_one_out.mean())**2))
+    bias = (n_blocks - 1) * (leave_one_out.mean() - value)
+    return value - bias, error
+
+
+class MeasurementSeries:
+    """
+    Streaming measurements of one ClassicIsing run at fixed temperature. Every add appends the energy per site and
+    the signed magnetization per site of one sweep, and updates running sums of E, E^2, |M|, M^2 and M^4, so the
+    plain means are available in O(1) at any time. The kept time series (two floats per sweep) give
+    autocorrelation-aware error bars and the derived quantities:
+
+        specific_heat  = N * (<e^2> - <e>^2) / (k T)^2          per site, in units of k
+        susceptibility = N * magnetic_moment * (<m^2> - <|m|>^2) / (k T)   d<|m|>/dh per site, h the model's field
+        binder         = 1 - <m^4> / (3 <m^2>^2)
+
+    Parameters
+        temperature (float): Temperature of the run
+        n_sites (int): Number of sites N
+        magnetic_moment (float): magnetic moment of the grid points
+        Boltzmann (float): Boltzmann constant of the model
+        capacity (int): Number of sweeps initially allocated, the series grow when they run out
+    """
+
+    def __init__(self, temperature, n_sites, magnetic_moment, Boltzmann=1.380649*10**-23, capacity=1024):
+
+        self.temperature = temperature
+        self.n_sites = n_sites
+        self.magnetic_moment = magnetic_moment
+        self.Boltzmann = Boltzmann
+
+        self.n_samples = 0
+        self.capacity = max(1, capacity)
+        self.energy_values = np.zeros(self.capacity)
+        self.magnetization_values = np.zeros(self.capacity)
+
+        self.sums = dict.fromkeys(('energy', 'energy2', 'abs_magnetization', 'magnetization2', 'magnetization4'), 0.0)
+
+        # set by ClassicIsing.measure when a target precision was requested
+        self.converged = None
+
+    ### overloaded methods ###
+
+    def __len__(self):
+        return self.n_samples
+
+    ### properties ###
+
+    @property
+    def energies(self):
+        """Energy per site of every sample."""
+        return self.energy_values[:self.n_samples]
+
+    @property
+    def magnetizations(self):
+        """Signed magnetization per site of every sample."""
+        return self.magnetization_values[:self.n_samples]
+
+    @property
+    def beta(self):
+        return 1 / (self.Boltzmann * self.temperature)
+
+    ### class methods ###
+
+    @classmethod
+    def fromModel(cls, model, capacity=1024):
+        """Returns an empty MeasurementSeries for the current temperature and lattice of a ClassicIsing model."""
+        return cls(model.temperature, model.grid.n_sites, model.magnetic_moment, model.Boltzmann, capacity)
+
+    @classmethod
+    def load(cls, path):
+        """Reads a MeasurementSeries written by save."""
+        with np.load(path) as data:
+            measurement = cls(float(data['temperature']), int(data['n_sites']), float(data['magnetic_moment']),
+                              float(data['Boltzmann']), capacity=len(data['energies']))
+            for energy, magnetization in zip(data['energies'].tolist(), data['magnetizations'].tolist()):
+                measurement.add(energy, magnetization)
+        return measurement
+
+    def save(self, path, **metadata):
+        """
+        Writes the series and its parameters (plus any extra scalar metadata) to a .npz file, atomically (see
+        trajectory.atomic_savez).
+        """
+        atomic_savez(path, dict(energies=self.energies, magnetizations=self.magnetizations, temperature=self.temperature,
+                                n_sites=self.n_sites, magnetic_moment=self.magnetic_moment, Boltzmann=self.Boltzmann, **metadata))
+
+    def add(self, energy, magnetization):
+        """
+        Appends one sample: the energy per site and the signed magnetization per site.
+        """
+        if self.n_samples == self.capacity:
+            self.capacity *= 2
+            self.energy_values = np.resize(self.energy_values, self.capacity)
+            self.magnetization_values = np.resize(self.magnetization_values, self.capacity)
+
+        self.energy_values[self.n_samples] = energy
+        self.magnetization_values[self.n_samples] = magnetization
+        self.n_samples += 1
+
+        m2 = magnetization * magnetization
+        self.sums['energy'] += energy
+        self.sums['energy2'] += energy * energy
+        self.sums['abs_magnetization'] += abs(magnetization)
+        self.sums['magnetization2'] += m2
+        self.sums['magnetization4'] += m2 * m2
+
+    def mean(self, quantity):
+        """Running mean of energy, energy2, abs_magnetization, magnetization2 or magnetization4."""
+        return self.sums[quantity] / self.n_samples if self.n_samples else np.nan
+
+    def series(self, quantity):
+        """Time series of one of the plain quantities."""
+        e, m = self.energies, self.magnetizations
+        return {
+            'energy': e,
+            'energy2': e * e,
+            'abs_magnetization': np.abs(m),
+            'magnetization2': m * m,
+            'magnetization4': m**4,
+        }[quantity]
+
+    def derived(self, quantity):
+        """
+        Returns (function, columns) such that function(*means of columns) is the quantity, for the jackknife.
+        """
+        N, beta = self.n_sites, self.beta
+        if quantity == 'specific_heat':
+            # energies are in J, scaled by beta before squaring to keep the numbers O(1)
+            return (lambda e, e2: N * (e2 - e * e)), [beta * self.energies, (beta * self.energies)**2]
+        if quantity == 'susceptibility':
+            return (lambda m, m2: N * beta * self.magnetic_moment * (m2 - m * m)), [self.series('abs_magnetization'), self.series('magnetization2')]
+        if quantity == 'binder':
+            return (lambda m2, m4: 1 - m4 / (3 * m2 * m2)), [self.series('magnetization2'), self.series('magnetization4')]
+        raise ValueError(f"Unknown quantity '{quantity}', expected one of {QUANTITIES}")
+
+    def autocorrelationTime(self, quantity='abs_magnetization'):
+        """Integrated autocorrelation time (in sweeps) of one of the plain quantities."""
+        return integrated_autocorrelation_time(self.series(quantity))
+
+    def binningErrors(self, quantity='abs_magnetization'):
+        """Binning analysis of one of the plain quantities, see binning_errors."""
+        return binning_errors(self.series(quantity))
+
+    def estimate(self, quantity, n_blocks=20):
+        """
+        Estimate and error bar of a quantity. Plain means get the error sqrt(2 tau_int / n) * sigma with their
+        integrated autocorrelation time, the derived quantities a jackknife error over n_blocks blocks.
+
+        Returns
+            value, error (float)
+        """
+        if self.n_samples < 2:
+            return (self.mean(quantity) if quantity in self.sums else np.nan), np.nan
+
+        if quantity in self.sums:
+            series = self.series(quantity)
+            tau = integrated_autocorrelation_time(series)
+            return self.mean(quantity), np.sqrt(2 * tau / self.n_samples) * series.std(ddof=1)
+
+        function, columns = self.derived(quantity)
+        return jackknife(function, columns, n_blocks)
+
+    def relativeError(self, quantity):
+        """Error bar of a quantity relative to its value."""
+        value, error = self.estimate(quantity)
+        return abs(error / value) if value else np.inf
+
+    def summary(self):
+        """Returns {quantity: (value, error)} for every quantity, plus the autocorrelation times and sample count."""
+        summary = {quantity: self.estimate(quantity) for quantity in QUANTITIES}
+        summary['tau_energy'] = self.autocorrelationTime('energy')
+        summary['tau_abs_magnetization'] = self.autocorrelationTime('abs_magnetization')
+        summary['n_samples'] = self.n_samples
+        return summary
@@ -0,0 +1,200 @@
+import numpy as np
+from grid import Grid, Torus, Cylinder
+from random_streams import make_stream
+
+ONE = np.uint64(1)
+ALL = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+
+def _rotate_right(words):
+    """Bit b of the result is bit b + 1 of words (bit 63 gets bit 0)."""
+    return (words >> ONE) | (words << np.uint64(63))
+
+
+def _rotate_left(words):
+    """Bit b of the result is bit b - 1 of words (bit 0 gets bit 63)."""
+    return (words << ONE) | (words >> np.uint64(63))
+
+
+def _popcount(words):
+    if hasattr(np, 'bitwise_count'):
+        return int(np.bitwise_count(words).sum(dtype=np.int64))
+    return int(np.unpackbits(np.ascontiguousarray(words).view(np.uint8)).sum(dtype=np.int64))
+
+
+def _bernoulli_mask(candidates, prob, rng):
+    """
+    Keeps every set bit of the candidates words independently with probability prob, from fresh random words. Every
+    bit compares the binary digits of its own uniform fraction u (one random word per digit) with those of prob, most
+    significant first, and is kept iff u < prob. A digit decides about half of the undecided bits and only the words
+    with undecided bits draw the next digit, so this takes about two random words per candidate word, and as the
+    binary expansion of a float is finite, prob is met exactly.
+    """
+    kept = np.zeros(candidates.size, dtype=np.uint64)
+    index = np.flatnonzero(candidates)
+    undecided = candidates.ravel()[index]
+
+    fraction = prob
+    while len(index) and fraction > 0:
+        fraction *= 2
+        digit = fraction >= 1
+        fraction -= digit
+
+        random = rng.bits(len(index))
+        if digit:
+            # u has a 0 where prob has a 1: u < prob
+            kept[index] |= undecided & ~random
+            undecided &= random
+        else:
+            undecided &= ~random
+
+        alive = undecided != 0
+        index, undecided = index[alive], undecided[alive]
+
+    return kept.reshape(candidates.shape)
+
+
+class MultiSpinLattice:
+    """
+    Multi spin coded copy of a Grid, Torus or Cylinder: 64 spins per uint64 word, a set bit is spin up.
+
+    Spin (x, y) is stored in bit b of word (x, w) with y = b * W + w and W = n_y / 64 words per row. Neighbors along y
+    are then the same bit of the next/previous word (rotated by one bit at the row end), neighbors along x are the
+    same word of the next/previous row. With W even every word holds a single checkerboard color ((x + w) % 2), so a
+    color is updated with whole word bit operations: the number of anti-aligned neighbors is counted bit-sliced with
+    XORs, and flips are accepted with random bit masks that are drawn fresh for every color of every sweep (see
+    _bernoulli_mask), so the acceptance noise of different sites and sweeps is independent.
+
+    Parameters
+        grid (Grid Object): Grid, Torus or Cylinder without holes, with n_y a multiple of 128 (and n_x even for a Torus)
+        rng (RandomStream): Random stream of the masks, the grid's stream by default
+    """
+
+    def __init__(self, grid, rng=None):
+
+        if type(grid) is Torus:
+            periodic_x, periodic_y = True, True
+        elif type(grid) is Cylinder:
+            periodic_x, periodic_y = False, True
+        elif type(grid) is Grid:
+            periodic_x, periodic_y = False, False
+        else:
+            raise ValueError(f"Multi spin coding supports Grid, Torus and Cylinder, not {type(grid).__name__}")
+
+        if grid.n_y % 128:
+            raise ValueError(f"Multi spin coding needs n_y to be a multiple of 128, got {grid.n_y}")
+        if periodic_x and grid.n_x % 2:
+            raise ValueError(f"Multi spin coding on a Torus needs an even n_x, got {grid.n_x}")
+
+        self.grid = grid
+        self.rng = grid.rng if rng is None else make_stream(rng)
+        self.n_x = grid.n_x
+        self.n_y = grid.n_y
+        self.n_words = grid.n_y // 64
+        self.periodic_x = periodic_x
+        self.periodic_y = periodic_y
+
+        # which neighbors exist (up, down, left, right), as bit masks per word
+        present = np.full((4, self.n_x, self.n_words), ALL)
+        if not periodic_y:
+            present[0, :, -1] &= ~(ONE << np.uint64(63))
+            present[1, :, 0] &= ~ONE
+        if not periodic_x:
+            present[2, 0] = 0
+            present[3, -1] = 0
+        self.present = present
+
+        # sites grouped by their number of neighbors, as bit masks
+        degree = self.bitCount(list(present))
+        self.degree_masks = {d: self.isCount(degree, d) for d in range(5)}
+
+        x, w = np.indices((self.n_x, self.n_words))
+        self.color_masks = [np.where((x + w) % 2 == color, ALL, np.uint64(0)) for color in (0, 1)]
+
+        self.pack(grid.grid)
+
+    ### class methods ###
+
+    def pack(self, spins):
+        """Packs an (n_x, n_y) array of +-1 spins into the words."""
+        up = (np.asarray(spins) > 0).reshape(self.n_x, 64, self.n_words).transpose(0, 2, 1)
+        self.words = np.packbits(up, axis=-1, bitorder='little').view('<u8').astype(np.uint64)[..., 0]
+
+    def unpack(self):
+        """Returns the spins as an (n_x, n_y) int8 array of +-1."""
+        bits = np.unpackbits(self.words.astype('<u8').view(np.uint8).reshape(self.n_x, self.n_words, 8), axis=-1, bitorder='little')
+        return (2 * bits.astype(np.int8) - 1).transpose(0, 2, 1).reshape(self.n_x, self.n_y)
+
+    def neighbors(self, words):
+        """The up, down, left and right neighbor words of every word (missing ones still need the present masks)."""
+        up = np.concatenate([words[:, 1:], _rotate_right(words[:, :1])], axis=1)
+        down = np.concatenate([_rotate_left(words[:, -1:]), words[:, :-1]], axis=1)
+        left = np.roll(words, 1, axis=0)
+        right = np.roll(words, -1, axis=0)
+        return up, down, left, right
+
+    @staticmethod
+    def bitCount(masks):
+        """Adds up to 7 bit masks bit-sliced, returning the 3 bit planes of the count of every bit position."""
+        planes = [np.zeros_like(masks[0]) for _ in range(3)]
+        for carry in masks:
+            for i in range(3):
+                planes[i], carry = planes[i] ^ carry, planes[i] & carry
+        return planes
+
+    @staticmethod
+    def isCount(planes, count):
+        """Bit mask of the positions whose bit-sliced count equals count."""
+        mask = np.full_like(planes[0], ALL)
+        for i, plane in enumerate(planes):
+            mask &= plane if (count >> i) & 1 else ~plane
+        return mask
+
+    def sweep(self, acceptance):
+        """
+        One checkerboard Metropolis sweep over both colors.
+
+        Parameters
+            acceptance (np.array): acceptance table of ClassicIsing, indexed [spin + 1, neighbor_sum + max_degree]
+        """
+        max_degree = (acceptance.shape[1] - 1) // 2
+
+        # group the (spin, degree, anti-aligned count) cases by their acceptance probability
+        cases = {}
+        for spin_bit in (0, 1):
+            spin = 2 * spin_bit - 1
+            for degree in range(5):
+                for anti in range(degree + 1):
+                    neighbor_sum = spin * (degree - 2 * anti)
+                    cases.setdefault(float(acceptance[spin + 1, neighbor_sum + max_degree]), []).append((spin_bit, degree, anti))
+
+        for color_mask in self.color_masks:
+            words = self.words
+            anti_planes = self.bitCount([(words ^ neighbor) & present for neighbor, present in zip(self.neighbors(words), self.present)])
+            anti_masks = [self.isCount(anti_planes, anti) for anti in range(5)]
+
+            flip = np.zeros_like(words)
+            for prob, group in cases.items():
+                if prob <= 0:
+                    continue
+                selected = np.zeros_like(words)
+                for spin_bit, degree, anti in group:
+                    selected |= (words if spin_bit else ~words) & self.degree_masks[degree] & anti_masks[anti]
+                selected &= color_mask
+                if prob < 1:
+                    selected = _bernoulli_mask(selected, prob, self.rng)
+                flip |= selected
+
+            self.words = words ^ flip
+
+    def totalSpin(self):
+        """Sum of all spins."""
+        return 2 * _popcount(self.words) - self.n_x * self.n_y
+
+    def bondSum(self):
+        """Sum of s_i * s_j over every link, counting the up and right link of every site."""
+        up, _, _, right = self.neighbors(self.words)
+        bonds = 0
+        for neighbor, present in ((up, self.present[0]), (right, self.present[3])):
+            bonds += _popcount(present) - 2 * _popcount((self.words ^ neighbor) & present)
+        return bonds
@@ -0,0 +1,105 @@
+import numpy as np
+
+
+class ObservableRecorder:
+    """
+    Computes a set of observables on the fly while a simulation runs and keeps only their values, in compact growable
+    arrays, instead of the full states. Used by TransverseIsing.observe.
+
+    Every observable is either a callable taking (model, state) (e.g. TransverseIsing.energy, or a lambda) or the name
+    of a model method taking the state, e.g. 'magnetization'. A list of names records every name under itself.
+
+    Parameters
+        observables (dict or list): name -> callable or method name, or a list of method names
+        stride (int): Only every stride-th call of record is evaluated
+        capacity (int): Number of values initially allocated per observable, the arrays grow when they run out
+
+    After a run, recorder['name'] (or recorder.series()) gives the recorded values and recorder.times the time of
+    each of them.
+    """
+
+    def __init__(self, observables, stride=1, capacity=1024):
+
+        if not isinstance(observables, dict):
+            observables = {name: name for name in observables}
+
+        self.observables = dict(observables)
+        self.stride = stride
+        self.calls = 0
+        self.n_values = 0
+
+        self.capacity = max(1, capacity)
+        self.time_values = np.zeros(self.capacity)
+        # allocated on the first record, once the type (real or complex) of every observable is known
+        self.values = None
+
+    ### overloaded methods ###
+
+    def __len__(self):
+        return self.n_values
+
+    def __getitem__(self, name):
+        if self.values is None:
+            return np.zeros(0)
+        return self.values[name][:self.n_values]
+
+    def __contains__(self, name):
+        return name in self.observables
+
+    ### properties ###
+
+    @property
+    def times(self):
+        """Time of every recorded value."""
+        return self.time_values[:self.n_values]
+
+    ### class methods ###
+
+    def evaluate(self, model, state):
+        """Returns the value of every observable for the given state."""
+        results = {}
+        for name, observable in self.observables.items():
+            if isinstance(observable, str):
+                results[name] = getattr(model, observable)(state)
+            else:
+                results[name] = observable(model, state)
+        return results
+
+    def record(self, model, state, time):
+        """
+        Called once per step, evaluates the observables if the step falls on the stride.
+        """
+        self.calls += 1
+        if self.calls % self.stride == 0:
+            self.append(model, state, time)
+
+    def append(self, model, state, time):
+        """
+        Evaluates and stores the observables, regardless of the stride.
+        """
+        results = self.evaluate(model, state)
+
+        if self.values is None:
+            self.values = {name: np.zeros(self.capacity, dtype=np.result_type(float, np.asarray(value).dtype))
+                           for name, value in results.items()}
+
+        if self.n_values == self.capacity:
+            self.grow(2 * self.capacity)
+
+        self.time_values[self.n_values] = time
+        for name, value in results.items():
+            self.values[name][self.n_values] = value
+        self.n_values += 1
+
+    def grow(self, capacity):
+        """Reallocates every array with room for capacity values."""
+        self.time_values = np.resize(self.time_values, capacity)
+        if self.values is not None:
+            self.values = {name: np.resize(values, capacity) for name, values in self.values.items()}
+        self.capacity = capacity
+
+    def series(self):
+        """Returns the recorded values of every observable as a dict of arrays, plus 'time'."""
+        series = {name: self[name].copy() for name in self.observables}
+        series['time'] = self.times.copy()
+        return series
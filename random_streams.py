@@ -0,0 +1,194 @@
+import json
+import numpy as np
+
+
+class RandomStream:
+    """
+    Independent random number stream built on np.random.Generator, used by every simulation path instead of the
+    global np.random state, so runs in parallel processes, notebooks and ensembles never interfere with each other.
+
+    Single draws (uniform, integer) are served from buffers that are refilled in bulk, which avoids the overhead of
+    one generator call per proposed flip. Array draws (random, integers, choice) go straight to the generator.
+    Independent child streams (e.g. one per replica or worker) are derived with spawn.
+
+    Parameters
+        seed (int, None, np.random.SeedSequence or np.random.Generator): Seed of the stream, None draws fresh entropy
+        buffer_size (int): Number of values drawn at once to refill a buffer
+    """
+
+    def __init__(self, seed=None, buffer_size=4096):
+
+        if isinstance(seed, np.random.Generator):
+            self.generator = seed
+            self.seed_sequence = getattr(seed.bit_generator, 'seed_seq', None)
+        else:
+            self.seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+            self.generator = np.random.Generator(np.random.PCG64(self.seed_sequence))
+
+        self.buffer_size = buffer_size
+
+        self.uniform_buffer = np.empty(0)
+        self.uniform_position = 0
+        # high -> [buffer, position] of the buffered integers in [0, high)
+        self.integer_buffers = {}
+
+    ### class methods ###
+
+    def uniform(self):
+        """A single uniform float in [0, 1), from the buffer."""
+        if self.uniform_position == len(self.uniform_buffer):
+            self.uniform_buffer = self.generator.random(self.buffer_size)
+            self.uniform_position = 0
+
+        value = self.uniform_buffer[self.uniform_position]
+        self.uniform_position += 1
+        return value
+
+    def integer(self, high):
+        """A single integer in [0, high), from the buffer of that range."""
+        buffer = self.integer_buffers.get(high)
+        if buffer is None or buffer[1] == len(buffer[0]):
+            buffer = self.integer_buffers[high] = [self.generator.integers(0, high, size=self.buffer_size), 0]
+
+        value = buffer[0][buffer[1]]
+        buffer[1] += 1
+        return int(value)
+
+    def random(self, size=None):
+        """Uniform floats in [0, 1) of the given shape."""
+        return self.generator.random(size)
+
+    def integers(self, high, size=None):
+        """Integers in [0, high) of the given shape."""
+        return self.generator.integers(0, high, size=size)
+
+    def bits(self, size=None):
+        """Uniformly random uint64 words (64 independent fair bits each) of the given shape."""
+        return self.generator.integers(0, 2**64, size=size, dtype=np.uint64)
+
+    def choice(self, values, size=None):
+        """Elements of values drawn uniformly with replacement."""
+        return self.generator.choice(values, size=size)
+
+    def getState(self):
+        """
+        Returns everything that determines the stream's future draws: the bit generator state (a JSON-able dict), the
+        number of children spawned so far and the unused parts of the buffers. Restore it with setState.
+        """
+        return {
+            'bit_generator': self.generator.bit_generator.state,
+            'n_children_spawned': None if self.seed_sequence is None else self.seed_sequence.n_children_spawned,
+            'uniform_buffer': self.uniform_buffer[self.uniform_position:].copy(),
+            'integer_buffers': {high: buffer[0][buffer[1]:].copy() for high, buffer in self.integer_buffers.items()},
+        }
+
+    def setState(self, state):
+        """
+        Restores a state returned by getState, after which the stream draws exactly what it would have drawn then.
+        """
+        self.generator.bit_generator.state = state['bit_generator']
+
+        if self.seed_sequence is not None and state['n_children_spawned'] is not None:
+            sequence = self.seed_sequence
+            self.seed_sequence = np.random.SeedSequence(sequence.entropy, spawn_key=sequence.spawn_key, pool_size=sequence.pool_size,
+                                                        n_children_spawned=state['n_children_spawned'])
+
+        self.uniform_buffer = np.array(state['uniform_buffer'], dtype=float)
+        self.uniform_position = 0
+        self.integer_buffers = {int(high): [np.array(buffer), 0] for high, buffer in state['integer_buffers'].items()}
+
+    def spawn(self, n_children):
+        """
+        Returns n_children new, statistically independent streams derived from this stream's SeedSequence. Repeated
+        calls keep returning new streams.
+        """
+        if self.seed_sequence is None:
+            return [RandomStream(generator, self.buffer_size) for generator in self.generator.spawn(n_children)]
+        return [RandomStream(child, self.buffer_size) for child in self.seed_sequence.spawn(n_children)]
+
+
+def make_stream(seed=None):
+    """
+    Returns seed itself if it already is a RandomStream, otherwise a new RandomStream seeded with it.
+    """
+    if isinstance(seed, RandomStream):
+        return seed
+    return RandomStream(seed)
+
+
+def _stream_header(stream, state):
+    # JSON-able seed sequence and generator state of a stream, shared by stream_arrays and stream_state
+    sequence = stream.seed_sequence
+    return {
+        'entropy': None if sequence is None else sequence.entropy,
+        'spawn_key': None if sequence is None else list(sequence.spawn_key),
+        'pool_size': None if sequence is None else sequence.pool_size,
+        'buffer_size': stream.buffer_size,
+        'bit_generator': state['bit_generator'],
+        'n_children_spawned': state['n_children_spawned'],
+    }
+
+
+def _new_stream(header):
+    # a RandomStream with the seed sequence described by a _stream_header, its state still has to be set
+    seed = None
+    if header['entropy'] is not None:
+        seed = np.random.SeedSequence(header['entropy'], spawn_key=header['spawn_key'], pool_size=header['pool_size'])
+    return RandomStream(seed, header['buffer_size'])
+
+
+def stream_arrays(stream, prefix='rng'):
+    """
+    Packs a RandomStream (its seed sequence and its state, see RandomStream.getState) into a dict of arrays for an
+    .npz file, the entries are prefixed with prefix.
+    """
+    state = stream.getState()
+    header = _stream_header(stream, state)
+    header['integer_highs'] = [int(high) for high in state['integer_buffers']]
+
+    arrays = {f'{prefix}_header': np.array(json.dumps(header)), f'{prefix}_uniform': state['uniform_buffer']}
+    for high, buffer in state['integer_buffers'].items():
+        arrays[f'{prefix}_integers_{high}'] = buffer
+    return arrays
+
+
+def restore_stream(stream, arrays, prefix='rng'):
+    """Puts a RandomStream into the state packed by stream_arrays."""
+    header = json.loads(str(arrays[f'{prefix}_header']))
+    stream.setState({
+        'bit_generator': header['bit_generator'],
+        'n_children_spawned': header['n_children_spawned'],
+        'uniform_buffer': arrays[f'{prefix}_uniform'],
+        'integer_buffers': {high: arrays[f'{prefix}_integers_{high}'] for high in header['integer_highs']},
+    })
+
+
+def stream_from_arrays(arrays, prefix='rng'):
+    """Returns a new RandomStream, with the same seed sequence and state as the one packed by stream_arrays."""
+    stream = _new_stream(json.loads(str(arrays[f'{prefix}_header'])))
+    restore_stream(stream, arrays, prefix)
+    return stream
+
+
+def stream_state(stream):
+    """
+    JSON-able description of a RandomStream, for metadata in JSON headers: the same seed sequence and state as
+    stream_arrays, with the buffers as lists. stream_from_state rebuilds the stream.
+    """
+    state = stream.getState()
+    header = _stream_header(stream, state)
+    header['uniform_buffer'] = state['uniform_buffer'].tolist()
+    header['integer_buffers'] = {str(high): buffer.tolist() for high, buffer in state['integer_buffers'].items()}
+    return header
+
+
+def stream_from_state(state):
+    """Returns a new RandomStream, with the same seed sequence and state as the one described by stream_state."""
+    stream = _new_stream(state)
+    stream.setState({
+        'bit_generator': state['bit_generator'],
+        'n_children_spawned': state['n_children_spawned'],
+        'uniform_buffer': state['uniform_buffer'],
+        'integer_buffers': {int(high): np.array(buffer, dtype=np.int64) for high, buffer in state['integer_buffers'].items()},
+    })
+    return stream
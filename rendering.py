@@ -0,0 +1,226 @@
+import os
+import shutil
+import subprocess
+import numpy as np
+from PIL import Image, GifImagePlugin
+
+# RGB colors of spin -1, 0 and +1 (palette index spin + 1), the colors of plot_spin_orient and animate_ising
+PALETTE = np.array([
+    [75, 0, 130],       # indigo = down
+    [211, 211, 211],    # lightgray = neither (holes)
+    [255, 215, 0],      # gold = up
+], dtype=np.uint8)
+
+
+def downsample_spins(frames, factor):
+    """
+    Shrinks (..., n_x, n_y) spin frames by an integer factor: every factor x factor block becomes the sign of its
+    spin sum (majority vote, 0 on ties and in holes). Rows and columns that don't fill a whole block are dropped.
+    """
+    if factor == 1:
+        return frames
+
+    n_x, n_y = frames.shape[-2] // factor, frames.shape[-1] // factor
+    blocks = frames[..., :n_x * factor, :n_y * factor].reshape(frames.shape[:-2] + (n_x, factor, n_y, factor))
+    return np.sign(blocks.sum(axis=(-3, -1), dtype=np.int32)).astype(np.int8)
+
+
+def palette_indices(frames, downsample=1, scale=1):
+    """
+    Converts (..., n_x, n_y) spin frames into palette indices (spin + 1, uint8), after downsampling large lattices
+    and enlarging small ones by an integer scale (every site becomes a scale x scale block of pixels).
+    """
+    indices = (downsample_spins(np.asarray(frames, dtype=np.int8), downsample) + 1).astype(np.uint8)
+    if scale > 1:
+        indices = np.repeat(np.repeat(indices, scale, axis=-2), scale, axis=-1)
+    return indices
+
+
+def spins_to_rgb(frames, palette=PALETTE, downsample=1, scale=1):
+    """
+    Maps (..., n_x, n_y) spin frames to (..., height, width, 3) uint8 RGB images with one palette lookup.
+    """
+    return np.asarray(palette, dtype=np.uint8)[palette_indices(frames, downsample, scale)]
+
+
+def frame_chunks(source, start=0, stop=None, step=1, chunk=256):
+    """
+    Yields the frames start:stop:step of a frame source as int8 stacks of at most chunk frames, so arbitrarily long
+    runs are never held in memory at once. The source can be an (n_frames, n_x, n_y) array or memmap, a
+    trajectory.TrajectoryReader or a history.GridHistory (read through their stack methods), or a list of frames.
+    A negative step plays the frames backwards, every chunk is read forwards and then reversed.
+    """
+    frame_numbers = range(*slice(start, stop, step).indices(len(source)))
+
+    for first in range(0, len(frame_numbers), chunk):
+        numbers = frame_numbers[first:first + chunk]
+        begin, end = min(numbers), max(numbers) + 1
+
+        if hasattr(source, 'stack'):
+            frames = source.stack(begin, end, abs(step))
+        else:
+            frames = np.asarray(source[begin:end:abs(step)])
+        if step < 0:
+            frames = frames[::-1]
+        yield frames.astype(np.int8, copy=False)
+
+
+class GifWriter:
+    """
+    Writes a GIF frame by frame. Spin images only have three colors, so frames go in as palette indices without any
+    color quantization, and every frame is encoded and written to the file right away.
+
+    Parameters
+        path (str): Output file
+        fps (float): Frames per second
+        palette (np.array): (n_colors, 3) uint8 RGB palette, indexed by the frames
+        loop (int or None): Number of loops, 0 repeats forever, None plays once
+    """
+
+    def __init__(self, path, fps=20, palette=PALETTE, loop=0):
+
+        self.path = path
+        self.duration = int(round(1000 / fps))
+        self.palette = np.asarray(palette, dtype=np.uint8)
+        self.loop = loop
+        self.file = open(path, 'wb')
+        self.n_frames = 0
+
+    ### overloaded methods ###
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    ### class methods ###
+
+    def image(self, indices):
+        """Palette ('P' mode) image of one frame of palette indices."""
+        image = Image.frombytes('P', indices.shape[::-1], indices.tobytes())
+        image.putpalette(self.palette.ravel().tolist())
+        return image
+
+    def write(self, frames):
+        """Appends a (n_frames, height, width) stack of palette indices."""
+        for indices in frames:
+            image = self.image(np.ascontiguousarray(indices))
+
+            if self.n_frames == 0:
+                info = {'optimize': False} if self.loop is None else {'optimize': False, 'loop': self.loop}
+                header, _ = GifImagePlugin.getheader(image, info=info)
+                self.file.writelines(header)
+
+            self.file.writelines(GifImagePlugin.getdata(image, duration=self.duration))
+            self.n_frames += 1
+
+    def close(self):
+        """Writes the trailer and closes the file."""
+        if self.file is not None:
+            self.file.write(b';')
+            self.file.close()
+            self.file = None
+
+
+class Mp4Writer:
+    """
+    Writes an H.264 MP4 by streaming raw RGB frames into an ffmpeg process. Needs the ffmpeg executable, either on
+    the PATH or the one shipped with the imageio-ffmpeg package.
+
+    Parameters
+        path (str): Output file
+        fps (float): Frames per second
+        palette (np.array): (n_colors, 3) uint8 RGB palette, indexed by the frames
+        crf (int): x264 quality, lower is better
+    """
+
+    def __init__(self, path, fps=20, palette=PALETTE, crf=18):
+
+        self.path = path
+        self.fps = fps
+        self.palette = np.asarray(palette, dtype=np.uint8)
+        self.crf = crf
+        self.process = None
+        self.n_frames = 0
+
+    ### overloaded methods ###
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    ### class methods ###
+
+    @staticmethod
+    def ffmpeg():
+        """Path of the ffmpeg executable."""
+        executable = shutil.which('ffmpeg')
+        if executable is None:
+            try:
+                import imageio_ffmpeg
+                executable = imageio_ffmpeg.get_ffmpeg_exe()
+            except ImportError:
+                raise RuntimeError("MP4 export needs ffmpeg, install it or the imageio-ffmpeg package") from None
+        return executable
+
+    def start(self, height, width):
+        """Starts ffmpeg for frames of the given size (padded to even sizes, which yuv420p needs)."""
+        command = [
+            self.ffmpeg(), '-y', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{width}x{height}', '-r', str(self.fps), '-i', '-',
+            '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-crf', str(self.crf),
+            self.path,
+        ]
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def write(self, frames):
+        """Appends a (n_frames, height, width) stack of palette indices."""
+        if self.process is None:
+            self.start(*frames.shape[1:])
+        self.process.stdin.write(np.ascontiguousarray(self.palette[frames]).tobytes())
+        self.n_frames += len(frames)
+
+    def close(self):
+        """Flushes the frames and waits for ffmpeg to finish the file."""
+        if self.process is not None:
+            self.process.stdin.close()
+            if self.process.wait() != 0:
+                raise RuntimeError(f"ffmpeg failed writing {self.path}")
+            self.process = None
+
+
+def render_spins(source, path, fps=20, start=0, stop=None, step=1, downsample=1, scale=1, palette=PALETTE, chunk=256):
+    """
+    Exports a spin animation straight from raw frames, without matplotlib: the frames are read chunk by chunk
+    (see frame_chunks), mapped to palette colors with one indexing operation per chunk and streamed to the writer.
+    The format follows the extension of path, .gif or .mp4.
+
+    Parameters
+        source: frames, a (n_frames, n_x, n_y) int8 array or memmap, a TrajectoryReader, a GridHistory or a list
+        path (str): Output file, .gif or .mp4
+        fps (float): Frames per second
+        start, stop, step (int): Frames to render, e.g. step=10 renders every 10th frame
+        downsample (int): Shrinks huge lattices by this factor (majority vote of factor x factor blocks)
+        scale (int): Enlarges small lattices, every site becomes scale x scale pixels
+        palette (np.array): Colors of spin -1, 0 and +1
+        chunk (int): Number of frames read and converted at once
+
+    Returns
+        n_frames (int): number of frames written
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.gif':
+        writer = GifWriter(path, fps, palette)
+    elif extension == '.mp4':
+        writer = Mp4Writer(path, fps, palette)
+    else:
+        raise ValueError(f"Unsupported animation format '{extension}', expected .gif or .mp4")
+
+    with writer:
+        for frames in frame_chunks(source, start, stop, step, chunk):
+            writer.write(palette_indices(frames, downsample, scale))
+
+    return writer.n_frames
@@ -0,0 +1,345 @@
+import glob
+import hashlib
+import inspect
+import json
+import os
+import numpy as np
+
+from history import GridHistory
+from measurements import MeasurementSeries
+from random_streams import stream_arrays, restore_stream
+from equilibrator import proper_equilibration
+from temperature_sweep import temperature_sweep
+from trajectory import atomic_savez
+
+
+def digest(*parts):
+    """
+    sha256 hex digest of a mix of JSON-able values and numpy arrays (hashed by dtype, shape and bytes).
+    """
+    hasher = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            hasher.update(f'{part.dtype.str}{part.shape}'.encode())
+            hasher.update(np.ascontiguousarray(part).tobytes())
+        else:
+            hasher.update(json.dumps(part, sort_keys=True, default=repr).encode())
+    return hasher.hexdigest()
+
+
+def model_parameters(model):
+    """
+    Parameters that fix the physics of a ClassicIsing model: topology, lattice shape, temperature, coupling, field
+    and magnetic moment. The structure (neighbor table, signs and mask) is hashed, so the hole of a HoleGrid, the seam
+    of a Mobius strip or the adjacency of a GraphGrid are part of it.
+    """
+    grid = model.grid
+    mask = np.ones(0, dtype=bool) if grid.mask is None else grid.mask
+    return {
+        'topology': type(grid).__name__,
+        'shape': list(grid.grid.shape),
+        'structure': digest(grid.neighbors, grid.neighbor_signs, mask),
+        'temperature': float(model.temperature),
+        'ferromagnetivity': float(model.ferromagnetivity),
+        'Mf_External': float(model.ExternalMagneticField),
+        'magnetic_moment': float(model.magnetic_moment),
+    }
+
+
+class ResultCache:
+    """
+    Content addressed on-disk cache of simulation results. Every result is stored in one .npz file named after the
+    sha256 hash of everything that determines it: the model parameters (see model_parameters), the spins and the
+    random stream state the run starts from, and the operation with its arguments. A rerun of the same notebook cell
+    (same topology, size, T, J, field, seed and sweeps) therefore finds its result instead of simulating again, and
+    on a hit the model is left in exactly the state the run would have produced, random stream included, so later
+    cells continue identically.
+
+    Least recently used files are evicted once the cache grows past max_bytes (or max_entries). Spin
+    configurations are also tagged with a family hash (the parameters without the temperature), through which
+    warmStart can load the configuration cached at the nearest temperature as the starting point of a new run.
+
+    A grid history is not stored: the history settings are part of the key, and on a hit the grid starts a new
+    history whose first frame is the cached final configuration (as after restoring a checkpoint). Runs that record
+    a trajectory or write checkpoints bypass the cache, as those by-products are files the cache can't restore.
+
+    Parameters
+        directory (str): Cache directory
+        max_bytes (int): Size bound of the cache
+        max_entries (int or None): Optional bound of the number of files
+    """
+
+    def __init__(self, directory='ising_cache', max_bytes=2**30, max_entries=None):
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+    ### overloaded methods ###
+
+    def __len__(self):
+        return len(self.entries())
+
+    def __contains__(self, key):
+        return self.find(key) is not None
+
+    ### class methods ###
+
+    def entries(self):
+        """Paths of every cached file."""
+        return [path for path in glob.glob(os.path.join(self.directory, '*.npz')) if not path.endswith('.tmp.npz')]
+
+    def nbytes(self):
+        """Total size of the cached files."""
+        return sum(os.path.getsize(path) for path in self.entries())
+
+    def find(self, key):
+        """Path of the file of a key, or None."""
+        paths = glob.glob(os.path.join(self.directory, f'*{key}.npz'))
+        return paths[0] if paths else None
+
+    def load(self, key):
+        """
+        Returns the arrays stored under key (as a dict) and marks the file as recently used, or None on a miss.
+        """
+        path = self.find(key)
+        if path is None:
+            self.misses += 1
+            return None
+
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in data.files}
+        os.utime(path)
+        self.hits += 1
+        return arrays
+
+    def store(self, key, arrays, family=None):
+        """
+        Writes arrays under key (atomically, see trajectory.atomic_savez), then evicts old files if the cache is over
+        its bounds.
+        """
+        name = key if family is None else f'{family[:16]}_{key}'
+        path = os.path.join(self.directory, name + '.npz')
+        atomic_savez(path, arrays)
+
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep=None):
+        """
+        Deletes least recently used files (by modification time, which load refreshes) until the cache is within
+        max_bytes and max_entries. The file keep, e.g. the one just written, is never deleted.
+        """
+        entries = sorted(((os.path.getmtime(path), os.path.getsize(path), path) for path in self.entries()))
+        total = sum(size for _, size, _ in entries)
+        count = len(entries)
+
+        for _, size, path in entries:
+            if total <= self.max_bytes and (self.max_entries is None or count <= self.max_entries):
+                break
+            if path == keep:
+                continue
+            os.remove(path)
+            total -= size
+            count -= 1
+
+    def clear(self):
+        """Deletes every cached file."""
+        for path in self.entries():
+            os.remove(path)
+
+    def family(self, model):
+        """Hash of the model parameters without the temperature, shared by the configurations warmStart can use."""
+        parameters = model_parameters(model)
+        del parameters['temperature']
+        return digest(parameters)
+
+    def stateKey(self, model, operation, **arguments):
+        """Key of an operation applied to the model in its current state (spins and random streams)."""
+        streams = [model.rng.getState()]
+        if model.grid.rng is not model.rng:
+            streams.append(model.grid.rng.getState())
+
+        stream_parts = []
+        for state in streams:
+            stream_parts += [state['bit_generator'], state['n_children_spawned'], state['uniform_buffer']]
+            stream_parts += [part for high in sorted(state['integer_buffers']) for part in (high, state['integer_buffers'][high])]
+
+        return digest(operation, arguments, model_parameters(model), self.historySettings(model), model.grid.grid, *stream_parts)
+
+    def historySettings(self, model):
+        """Settings of the grid history a run records, None if it records none."""
+        grid = model.grid
+        if not grid.record_history:
+            return None
+        history = GridHistory() if grid.history_settings is None else grid.history_settings
+        return {'stride': history.stride, 'capacity': history.capacity, 'packing': history.packing, 'delta': history.delta,
+                'keyframe_interval': history.keyframe_interval}
+
+    def bypass(self, model):
+        """Whether a run has by-products the cache can't restore: a trajectory file or checkpoint files."""
+        return model.trajectory is not None or model.checkpointer is not None
+
+    def modelArrays(self, model, sweeps_before):
+        """
+        Arrays describing the final state of a model: spins, random streams, temperature and the number of sweeps run
+        since sweeps_before.
+        """
+        arrays = {'spins': np.array(model.grid.grid), 'temperature': np.array(float(model.temperature)),
+                  'sweeps': np.array(model.sweeps - sweeps_before)}
+        arrays.update(stream_arrays(model.rng, 'rng'))
+        if model.grid.rng is not model.rng:
+            arrays.update(stream_arrays(model.grid.rng, 'grid_rng'))
+        return arrays
+
+    def restoreModel(self, model, arrays):
+        """
+        Puts a model into the final state stored by modelArrays. A recorded grid history restarts from the final
+        configuration, the intermediate frames are not cached.
+        """
+        model.grid.grid = arrays['spins']
+        if model.grid.record_history:
+            model.grid.grid_history = model.grid.newHistory()
+        restore_stream(model.rng, arrays, 'rng')
+        if model.grid.rng is not model.rng:
+            restore_stream(model.grid.rng, arrays, 'grid_rng')
+        model.sweeps += int(arrays['sweeps'])
+
+    def warmStart(self, model, window=None):
+        """
+        Loads the cached spin configuration of the same topology, size, coupling and field whose temperature is
+        closest to the model's (within window, if given) into the model's grid.
+
+        Returns
+            temperature (float or None): temperature of the configuration used, None if there is none
+        """
+        best, best_distance = None, np.inf
+        for path in glob.glob(os.path.join(self.directory, f'{self.family(model)[:16]}_*.npz')):
+            with np.load(path) as data:
+                if 'spins' not in data.files:
+                    continue
+                distance = abs(float(data['temperature']) - model.temperature)
+            if distance < best_distance and (window is None or distance <= window):
+                best, best_distance = path, distance
+
+        if best is None:
+            return None
+
+        with np.load(best) as data:
+            model.grid.grid = data['spins']
+            temperature = float(data['temperature'])
+        os.utime(best)
+        return temperature
+
+    def runSimulation(self, model, n_steps, update_rule='metropolis', warm_start=False, window=None):
+        """
+        Cached ClassicIsing.runSimulation. With warm_start, a miss first loads the nearest cached configuration (see
+        warmStart), which makes the result depend on the cache contents.
+        """
+        update_rule = getattr(update_rule, '__name__', update_rule)
+        if self.bypass(model):
+            model.runSimulation(n_steps, update_rule)
+            return
+
+        key = self.stateKey(model, 'runSimulation', n_steps=n_steps, update_rule=update_rule)
+        arrays = self.load(key)
+        if arrays is not None:
+            self.restoreModel(model, arrays)
+            return
+
+        if warm_start:
+            self.warmStart(model, window)
+        sweeps_before = model.sweeps
+        model.runSimulation(n_steps, update_rule)
+        self.store(key, self.modelArrays(model, sweeps_before), self.family(model))
+
+    def proper_equilibration(self, model, equil_tolerance=.9, max_attempts=10, temps=None, update_rule='checkerboard', warm_start=False, window=None):
+        """
+        Cached equilibrator.proper_equilibration, returns whether the grid equilibrated. With warm_start, a miss
+        starts from the nearest cached configuration (see warmStart).
+        """
+        update_rule = getattr(update_rule, '__name__', update_rule)
+        if self.bypass(model):
+            return proper_equilibration(model, equil_tolerance, max_attempts, temps, update_rule)
+
+        temps_list = None if temps is None else np.asarray(temps, dtype=float).tolist()
+        key = self.stateKey(model, 'proper_equilibration', equil_tolerance=equil_tolerance, max_attempts=max_attempts,
+                            temps=temps_list, update_rule=update_rule)
+        arrays = self.load(key)
+        if arrays is not None:
+            self.restoreModel(model, arrays)
+            return bool(arrays['equilibrated'])
+
+        if warm_start:
+            self.warmStart(model, window)
+        sweeps_before = model.sweeps
+        equilibrated = proper_equilibration(model, equil_tolerance, max_attempts, temps, update_rule)
+
+        arrays = self.modelArrays(model, sweeps_before)
+        arrays['equilibrated'] = np.array(equilibrated)
+        self.store(key, arrays, self.family(model))
+        return equilibrated
+
+    def measure(self, model, n_steps=1000, update_rule='checkerboard', target_error=None, quantity='abs_magnetization', max_steps=100000):
+        """
+        Cached ClassicIsing.measure (without continuing an existing series), returns the MeasurementSeries.
+        """
+        update_rule = getattr(update_rule, '__name__', update_rule)
+        if self.bypass(model):
+            return model.measure(n_steps, update_rule, target_error, quantity, max_steps)
+
+        key = self.stateKey(model, 'measure', n_steps=n_steps, update_rule=update_rule, target_error=target_error,
+                            quantity=quantity, max_steps=max_steps)
+        arrays = self.load(key)
+        if arrays is not None:
+            self.restoreModel(model, arrays)
+            measurement = MeasurementSeries.fromModel(model, capacity=len(arrays['energies']))
+            for energy, magnetization in zip(arrays['energies'].tolist(), arrays['magnetizations'].tolist()):
+                measurement.add(energy, magnetization)
+            # -1 stands for None, the run had no target precision
+            if arrays['converged'] >= 0:
+                measurement.converged = bool(arrays['converged'])
+            model.measurement = measurement
+            return measurement
+
+        sweeps_before = model.sweeps
+        measurement = model.measure(n_steps, update_rule, target_error, quantity, max_steps)
+
+        arrays = self.modelArrays(model, sweeps_before)
+        arrays['energies'] = measurement.energies
+        arrays['magnetizations'] = measurement.magnetizations
+        arrays['converged'] = np.array(-1 if measurement.converged is None else int(measurement.converged))
+        self.store(key, arrays, self.family(model))
+        return measurement
+
+    def temperature_sweep(self, topology, n_x, n_y, temps, root_seed=None, max_workers=None, **kwargs):
+        """
+        Cached temperature_sweep.temperature_sweep, keyed on all of its arguments except max_workers (which doesn't
+        change the result). Without a root_seed every sweep draws fresh entropy and is not cached.
+        """
+        if root_seed is None:
+            return temperature_sweep(topology, n_x, n_y, temps, root_seed=root_seed, max_workers=max_workers, **kwargs)
+
+        # bound with the defaults filled in, so passing a default explicitly or leaving it out gives the same key
+        arguments = inspect.signature(temperature_sweep).bind(topology, n_x, n_y, temps, root_seed=root_seed, **kwargs)
+        arguments.apply_defaults()
+        arguments = dict(arguments.arguments)
+        del arguments['max_workers']
+
+        topology_kwargs = arguments.pop('topology_kwargs') or {}
+        arguments['topology'] = topology.__name__
+        arguments['temps'] = np.asarray(temps, dtype=float).tolist()
+        arguments['update_rule'] = getattr(arguments['update_rule'], '__name__', arguments['update_rule'])
+        key = digest('temperature_sweep', arguments, *[part for name in sorted(topology_kwargs) for part in (name, topology_kwargs[name])])
+
+        arrays = self.load(key)
+        if arrays is not None:
+            return arrays['results']
+
+        results = temperature_sweep(topology, n_x, n_y, temps, root_seed=root_seed, max_workers=max_workers, **kwargs)
+        self.store(key, {'results': results})
+        return results
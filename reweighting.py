@@ -0,0 +1,198 @@
+import numpy as np
+from scipy.optimize import minimize_scalar
+from scipy.special import logsumexp
+
+# one row per temperature in the result of Reweighting.curves
+CURVE_DTYPE = np.dtype([
+    ('temperature', float),
+    ('energy', float),
+    ('abs_magnetization', float),
+    ('specific_heat', float),
+    ('susceptibility', float),
+    ('binder', float),
+    ('n_effective', float),
+])
+
+
+def measure_temperatures(model, temperatures, n_steps=10000, n_equilibration=1000, update_rule='checkerboard'):
+    """
+    Records the energy and magnetization series of a model at a few temperatures, the input of Reweighting. The
+    temperatures are run in the given order, each starting from the last configuration of the previous one.
+
+    Parameters
+        model (ClassicIsing): model to run, its temperature is changed
+        temperatures (iterable): Temperatures to simulate
+        n_steps (int): Measured sweeps per temperature
+        n_equilibration (int): Sweeps discarded after every temperature change
+        update_rule (method or str): update rule passed on to update
+
+    Returns
+        measurements (list of MeasurementSeries)
+    """
+    measurements = []
+    for temperature in temperatures:
+        model.changeTemp(temperature)
+        model.runSimulation(n_equilibration, update_rule)
+        measurements.append(model.measure(n_steps, update_rule))
+    return measurements
+
+
+class Reweighting:
+    """
+    Multi histogram reweighting (Ferrenberg-Swendsen, also known as WHAM) of ClassicIsing measurements. Every sample
+    of every run at temperature T_i is an energy E (of the whole lattice) drawn from exp(-E / kT_i) * g(E), g the
+    density of states. Combining the runs with the self-consistent free energies
+
+        exp(-f_i) = sum_samples exp(-E / kT_i) / sum_j n_j * exp(f_j - E / kT_j)
+
+    gives every sample the weight exp(-E / kT) / sum_j n_j * exp(f_j - E / kT_j) at any temperature T, so averages
+    become continuous functions of T. A single run is plain single histogram reweighting. The results are reliable
+    between and slightly around the simulated temperatures, where the energy histograms of the runs overlap, which
+    the n_effective column of curves shows.
+
+    Correlated samples count less: with use_autocorrelation, run i enters with n_i / (2 tau_i) effective samples and
+    its samples with weight 1 / (2 tau_i), tau_i the integrated autocorrelation time of its energy.
+
+    Parameters
+        measurements (list of MeasurementSeries): runs of the same lattice, coupling and field at different
+            temperatures
+        use_autocorrelation (bool): Weight the runs by their autocorrelation times
+        tol (float): Convergence threshold of the free energies
+        max_iter (int): Maximum number of self-consistency iterations
+    """
+
+    def __init__(self, measurements, use_autocorrelation=True, tol=1e-10, max_iter=10000):
+
+        measurements = [measurement for measurement in measurements if len(measurement)]
+        if not measurements:
+            raise ValueError("Reweighting needs at least one non-empty measurement")
+
+        first = measurements[0]
+        for measurement in measurements[1:]:
+            if measurement.n_sites != first.n_sites or measurement.magnetic_moment != first.magnetic_moment:
+                raise ValueError("All measurements have to come from the same lattice and magnetic moment")
+
+        self.measurements = measurements
+        self.n_sites = first.n_sites
+        self.magnetic_moment = first.magnetic_moment
+        self.Boltzmann = first.Boltzmann
+
+        self.temperatures = np.array([measurement.temperature for measurement in measurements], dtype=float)
+
+        # energies in units of k (K per site) so that E / kT stays O(1) and never over- or underflows
+        self.energies = np.concatenate([measurement.energies for measurement in measurements]) / self.Boltzmann
+        self.magnetizations = np.concatenate([measurement.magnetizations for measurement in measurements])
+
+        if use_autocorrelation:
+            inefficiency = np.array([2 * measurement.autocorrelationTime('energy') for measurement in measurements])
+        else:
+            inefficiency = np.ones(len(measurements))
+        n_samples = np.array([len(measurement) for measurement in measurements])
+
+        self.log_n_effective = np.log(n_samples / inefficiency)
+        self.log_sample_weights = np.repeat(-np.log(inefficiency), n_samples)
+
+        # reduced energies E_k / kT_j of every sample k at every simulated temperature j
+        self.reduced = self.n_sites * self.energies[None, :] / self.temperatures[:, None]
+
+        self.free_energies = self.solveFreeEnergies(tol, max_iter)
+        self.log_denominator = logsumexp(self.log_n_effective[:, None] + self.free_energies[:, None] - self.reduced, axis=0)
+
+    ### class methods ###
+
+    def solveFreeEnergies(self, tol=1e-10, max_iter=10000):
+        """
+        Iterates the Ferrenberg-Swendsen equations until the dimensionless free energies f_i (with f_0 = 0) change by
+        less than tol.
+        """
+        free_energies = np.zeros(len(self.temperatures))
+
+        for iteration in range(max_iter):
+            log_denominator = logsumexp(self.log_n_effective[:, None] + free_energies[:, None] - self.reduced, axis=0)
+            updated = -logsumexp(self.log_sample_weights - self.reduced - log_denominator, axis=1)
+            updated -= updated[0]
+
+            change = np.max(np.abs(updated - free_energies))
+            free_energies = updated
+            if change < tol:
+                break
+
+        return free_energies
+
+    def logWeights(self, temperature):
+        """Normalized log weights of every sample at the given temperature."""
+        log_weights = self.log_sample_weights - self.n_sites * self.energies / temperature - self.log_denominator
+        return log_weights - logsumexp(log_weights)
+
+    def moments(self, temperature):
+        """
+        Reweighted <e>, <e^2>, <|m|>, <m^2>, <m^4> (e in units of k per site) and the effective number of samples
+        (sum w)^2 / sum w^2 at the given temperature.
+        """
+        weights = np.exp(self.logWeights(temperature))
+        e, m = self.energies, self.magnetizations
+        m2 = m * m
+
+        return {
+            'energy': np.dot(weights, e),
+            'energy2': np.dot(weights, e * e),
+            'abs_magnetization': np.dot(weights, np.abs(m)),
+            'magnetization2': np.dot(weights, m2),
+            'magnetization4': np.dot(weights, m2 * m2),
+            'n_effective': 1 / np.dot(weights, weights),
+        }
+
+    def observables(self, temperature):
+        """
+        Reweighted energy per site (in J), <|m|>, specific heat, susceptibility and Binder cumulant at the given
+        temperature, defined as in measurements.MeasurementSeries.
+        """
+        moments = self.moments(temperature)
+        beta = 1 / (self.Boltzmann * temperature)
+
+        return {
+            'temperature': temperature,
+            'energy': self.Boltzmann * moments['energy'],
+            'abs_magnetization': moments['abs_magnetization'],
+            'specific_heat': self.n_sites * (moments['energy2'] - moments['energy']**2) / temperature**2,
+            'susceptibility': self.n_sites * beta * self.magnetic_moment * (moments['magnetization2'] - moments['abs_magnetization']**2),
+            'binder': 1 - moments['magnetization4'] / (3 * moments['magnetization2']**2),
+            'n_effective': moments['n_effective'],
+        }
+
+    def curves(self, temperatures):
+        """
+        Reweighted observables over a dense range of temperatures.
+
+        Returns
+            np.ndarray: structured array (CURVE_DTYPE) with one row per temperature
+        """
+        curves = np.zeros(len(temperatures), dtype=CURVE_DTYPE)
+        for i, temperature in enumerate(temperatures):
+            observables = self.observables(temperature)
+            curves[i] = tuple(observables[name] for name in CURVE_DTYPE.names)
+        return curves
+
+    def peak(self, quantity='susceptibility', bounds=None, n_grid=64):
+        """
+        Temperature and height of the maximum of a reweighted observable (e.g. specific_heat or susceptibility). The
+        maximum is bracketed on a grid of n_grid temperatures and then refined by a bounded scalar minimization.
+
+        Parameters
+            quantity (str): observable, one of the CURVE_DTYPE names
+            bounds (tuple): temperature range to search, the range of the simulated temperatures by default
+
+        Returns
+            temperature, value (float)
+        """
+        low, high = (self.temperatures.min(), self.temperatures.max()) if bounds is None else bounds
+        if low == high:
+            return low, self.observables(low)[quantity]
+
+        grid = np.linspace(low, high, n_grid)
+        values = [self.observables(temperature)[quantity] for temperature in grid]
+        best = int(np.argmax(values))
+
+        bracket = (grid[max(best - 1, 0)], grid[min(best + 1, n_grid - 1)])
+        result = minimize_scalar(lambda temperature: -self.observables(temperature)[quantity], bounds=bracket, method='bounded')
+        return result.x, -result.fun
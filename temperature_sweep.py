@@ -0,0 +1,143 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+import electron
+from random_streams import RandomStream
+from ising_model import ClassicIsing
+from equilibrator import proper_equilibration
+
+# one row per temperature in the result of temperature_sweep
+SWEEP_DTYPE = np.dtype([
+    ('temperature', float),
+    ('abs_magnetization', float),
+    ('abs_magnetization_err', float),
+    ('energy', float),
+    ('energy_err', float),
+    ('n_samples', int),
+])
+
+
+def run_temperature_job(job):
+    """
+    Runs one (temperature, replica) job of a temperature sweep. Module level so worker processes can unpickle it.
+
+    Parameters
+        job (dict): topology, n_x, n_y, topology_kwargs, temperature, J, mf_external, seed (np.random.SeedSequence),
+            equil_steps, mc_steps, runs_per_T, update_rule, use_proper_equilibration, equil_tolerance
+
+    Returns
+        abs_mags, energies (np.array): per measurement block, the mean |M| and the mean energy per site
+    """
+    # every job runs on its own stream, so results don't depend on which worker runs it or in what order
+    grid = job['topology'](job['n_x'], job['n_y'], electron.ClassicElectron, record_history=False, rng=RandomStream(job['seed']), **job['topology_kwargs'])
+    model = ClassicIsing(grid, job['temperature'], job['J'], job['mf_external'])
+
+    if job['use_proper_equilibration']:
+        proper_equilibration(model, equil_tolerance=job['equil_tolerance'])
+    model.runSimulation(job['equil_steps'], job['update_rule'])
+
+    abs_mags = np.zeros(job['runs_per_T'])
+    energies = np.zeros(job['runs_per_T'])
+    for run in range(job['runs_per_T']):
+        # observables are running totals, so every sweep of the block can be sampled
+        for step in range(job['mc_steps']):
+            model.update(job['update_rule'])
+            abs_mags[run] += model.magnetization()
+            energies[run] += model.energy / grid.n_sites
+    abs_mags /= job['mc_steps']
+    energies /= job['mc_steps']
+
+    return abs_mags, energies
+
+
+def temperature_sweep(topology, n_x, n_y, temps, J=1, mf_external=0, n_replicas=1, equil_steps=200, mc_steps=70,
+                      runs_per_T=5, update_rule='checkerboard', root_seed=None, max_workers=None, topology_kwargs=None,
+                      use_proper_equilibration=False, equil_tolerance=.9):
+    """
+    Measures |M| and the energy over a range of temperatures, running every (temperature, replica) pair as an
+    independent job on a process pool.
+
+    Every job gets its own random stream spawned from np.random.SeedSequence(root_seed) in a fixed order, so for a
+    given root_seed the result is the same no matter how many workers are used.
+
+    Parameters:
+    -----------
+    topology : Grid class
+        Grid, HoleGrid, Torus, Cylinder or Mobius.
+    n_x, n_y : int
+        Lattice size.
+    temps : array-like
+        Temperatures to measure at.
+    J, mf_external : float
+        Coupling constant and external field.
+    n_replicas : int
+        Independent replicas (fresh random grids) per temperature.
+    equil_steps : int
+        Sweeps run at the target temperature before measuring.
+    mc_steps : int
+        Sweeps per measurement block. Every sweep is sampled, the block means are the samples for the error bars.
+    runs_per_T : int
+        Measurement blocks per replica.
+    update_rule : str
+        Name of the ClassicIsing update rule to use.
+    root_seed : int or None
+        Seed of the root SeedSequence, None draws fresh entropy.
+    max_workers : int or None
+        Number of worker processes, None uses every core. 1 runs the jobs in this process.
+    topology_kwargs : dict
+        Extra arguments of the topology (e.g. hole_grid).
+    use_proper_equilibration : bool
+        Whether to run proper_equilibration before the equil_steps sweeps.
+    equil_tolerance : float
+        Tolerance passed on to proper_equilibration.
+
+    Returns:
+    --------
+    np.ndarray
+        Structured array (SWEEP_DTYPE) with one row per temperature: mean |M|, mean energy per site and their
+        standard errors over all blocks of all replicas.
+    """
+    temps = np.asarray(temps, dtype=float)
+    seeds = np.random.SeedSequence(root_seed).spawn(len(temps) * n_replicas)
+
+    jobs = []
+    for i, T in enumerate(temps):
+        for replica in range(n_replicas):
+            jobs.append({
+                'topology': topology,
+                'n_x': n_x,
+                'n_y': n_y,
+                'topology_kwargs': {} if topology_kwargs is None else topology_kwargs,
+                'temperature': T,
+                'J': J,
+                'mf_external': mf_external,
+                'seed': seeds[i * n_replicas + replica],
+                'equil_steps': equil_steps,
+                'mc_steps': mc_steps,
+                'runs_per_T': runs_per_T,
+                'update_rule': update_rule,
+                'use_proper_equilibration': use_proper_equilibration,
+                'equil_tolerance': equil_tolerance,
+            })
+
+    if max_workers == 1:
+        outputs = [run_temperature_job(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            outputs = list(executor.map(run_temperature_job, jobs))
+
+    results = np.zeros(len(temps), dtype=SWEEP_DTYPE)
+    for i, T in enumerate(temps):
+        block = outputs[i * n_replicas:(i + 1) * n_replicas]
+        abs_mags = np.concatenate([abs_mag for abs_mag, _ in block])
+        energies = np.concatenate([energy for _, energy in block])
+
+        n = len(abs_mags)
+        results[i] = (
+            T,
+            abs_mags.mean(), abs_mags.std(ddof=1) / np.sqrt(n) if n > 1 else np.nan,
+            energies.mean(), energies.std(ddof=1) / np.sqrt(n) if n > 1 else np.nan,
+            n,
+        )
+
+    return results
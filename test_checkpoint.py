@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+import electron
+from grid import Torus, HoleGrid, Mobius
+from ising_model import ClassicIsing
+
+GRIDS = {
+    'torus': lambda: Torus(8, 128, electron.ClassicElectron, record_history=False, random_seed=1),
+    'hole grid': lambda: HoleGrid(20, 16, electron.ClassicElectron, random_seed=2, hole_grid=np.ones((3, 5)), c_x=5),
+    'antiperiodic mobius': lambda: Mobius(12, 10, electron.ClassicElectron, record_history=False, random_seed=3, seam_sign=-1),
+}
+
+
+def run(model):
+    """A mix of update rules and a measurement, returns the final spins, the measured energies and the next draw."""
+    model.runSimulation(10, 'checkerboard')
+    model.runSimulation(2, 'metropolis')
+    model.runSimulation(3, 'wolff')
+    model.runSimulation(2, 'swendsen_wang')
+    if model.grid.n_y % 128 == 0:
+        model.runSimulation(2, 'multispin')
+    measurement = model.measure(20, 'checkerboard', measurement=model.measurement)
+    return model.grid.grid.copy(), measurement.energies.copy(), model.rng.uniform()
+
+
+@pytest.mark.parametrize('name', GRIDS)
+def test_continued_run_is_identical(tmp_path, name):
+    path = str(tmp_path / 'checkpoint.npz')
+
+    model = ClassicIsing(GRIDS[name](), 1.4, 1, 0.2)
+    run(model)
+    model.saveCheckpoint(path)
+    spins, energies, draw = run(model)
+
+    restored = ClassicIsing.loadCheckpoint(path)
+    restored_spins, restored_energies, restored_draw = run(restored)
+
+    assert np.array_equal(spins, restored_spins)
+    assert np.array_equal(energies, restored_energies)
+    assert draw == restored_draw
+    assert restored.sweeps == model.sweeps
+
+
+def test_periodic_checkpoints(tmp_path):
+    path = str(tmp_path / 'periodic.npz')
+
+    model = ClassicIsing(GRIDS['torus'](), 1.5, 1, 0)
+    model.checkpointEvery(path, 10)
+    model.runSimulation(35, 'checkerboard')
+    model.stopCheckpoints()
+
+    restored = ClassicIsing.loadCheckpoint(path)
+    assert restored.sweeps == model.sweeps == 35
+    assert np.array_equal(restored.grid.grid, model.grid.grid)
+    assert not (tmp_path / 'periodic.npz.tmp.npz').exists()
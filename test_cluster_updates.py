@@ -0,0 +1,47 @@
+import itertools
+import numpy as np
+import pytest
+
+import electron
+from grid import Torus, Cylinder, Mobius, HoleGrid
+from ising_model import ClassicIsing
+
+
+def exact_abs_magnetization(model):
+    """<|m|> by enumerating every spin configuration of a small grid."""
+    grid = model.grid
+    sites = grid.active_sites
+    beta = 1 / (model.Boltzmann * model.temperature)
+
+    energies, magnetizations = [], []
+    for spins in itertools.product([-1, 1], repeat=len(sites)):
+        grid.flat_spins[sites] = spins
+        flat = grid.flat_spins[:grid.n_sites]
+        bonds = np.sum(flat * grid.neighborSums(slice(None))) / 2
+        energies.append(-model.magnetic_moment * (model.ferromagnetivity * bonds + model.ExternalMagneticField * flat.sum()))
+        magnetizations.append(abs(flat.sum()) / grid.n_sites)
+    grid.recount()
+
+    energies = np.array(energies)
+    weights = np.exp(-beta * (energies - energies.min()))
+    return np.dot(weights, magnetizations) / weights.sum()
+
+
+GRIDS = {
+    'torus': lambda: Torus(4, 3, electron.ClassicElectron, record_history=False, random_seed=1),
+    'antiperiodic mobius': lambda: Mobius(4, 3, electron.ClassicElectron, record_history=False, random_seed=2, seam_sign=-1),
+    'cylinder': lambda: Cylinder(4, 3, electron.ClassicElectron, record_history=False, random_seed=3),
+    'hole grid': lambda: HoleGrid(4, 4, electron.ClassicElectron, record_history=False, random_seed=4, hole_grid=np.ones((2, 2))),
+}
+
+
+@pytest.mark.parametrize('update_rule', ['wolff', 'swendsen_wang'])
+@pytest.mark.parametrize('name, temperature, field', [('torus', 1.2, 0), ('antiperiodic mobius', 1.0, 0.3),
+                                                      ('cylinder', 0.8, -0.4), ('hole grid', 1.0, 0.2)])
+def test_cluster_update_matches_enumeration(update_rule, name, temperature, field):
+    model = ClassicIsing(GRIDS[name](), temperature, 1, field)
+    exact = exact_abs_magnetization(model)
+
+    model.runSimulation(200, update_rule)
+    value, error = model.measure(10000, update_rule).estimate('abs_magnetization')
+    assert abs(value - exact) < 5 * error + 1e-3
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from exact_diagonalization import ground_state, low_spectrum, symmetry_sector
+
+X = np.array([[0, 1], [1, 0]])
+Z = np.diag([1, -1])
+
+
+def site_operator(operator, i, n):
+    """operator acting on qubit i of n, with qubit i the bit 1 << i of the basis state index."""
+    return np.kron(np.kron(np.eye(2**(n - 1 - i)), operator), np.eye(2**i))
+
+
+def dense_hamiltonian(n, J, h):
+    """Dense H = -J * sum_i Z_i Z_(i+1) - h * sum_i X_i of the periodic chain."""
+    return -sum(J * site_operator(Z, i, n) @ site_operator(Z, (i + 1) % n, n) + h * site_operator(X, i, n) for i in range(n))
+
+
+@pytest.mark.parametrize('n', range(3, 9))
+@pytest.mark.parametrize('J, h', [(1, 0.5), (1, 1), (0.7, 1.6)])
+def test_sectors_reproduce_full_spectrum(n, J, h):
+    full = np.linalg.eigvalsh(dense_hamiltonian(n, J, h))
+
+    sectors = [symmetry_sector(n, momentum, parity) for momentum in range(n) for parity in (1, -1)]
+    assert sum(sector.dim for sector in sectors) == 2**n
+
+    spectrum = np.sort(np.concatenate([np.linalg.eigvalsh(sector.hamiltonian(J, h).toarray()) for sector in sectors]))
+    assert np.allclose(spectrum, full, atol=1e-10)
+
+
+@pytest.mark.parametrize('n', range(3, 9))
+def test_ground_state_energy_and_gap(n):
+    full = np.linalg.eigvalsh(dense_hamiltonian(n, 1, 0.8))
+
+    result = ground_state(n, 1, 0.8, momenta=range(n))
+    assert result['energy'] == pytest.approx(full[0], abs=1e-10)
+    assert result['gap'] == pytest.approx(full[1] - full[0], abs=1e-10)
+
+    lowest = min(energies[0] for energies, _ in low_spectrum(n, 1, 0.8, momenta=range(n)).values())
+    assert lowest == pytest.approx(full[0], abs=1e-10)
+
+
+@pytest.mark.parametrize('n', [4, 7])
+def test_expanded_ground_state_is_an_eigenvector(n):
+    result = ground_state(n, 1, 1.3)
+    psi = symmetry_sector(n, *result['sector']).expand(result['vector'])
+    assert np.allclose(dense_hamiltonian(n, 1, 1.3) @ psi, result['energy'] * psi, atol=1e-10)
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+import electron
+from grid import Grid, Torus, Cylinder
+from ising_model import ClassicIsing
+from multispin import MultiSpinLattice, _bernoulli_mask, _popcount
+from random_streams import RandomStream
+
+
+@pytest.mark.parametrize('topology', [Grid, Torus, Cylinder])
+def test_packing_and_totals(topology):
+    grid = topology(6, 256, electron.ClassicElectron, record_history=False, random_seed=1)
+    lattice = MultiSpinLattice(grid)
+
+    assert np.array_equal(lattice.unpack(), grid.grid)
+    assert lattice.totalSpin() == grid.total_spin
+    assert lattice.bondSum() == grid.bond_sum
+
+
+@pytest.mark.parametrize('prob', [0.5, 0.1, 1 / 3, 0.9])
+def test_bernoulli_mask(prob):
+    candidates = np.full(4096, np.uint64(0xFFFFFFFFFFFFFFFF))
+    candidates[::2] = np.uint64(0xF0F0F0F0F0F0F0F0)
+    kept = _bernoulli_mask(candidates, prob, RandomStream(1))
+
+    assert not np.any(kept & ~candidates)
+    n_candidates = _popcount(candidates)
+    fraction = _popcount(kept) / n_candidates
+    assert abs(fraction - prob) < 5 * np.sqrt(prob * (1 - prob) / n_candidates)
+
+
+def measure(topology, temperature, field, update_rule):
+    grid = topology(16, 128, electron.ClassicElectron, record_history=False, random_seed=2)
+    model = ClassicIsing(grid, temperature, 1, field)
+    model.runSimulation(200, update_rule)
+    return model.measure(2000, update_rule)
+
+
+@pytest.mark.parametrize('topology, temperature, field', [(Torus, 2.0, 0), (Torus, 1.3, 0.1), (Cylinder, 1.7, -0.1)])
+def test_multispin_matches_checkerboard(topology, temperature, field):
+    checkerboard = measure(topology, temperature, field, 'checkerboard')
+    multispin = measure(topology, temperature, field, 'multispin')
+
+    for quantity in ('energy', 'abs_magnetization'):
+        value, error = checkerboard.estimate(quantity)
+        multispin_value, multispin_error = multispin.estimate(quantity)
+        assert abs(value - multispin_value) < 5 * np.hypot(error, multispin_error)
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from history import GridHistory
+from rendering import frame_chunks
+
+
+def sources():
+    """23 frames as an array, a list and a delta encoded GridHistory."""
+    # frame i is recognizable by the position of its single flipped site
+    frames = np.ones((23, 5, 5), dtype=np.int8)
+    frames.reshape(23, 25)[np.arange(23), np.arange(23)] = -1
+
+    history = GridHistory(delta=True, keyframe_interval=4)
+    for frame in frames:
+        history.append(frame)
+    return frames, {'array': frames, 'list': list(frames), 'history': history}
+
+
+@pytest.mark.parametrize('name', ['array', 'list', 'history'])
+@pytest.mark.parametrize('start, stop, step', [(None, None, -1), (20, 2, -3), (None, None, 2), (3, 19, 1), (-1, 0, -5)])
+def test_frame_chunks_match_slicing(name, start, stop, step):
+    frames, by_name = sources()
+    chunks = list(frame_chunks(by_name[name], start, stop, step, chunk=4))
+
+    assert all(len(frames_of_chunk) <= 4 for frames_of_chunk in chunks)
+    assert np.array_equal(np.concatenate(chunks), frames[start:stop:step])
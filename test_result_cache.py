@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+import electron
+from grid import Torus, HoleGrid
+from ising_model import ClassicIsing
+from result_cache import ResultCache
+
+
+def make_model(record_history=False):
+    grid = HoleGrid(12, 12, electron.ClassicElectron, record_history=record_history, random_seed=7, hole_grid=np.ones((2, 3)))
+    return ClassicIsing(grid, 1.4, 1, 0.1)
+
+
+def state(model):
+    return model.grid.grid.copy(), model.sweeps, model.rng.spawn(1)[0].uniform()
+
+
+@pytest.mark.parametrize('record_history', [False, True])
+def test_hit_and_miss_leave_the_same_state(tmp_path, record_history):
+    cache = ResultCache(str(tmp_path))
+    models = [make_model(record_history), make_model(record_history)]
+
+    for model in models:
+        cache.runSimulation(model, 30, 'checkerboard')
+        measurement = cache.measure(model, 50, 'checkerboard')
+        assert model.measurement is measurement
+    assert (cache.misses, cache.hits) == (2, 2)
+
+    (spins, sweeps, draw), (hit_spins, hit_sweeps, hit_draw) = state(models[0]), state(models[1])
+    assert np.array_equal(spins, hit_spins)
+    assert sweeps == hit_sweeps == 80
+    assert draw == hit_draw
+    assert np.array_equal(models[0].measurement.energies, models[1].measurement.energies)
+    if record_history:
+        assert np.array_equal(models[1].grid.grid_history[-1], hit_spins)
+
+    # continuing the series after a hit continues the cached one
+    for model in models:
+        model.measure(10, 'checkerboard', measurement=model.measurement)
+    assert np.array_equal(models[0].measurement.energies, models[1].measurement.energies)
+
+
+def test_checkpointing_runs_bypass_the_cache(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'))
+    model = make_model()
+    model.checkpointEvery(str(tmp_path / 'checkpoint.npz'), 10)
+    cache.runSimulation(model, 20, 'checkerboard')
+    model.stopCheckpoints()
+    assert len(cache) == 0
+
+
+def test_temperature_sweep_key_includes_defaults(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    kwargs = {'root_seed': 1, 'max_workers': 1, 'mc_steps': 5, 'equil_steps': 5, 'runs_per_T': 1}
+
+    results = cache.temperature_sweep(Torus, 8, 8, [1.5, 2.0], **kwargs)
+    explicit = cache.temperature_sweep(Torus, 8, 8, [1.5, 2.0], update_rule='checkerboard', topology_kwargs=None, J=1, **kwargs)
+    assert cache.hits == 1
+    for name in results.dtype.names:
+        assert np.array_equal(results[name], explicit[name], equal_nan=True)
+
+    cache.temperature_sweep(Torus, 8, 8, [1.5, 2.0], **dict(kwargs, max_workers=2))
+    assert cache.hits == 2
+    cache.temperature_sweep(Torus, 8, 8, [1.5, 2.0], J=0.5, **kwargs)
+    assert cache.misses == 2
@@ -0,0 +1,73 @@
+import itertools
+
+import numpy as np
+import pytest
+
+import electron
+from grid import Torus
+from ising_model import ClassicIsing
+from reweighting import Reweighting, measure_temperatures
+
+
+@pytest.fixture(scope='module')
+def measurement():
+    model = ClassicIsing(Torus(6, 6, electron.ClassicElectron, record_history=False, random_seed=1), 1.6, 1, 0.05)
+    model.runSimulation(200, 'checkerboard')
+    return model.measure(3000, 'checkerboard')
+
+
+@pytest.mark.parametrize('use_autocorrelation', [True, False])
+def test_single_temperature_reproduces_raw_averages(measurement, use_autocorrelation):
+    reweighting = Reweighting([measurement], use_autocorrelation=use_autocorrelation)
+    observables = reweighting.observables(measurement.temperature)
+
+    e, e2 = measurement.mean('energy'), measurement.mean('energy2')
+    m, m2, m4 = measurement.mean('abs_magnetization'), measurement.mean('magnetization2'), measurement.mean('magnetization4')
+    beta = measurement.beta
+
+    assert observables['energy'] == pytest.approx(e, rel=1e-9)
+    assert observables['abs_magnetization'] == pytest.approx(m, rel=1e-9)
+    assert observables['specific_heat'] == pytest.approx(measurement.n_sites * beta**2 * (e2 - e * e), rel=1e-6)
+    assert observables['susceptibility'] == pytest.approx(measurement.n_sites * beta * measurement.magnetic_moment * (m2 - m * m), rel=1e-9)
+    assert observables['binder'] == pytest.approx(1 - m4 / (3 * m2 * m2), rel=1e-9)
+    assert observables['n_effective'] == pytest.approx(len(measurement))
+
+
+@pytest.fixture(scope='module')
+def reweighted_runs():
+    model = ClassicIsing(Torus(4, 3, electron.ClassicElectron, record_history=False, random_seed=2), 1.5, 1, 0)
+    return model, measure_temperatures(model, [1.5, 1.9], n_steps=4000, n_equilibration=200)
+
+
+def exact_observables(model, temperature):
+    """<E> per site and <|m|> at a temperature, by enumerating every spin configuration of a small grid."""
+    grid = model.grid
+    sites = grid.active_sites
+    beta = 1 / (model.Boltzmann * temperature)
+
+    energies, magnetizations = [], []
+    for spins in itertools.product([-1, 1], repeat=len(sites)):
+        grid.flat_spins[sites] = spins
+        flat = grid.flat_spins[:grid.n_sites]
+        bonds = np.sum(flat * grid.neighborSums(slice(None))) / 2
+        energies.append(-model.magnetic_moment * (model.ferromagnetivity * bonds + model.ExternalMagneticField * flat.sum()) / grid.n_sites)
+        magnetizations.append(abs(flat.sum()) / grid.n_sites)
+    grid.recount()
+
+    energies = np.array(energies)
+    weights = np.exp(-beta * grid.n_sites * (energies - energies.min()))
+    return np.dot(weights, energies) / weights.sum(), np.dot(weights, magnetizations) / weights.sum()
+
+
+@pytest.mark.parametrize('temperature', [1.6, 1.7, 1.8])
+def test_reweighting_between_temperatures_matches_enumeration(reweighted_runs, temperature):
+    model, measurements = reweighted_runs
+    observables = Reweighting(measurements).observables(temperature)
+    energy, abs_magnetization = exact_observables(model, temperature)
+
+    for quantity, exact in (('energy', energy), ('abs_magnetization', abs_magnetization)):
+        # the reweighted value can't be more precise than the runs it comes from
+        error = max(measurement.estimate(quantity)[1] for measurement in measurements)
+        assert observables[quantity] == pytest.approx(exact, abs=3 * error)
+        # and neither end point is already that close
+        assert all(abs(measurement.mean(quantity) - exact) > 3 * error for measurement in measurements)
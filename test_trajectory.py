@@ -0,0 +1,49 @@
+import numpy as np
+
+import electron
+from grid import Torus
+from ising_model import ClassicIsing
+from random_streams import stream_from_state
+from trajectory import TrajectoryWriter, TrajectoryReader
+
+
+def test_unclosed_writer_is_readable_up_to_the_last_flush(tmp_path):
+    path = str(tmp_path / 'run')
+    writer = TrajectoryWriter(path, (4, 4), capacity=8, flush_every=10)
+    for i in range(57):
+        writer.append(np.full((4, 4), i, dtype=np.int8))
+
+    # the writer is never closed, as after a crash
+    reader = TrajectoryReader(path)
+    assert len(reader) == 50
+    assert np.array_equal(reader.stack()[:, 0, 0], np.arange(50))
+
+
+def test_closed_writer_keeps_every_frame(tmp_path):
+    path = str(tmp_path / 'run')
+    with TrajectoryWriter(path, (2, 3), stride=2, flush_every=4) as writer:
+        for i in range(15):
+            writer.record(np.full((2, 3), i, dtype=np.int8))
+
+    reader = TrajectoryReader(path)
+    assert len(reader) == 7
+    assert np.array_equal(reader.stack()[:, 0, 0], np.arange(1, 15, 2))
+    assert not (tmp_path / 'run.json.tmp').exists()
+
+
+def test_trajectory_metadata_reproduces_the_run(tmp_path):
+    path = str(tmp_path / 'run')
+    model = ClassicIsing(Torus(8, 8, electron.ClassicElectron, record_history=False, rng=np.random.default_rng(3)), 1.6, 1, 0)
+    model.runSimulation(5, 'metropolis')
+    model.recordTrajectory(path)
+    model.runSimulation(20, 'metropolis')
+    model.stopTrajectory()
+
+    reader = TrajectoryReader(path)
+    assert reader.metadata['grid_rng'] is None
+
+    replay = ClassicIsing(Torus(8, 8, electron.ClassicElectron, record_history=False), 1.6, 1, 0,
+                          rng=stream_from_state(reader.metadata['rng']))
+    replay.grid.grid = reader[0]
+    replay.runSimulation(20, 'metropolis')
+    assert np.array_equal(replay.grid.grid, reader[-1])
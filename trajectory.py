@@ -0,0 +1,188 @@
+import json
+import os
+import numpy as np
+
+
+def atomic_savez(path, arrays, compressed=False):
+    """
+    Writes arrays (a dict) to the .npz file path. The file is written under a temporary name (path + '.tmp.npz')
+    and then renamed, so an interrupted write never leaves a truncated file at path and concurrent readers never see
+    a partial one.
+    """
+    temporary = path + '.tmp.npz'
+    (np.savez_compressed if compressed else np.savez)(temporary, **arrays)
+    os.replace(temporary, path)
+
+
+class TrajectoryWriter:
+    """
+    Appends frames (e.g. spin arrays) to a preallocated, memory mapped file on disk so long runs don't have to
+    fit in memory. The frames are stored raw in path + '.dat' and described by a JSON header in path + '.json'.
+    The file grows geometrically whenever it fills up.
+
+    Durability: every flush_every frames (and on every grow, flush and close) the frames are flushed to the data file
+    first and then the header with the new frame count replaces the old one atomically. A reader, also one opening
+    the files after a crash, therefore sees every frame up to the last such point, and never a frame that wasn't
+    written or a partial header. At most flush_every - 1 frames are lost.
+
+    Parameters
+        path (str): Path of the trajectory, without extension
+        frame_shape (tuple): Shape of a single frame
+        metadata (dict): JSON serializable run parameters stored in the header
+        dtype (np.dtype): Data type of the frames
+        stride (int): Only every stride-th call of record is stored
+        capacity (int): Number of frames the file initially has room for
+        flush_every (int): Number of appended frames between two header updates
+    """
+
+    def __init__(self, path, frame_shape, metadata=None, dtype=np.int8, stride=1, capacity=1024, flush_every=100):
+
+        self.path = path
+        self.frame_shape = tuple(frame_shape)
+        self.metadata = {} if metadata is None else dict(metadata)
+        self.dtype = np.dtype(dtype)
+        self.stride = stride
+        self.flush_every = flush_every
+
+        self.n_frames = 0
+        self.calls = 0
+        self.capacity = 0
+        self.frames = None
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # start from an empty file, grow allocates the first block
+        open(self.path + '.dat', 'wb').close()
+        self.grow(max(1, capacity))
+
+    ### overloaded methods ###
+
+    def __len__(self):
+        return self.n_frames
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    ### class methods ###
+
+    def grow(self, capacity):
+        """Resizes the data file to hold capacity frames and maps it again."""
+        if self.frames is not None:
+            self.frames.flush()
+            self.frames = None
+
+        frame_bytes = int(np.prod(self.frame_shape)) * self.dtype.itemsize
+        with open(self.path + '.dat', 'r+b') as file:
+            file.truncate(capacity * frame_bytes)
+
+        self.capacity = capacity
+        self.frames = np.memmap(self.path + '.dat', dtype=self.dtype, mode='r+', shape=(capacity,) + self.frame_shape)
+        self.writeHeader()
+
+    def record(self, frame):
+        """
+        Called once per sweep, stores the frame if the sweep falls on the stride.
+        """
+        self.calls += 1
+        if self.calls % self.stride == 0:
+            self.append(frame)
+
+    def append(self, frame):
+        """
+        Stores a frame, regardless of the stride.
+        """
+        if self.n_frames == self.capacity:
+            self.grow(2 * self.capacity)
+
+        self.frames[self.n_frames] = frame
+        self.n_frames += 1
+        if self.n_frames % self.flush_every == 0:
+            self.flush()
+
+    def writeHeader(self):
+        """Replaces the JSON header atomically (written under a temporary name and renamed)."""
+        header = {
+            'dtype': self.dtype.str,
+            'frame_shape': list(self.frame_shape),
+            'n_frames': self.n_frames,
+            'capacity': self.capacity,
+            'stride': self.stride,
+            'metadata': self.metadata,
+        }
+        temporary = self.path + '.json.tmp'
+        with open(temporary, 'w') as file:
+            json.dump(header, file, indent=2)
+        os.replace(temporary, self.path + '.json')
+
+    def flush(self):
+        """Writes the frames and the frame count to disk, so a reader sees everything appended so far."""
+        self.frames.flush()
+        self.writeHeader()
+
+    def close(self):
+        """Flushes and trims the file down to the frames actually written."""
+        if self.frames is None:
+            return
+
+        self.frames.flush()
+        self.frames = None
+
+        frame_bytes = int(np.prod(self.frame_shape)) * self.dtype.itemsize
+        with open(self.path + '.dat', 'r+b') as file:
+            file.truncate(self.n_frames * frame_bytes)
+
+        self.capacity = self.n_frames
+        self.writeHeader()
+
+
+class TrajectoryReader:
+    """
+    Lazily reads a trajectory written by TrajectoryWriter. Frames are only read from disk when they are indexed, so
+    slicing a long run (e.g. in animate_ising or the analysis notebooks) never loads the whole file.
+
+    Parameters
+        path (str): Path of the trajectory, without extension
+    """
+
+    def __init__(self, path):
+
+        self.path = path
+
+        with open(path + '.json') as file:
+            header = json.load(file)
+
+        self.metadata = header['metadata']
+        self.dtype = np.dtype(header['dtype'])
+        self.frame_shape = tuple(header['frame_shape'])
+        self.stride = header['stride']
+        self.n_frames = header['n_frames']
+
+        if self.n_frames:
+            self.frames = np.memmap(path + '.dat', dtype=self.dtype, mode='r', shape=(self.n_frames,) + self.frame_shape)
+        else:
+            self.frames = np.empty((0,) + self.frame_shape, dtype=self.dtype)
+
+    ### overloaded methods ###
+
+    def __len__(self):
+        return self.n_frames
+
+    def __getitem__(self, index):
+        return self.frames[index]
+
+    def __iter__(self):
+        for i in range(self.n_frames):
+            yield self.frames[i]
+
+    ### class methods ###
+
+    def stack(self, start=0, stop=None, step=1):
+        """
+        Reads the frames start:stop:step into memory as one array.
+        """
+        return np.array(self.frames[start:stop:step])